@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import uuid
+import zlib
+import shutil
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+# Logs are compressed in independent chunks so a byte range can be served
+# by inflating only the chunks it touches.
+LOG_CHUNK_SIZE = 64 * 1024
+LOG_FILE = "logs.z"
+LOG_INDEX_FILE = "logs.index.json"
+
+_SAFE_ID = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+class RunArtifactStore:
+    """
+    Gives every test run its own artifact directory:
+    storage/results/<namespace>/<run_id>/{report.xml, logs.z, logs.index.json, cassette.json}
+    """
+    def __init__(self, root: str = "storage/results", max_runs: int = 200):
+        self.root = root
+        self.max_runs = max_runs  # Retention per namespace
+        os.makedirs(self.root, exist_ok=True)
+
+    def _check_id(self, value: str) -> str:
+        if not value or not _SAFE_ID.match(value) or value in (".", ".."):
+            raise ValueError(f"Invalid artifact identifier: {value!r}")
+        return value
+
+    def namespace_dir(self, namespace: str) -> str:
+        return os.path.join(self.root, self._check_id(namespace))
+
+    def run_dir(self, namespace: str, run_id: str) -> str:
+        return os.path.join(self.namespace_dir(namespace), self._check_id(run_id))
+
+    def new_run(self, namespace: str = "shared") -> str:
+        """Allocates a fresh, collision-free run directory and returns its id."""
+        run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.run_dir(namespace, run_id), exist_ok=True)
+        self.prune(namespace)
+        return run_id
+
+    def report_path(self, namespace: str, run_id: str) -> str:
+        return os.path.join(self.run_dir(namespace, run_id), "report.xml")
+
+    def cassette_path(self, namespace: str, run_id: str) -> str:
+        return os.path.join(self.run_dir(namespace, run_id), "cassette.json")
+
+    def write_logs(self, namespace: str, run_id: str, logs: str) -> Dict[str, Any]:
+        """
+        Stores the raw logs compressed on disk and returns a small reference
+        that can be kept in state instead of the logs themselves.
+        """
+        data = logs.encode("utf-8", errors="replace")
+        run_path = self.run_dir(namespace, run_id)
+        chunks = []
+
+        with open(os.path.join(run_path, LOG_FILE), "wb") as f:
+            for start in range(0, len(data), LOG_CHUNK_SIZE):
+                block = zlib.compress(data[start:start + LOG_CHUNK_SIZE])
+                chunks.append([f.tell(), len(block)])
+                f.write(block)
+
+        index = {"size": len(data), "chunk_size": LOG_CHUNK_SIZE, "chunks": chunks}
+        with open(os.path.join(run_path, LOG_INDEX_FILE), "w") as f:
+            json.dump(index, f)
+
+        return {
+            "run_id": run_id,
+            "size": len(data),
+            "compressed_size": sum(length for _, length in chunks)
+        }
+
+    def read_logs(self, namespace: str, run_id: str, offset: int = 0, length: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Returns the byte range [offset, offset + length) of a run's logs.
+        Only the compressed chunks overlapping the range are inflated.
+        """
+        run_path = self.run_dir(namespace, run_id)
+        index_path = os.path.join(run_path, LOG_INDEX_FILE)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No logs stored for run {run_id}")
+
+        with open(index_path, "r") as f:
+            index = json.load(f)
+
+        total = index["size"]
+        chunk_size = index["chunk_size"]
+        offset = max(0, min(offset, total))
+        end = total if length is None else min(total, offset + max(0, length))
+
+        parts = []
+        if end > offset:
+            first, last = offset // chunk_size, (end - 1) // chunk_size
+            with open(os.path.join(run_path, LOG_FILE), "rb") as f:
+                for i in range(first, last + 1):
+                    pos, size = index["chunks"][i]
+                    f.seek(pos)
+                    parts.append(zlib.decompress(f.read(size)))
+        window = b"".join(parts)
+        skip = offset - (offset // chunk_size) * chunk_size if parts else 0
+        data = window[skip:skip + (end - offset)]
+
+        return {
+            "run_id": run_id,
+            "offset": offset,
+            "length": len(data),
+            "total": total,
+            "data": data.decode("utf-8", errors="replace")
+        }
+
+    def prune(self, namespace: str):
+        """Deletes the oldest run directories beyond the retention limit."""
+        ns_dir = self.namespace_dir(namespace)
+        if not os.path.isdir(ns_dir):
+            return
+        runs = sorted(d for d in os.listdir(ns_dir) if os.path.isdir(os.path.join(ns_dir, d)))
+        for old in runs[:max(0, len(runs) - self.max_runs)]:
+            shutil.rmtree(os.path.join(ns_dir, old), ignore_errors=True)
@@ -0,0 +1,221 @@
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# Upper bounds on how much backend source a diagnosis prompt may carry
+MAX_SLICE_CHARS = 6000
+MAX_CONTEXT_CHARS = 12000
+
+_OPEN = "([{"
+_CLOSE = ")]}"
+_JS_FUNCTION_DEF = r'(?:function\s+{name}\s*\(|(?:const|let|var)\s+{name}\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>))'
+_JS_REQUIRE = r'(?:const|let|var)\s+(?:{name}|\{{[^}}]*\b{name}\b[^}}]*\}})\s*=\s*require\(\s*[\'"](\.[^\'"]+)[\'"]\s*\)'
+_PY_DEF = r'^([ \t]*)(?:async\s+)?def\s+{name}\s*\('
+_JS_KEYWORDS = {"if", "for", "while", "switch", "catch", "function", "return", "typeof", "require",
+                "async", "await", "new", "res", "req", "next", "console", "JSON", "Object", "Array",
+                "Promise", "Number", "String", "parseInt", "parseFloat"}
+
+def line_of(content: str, index: int) -> int:
+    return content.count("\n", 0, index) + 1
+
+def match_brackets(content: str, open_index: int) -> int:
+    """
+    Index of the bracket closing the one at open_index, skipping JS strings,
+    template literals and comments. Returns len(content) - 1 if unbalanced.
+    """
+    depth = 0
+    i = open_index
+    n = len(content)
+    while i < n:
+        ch = content[i]
+        if ch in "'\"`":
+            quote = ch
+            i += 1
+            while i < n and content[i] != quote:
+                i += 2 if content[i] == "\\" else 1
+        elif content.startswith("//", i):
+            i = content.find("\n", i)
+            if i == -1:
+                break
+        elif content.startswith("/*", i):
+            i = content.find("*/", i)
+            if i == -1:
+                break
+            i += 1
+        elif ch in _OPEN:
+            depth += 1
+        elif ch in _CLOSE:
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return n - 1
+
+def js_call_span(content: str, call_start: int) -> Tuple[int, int]:
+    """Line span of a call like app.get('/x', ...) starting at call_start."""
+    open_index = content.find("(", call_start)
+    if open_index == -1:
+        return line_of(content, call_start), line_of(content, call_start)
+    return line_of(content, call_start), line_of(content, match_brackets(content, open_index))
+
+def python_block_span(content: str, start_index: int) -> Tuple[int, int]:
+    """Line span of a (decorated) def starting at start_index, found by indentation."""
+    lines = content.splitlines()
+    start = line_of(content, start_index)
+    def_line = start
+    while def_line <= len(lines) and not re.match(r'\s*(async\s+)?def\s', lines[def_line - 1]):
+        def_line += 1
+    if def_line > len(lines):
+        return start, start
+    indent = len(lines[def_line - 1]) - len(lines[def_line - 1].lstrip())
+    end = def_line
+    for number in range(def_line + 1, len(lines) + 1):
+        line = lines[number - 1]
+        if line.strip() and len(line) - len(line.lstrip()) <= indent:
+            break
+        if line.strip():
+            end = number
+    return start, end
+
+def route_middleware(content: str, call_start: int) -> List[str]:
+    """Names passed between the path and the handler: router.post('/x', auth, validate, handler)."""
+    open_index = content.find("(", call_start)
+    if open_index == -1:
+        return []
+    close_index = match_brackets(content, open_index)
+    args, depth, current = [], 0, ""
+    for ch in content[open_index + 1:close_index]:
+        if ch in _OPEN:
+            depth += 1
+        elif ch in _CLOSE:
+            depth -= 1
+        if ch == "," and depth == 0:
+            args.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    args.append(current.strip())
+    return [arg for arg in args[1:] if re.fullmatch(r'[A-Za-z_$][\w$.]*', arg)]
+
+def read_lines(path: str, start: int, end: int) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.readlines()
+    return "".join(lines[start - 1:end])
+
+def _definition_slice(content: str, name: str, is_python: bool) -> Optional[str]:
+    if is_python:
+        match = re.search(_PY_DEF.format(name=re.escape(name)), content, re.MULTILINE)
+        if not match:
+            return None
+        start, end = python_block_span(content, match.start())
+        return "\n".join(content.splitlines()[start - 1:end])
+
+    match = re.search(_JS_FUNCTION_DEF.format(name=re.escape(name)), content)
+    if not match:
+        return None
+    body_open = content.find("{", match.end() - 1)
+    line_end = content.find("\n", match.end())
+    if body_open == -1 or (line_end != -1 and body_open > line_end and "=>" in content[match.start():line_end]
+                           and not content[match.end():line_end].rstrip().endswith("{")):
+        # Expression-bodied arrow function on one line
+        return content[match.start():line_end if line_end != -1 else len(content)]
+    return content[match.start():match_brackets(content, body_open) + 1]
+
+def _referenced_identifiers(code: str) -> List[str]:
+    names = re.findall(r'(?<![.\w$])([A-Za-z_$][\w$]*)\s*\(', code)
+    return [n for n in dict.fromkeys(names) if n not in _JS_KEYWORDS]
+
+def endpoint_slice(endpoint: Dict[str, Any], max_chars: int = MAX_SLICE_CHARS) -> str:
+    """
+    The handler recorded by the scanner plus the middleware and helpers it
+    references (same file, or a relative require()), capped at max_chars.
+    """
+    path = endpoint.get("source_file")
+    if not path or not os.path.exists(path) or not endpoint.get("start_line"):
+        return ""
+
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        content = f.read()
+    is_python = path.endswith(".py")
+
+    handler = read_lines(path, endpoint["start_line"], endpoint["end_line"])
+    parts = [f"// {path} (lines {endpoint['start_line']}-{endpoint['end_line']}): {endpoint.get('method')} {endpoint.get('path')}\n{handler}"]
+
+    # App/router-wide middleware registered in the same file
+    if not is_python:
+        for use in re.finditer(r'\b(?:app|router)\.use\s*\(', content):
+            start, end = js_call_span(content, use.start())
+            parts.append(f"// middleware (line {start})\n" + "\n".join(content.splitlines()[start - 1:end]))
+
+    seen = set()
+    for name in list(endpoint.get("middleware", [])) + _referenced_identifiers(handler):
+        name = name.split(".")[0]
+        if name in seen:
+            continue
+        seen.add(name)
+        definition = _definition_slice(content, name, is_python)
+        if definition is None and not is_python:
+            # Follow a relative require() to the helper's own module
+            required = re.search(_JS_REQUIRE.format(name=re.escape(name)), content)
+            if required:
+                target = os.path.normpath(os.path.join(os.path.dirname(path), required.group(1)))
+                for candidate in (target, target + ".js", os.path.join(target, "index.js")):
+                    if os.path.isfile(candidate):
+                        with open(candidate, "r", encoding="utf-8", errors="ignore") as f:
+                            module = f.read()
+                        definition = _definition_slice(module, name, False) or module[:max_chars // 4]
+                        break
+        if definition:
+            parts.append(f"// helper: {name}\n{definition}")
+
+    return "\n\n".join(parts)[:max_chars]
+
+def _segments(path: str) -> List[str]:
+    return [s for s in path.split("?")[0].strip("/").split("/") if s]
+
+def _is_param(segment: str) -> bool:
+    return segment.startswith(":") or segment == "{}" or (segment.startswith("{") and segment.endswith("}"))
+
+def match_endpoint(pattern: str, endpoints: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Maps a request pattern seen in a test ('POST /products/{}') to the scanned
+    endpoint serving it. Routes mounted under a prefix (router files) match on
+    the path suffix; exact matches win over suffix matches.
+    """
+    method, _, url = pattern.partition(" ")
+    wanted = _segments(url)
+    best, best_score = None, 0
+    for ep in endpoints:
+        if ep.get("method", "").upper() != method.upper():
+            continue
+        route = _segments(ep.get("path", ""))
+        if len(route) > len(wanted):
+            continue
+        tail = wanted[len(wanted) - len(route):] if route else []
+        if not all(r == w or _is_param(r) or _is_param(w) for r, w in zip(route, tail)):
+            continue
+        literal = sum(1 for r in route if not _is_param(r))
+        score = 1 + literal + (100 if len(route) == len(wanted) else 0)
+        if score > best_score:
+            best, best_score = ep, score
+    return best
+
+def diagnosis_context(endpoints: List[Dict[str, Any]], request_patterns: List[str],
+                      max_chars: int = MAX_CONTEXT_CHARS) -> Dict[str, Any]:
+    """Handler slices for the endpoints hit by the failing tests, bounded in total size."""
+    matched, parts, total = [], [], 0
+    for pattern in request_patterns:
+        endpoint = match_endpoint(pattern, endpoints)
+        if endpoint is None or endpoint in matched:
+            continue
+        matched.append(endpoint)
+        code = endpoint_slice(endpoint, min(MAX_SLICE_CHARS, max_chars - total))
+        if code:
+            parts.append(code)
+            total += len(code)
+        if total >= max_chars:
+            break
+    return {
+        "source": "\n\n".join(parts),
+        "endpoints": [f"{ep['method']} {ep['path']}" for ep in matched]
+    }
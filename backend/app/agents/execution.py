@@ -0,0 +1,157 @@
+import os
+import atexit
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+DISCONNECT_POLL = 0.25  # Seconds between client-disconnect checks while a job waits or runs
+
+class PoolBusy(Exception):
+    """The pool's queue is full; the caller should retry later (HTTP 503)."""
+
+class JobCancelled(Exception):
+    """The client went away before the job finished; its result was dropped (HTTP 499)."""
+
+class WorkPool:
+    """
+    A bounded executor with queue metrics. At most `max_workers` jobs run and at
+    most `max_queue` more wait; anything beyond that is rejected with PoolBusy
+    instead of piling up behind a slow clone or scan.
+
+    kind="thread" is for blocking I/O (clones, zips, file copies); kind="process"
+    is for CPU-bound work and runs picklable callables in spawned worker
+    processes (spawn, because the server process is multi-threaded). Workers
+    start on first use.
+    """
+    def __init__(self, name: str, kind: str = "thread", max_workers: int = 4, max_queue: int = 16):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind '{kind}'")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.lock = threading.Lock()
+        self.executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.peak_queued = 0
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "abandoned": 0, "rejected": 0}
+
+    def _executor(self) -> Executor:
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"{self.name}-pool")
+            atexit.register(self.close)
+        return self.executor
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self.lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.counters["rejected"] += 1
+                raise PoolBusy(f"{self.name} pool is busy ({self.in_flight} jobs in flight), try again shortly")
+            self.in_flight += 1
+            self.counters["submitted"] += 1
+            self.peak_queued = max(self.peak_queued, self.in_flight - self.max_workers)
+            executor = self._executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            with self.lock:
+                self.in_flight -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future):
+        with self.lock:
+            self.in_flight -= 1
+            if future.cancelled():
+                self.counters["cancelled"] += 1
+            elif future.exception() is not None:
+                self.counters["failed"] += 1
+            else:
+                self.counters["completed"] += 1
+
+    async def run(self, fn: Callable, *args, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                  on_cancel: Optional[Callable[[], None]] = None, **kwargs) -> Any:
+        """
+        Runs fn(*args, **kwargs) in the pool without blocking the event loop.
+        If `is_disconnected` (e.g. Request.is_disconnected) turns true first, a
+        queued job is cancelled outright; a running one cannot be interrupted,
+        so `on_cancel` is called (set an Event the job checks) and its result is
+        dropped. Either way JobCancelled is raised.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        waiter = asyncio.wrap_future(future)
+        if is_disconnected is None:
+            return await waiter
+        while True:
+            done, _ = await asyncio.wait({waiter}, timeout=DISCONNECT_POLL)
+            if done:
+                return waiter.result()
+            if await is_disconnected():
+                if not future.cancel():
+                    with self.lock:
+                        self.counters["abandoned"] += 1
+                    if on_cancel is not None:
+                        on_cancel()
+                waiter.add_done_callback(lambda f: f.cancelled() or f.exception())  # Don't log dropped errors
+                raise JobCancelled(f"Client disconnected, {self.name} job cancelled")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": min(self.in_flight, self.max_workers),
+                "queued": max(0, self.in_flight - self.max_workers),
+                "peak_queued": self.peak_queued,
+                **self.counters,
+            }
+
+    def close(self, wait: bool = True):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+class ExecutionLayer:
+    """
+    Keeps blocking work off the event loop: `cpu` (a process pool) for project
+    scans, `io` (a thread pool) for clones, zips and file copies. Sizes come
+    from SCAN_WORKERS / SCAN_QUEUE and IO_WORKERS / IO_QUEUE.
+    """
+    def __init__(self, cpu_workers: Optional[int] = None, cpu_queue: Optional[int] = None,
+                 io_workers: Optional[int] = None, io_queue: Optional[int] = None):
+        self.cpu = WorkPool("scan", "process",
+                            cpu_workers or int(os.getenv("SCAN_WORKERS", min(4, os.cpu_count() or 1))),
+                            cpu_queue if cpu_queue is not None else int(os.getenv("SCAN_QUEUE", 16)))
+        self.io = WorkPool("io", "thread",
+                           io_workers or int(os.getenv("IO_WORKERS", 8)),
+                           io_queue if io_queue is not None else int(os.getenv("IO_QUEUE", 32)))
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {"cpu": self.cpu.metrics(), "io": self.io.metrics()}
+
+    def close(self):
+        self.cpu.close()
+        self.io.close()
+
+if __name__ == "__main__":
+    # Smoke test: python -m app.agents.execution
+    import time
+
+    async def main():
+        layer = ExecutionLayer(cpu_workers=2, cpu_queue=2, io_workers=2, io_queue=1)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(layer.cpu.run(sum, range(10 ** 6)) for _ in range(4)),
+                                       *(layer.io.run(time.sleep, 0.2) for _ in range(3)))
+        print(f"{len(results)} jobs in {time.perf_counter() - started:.2f}s")
+        print(layer.metrics())
+        layer.close()
+
+    asyncio.run(main())
@@ -1,13 +1,163 @@
 import subprocess
 import os
 import re
+import json
+import tempfile
+import hashlib
+import time
+import threading
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from .artifacts import RunArtifactStore
+from .suite_source import function_hashes, impacted_tests, top_level_name
+
+RERUN_MODES = ("full", "failed", "impacted")
+
+# Copied next to every suite as conftest.py (pooled `api_client` fixture)
+CONFTEST_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suite_conftest.py")
+CONFTEST_MARKER = "# Generated by Agentic AI Tester executor"
+
+# Only the tail of the logs is returned inline; the full text stays on disk.
+LOG_PREVIEW_BYTES = 64 * 1024
 
 class TestExecutor:
-    def __init__(self):
+    def __init__(self, pool_size: int = 20, connect_timeout: float = 5.0, read_timeout: float = 10.0,
+                 test_timeout: float = 15.0, global_timeout: float = 60.0, record_http: bool = True):
         self.results_dir = "storage/results"
         os.makedirs(self.results_dir, exist_ok=True)
+        self.artifacts = RunArtifactStore(self.results_dir)
+
+        # HTTP connection pool settings handed to the suite's conftest.py
+        self.pool_size = int(os.getenv("API_TEST_POOL_SIZE", pool_size))
+        self.connect_timeout = float(os.getenv("API_TEST_CONNECT_TIMEOUT", connect_timeout))
+        self.read_timeout = float(os.getenv("API_TEST_READ_TIMEOUT", read_timeout))
+
+        # Per-test limit (enforced inside pytest) and budget for the whole run
+        self.test_timeout = float(os.getenv("API_TEST_TIMEOUT", test_timeout))
+        self.global_timeout = float(os.getenv("API_TEST_GLOBAL_TIMEOUT", global_timeout))
+
+        # Record every run's HTTP traffic so later reruns can replay it offline
+        self.record_http = os.getenv("API_TEST_RECORD_HTTP", "1" if record_http else "0") != "0"
+
+    def _ensure_conftest(self, test_file_path: str):
+        """
+        Installs the shared conftest.py next to the suite. A user-written
+        conftest.py (one without our marker) is left untouched.
+
+        Runs of the same suite start concurrently, so an up-to-date copy is
+        left alone and a stale one is swapped in atomically: pytest never
+        imports a half-written conftest.
+        """
+        target = os.path.join(os.path.dirname(os.path.abspath(test_file_path)), "conftest.py")
+        with open(CONFTEST_TEMPLATE, "r") as f:
+            template = f.read()
+        if os.path.exists(target):
+            with open(target, "r") as f:
+                current = f.read()
+            if not current.startswith(CONFTEST_MARKER):
+                print(f"Keeping user-provided conftest at {target}")
+                return
+            if current == template:
+                return
+
+        fd, tmp_path = tempfile.mkstemp(prefix=".conftest-", suffix=".tmp", dir=os.path.dirname(target))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(template)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _suite_env(self, progress_file: str, test_timeout: float, record_to: Optional[str] = None,
+                   replay_from: Optional[str] = None, base_url: Optional[str] = None) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "API_TEST_POOL_SIZE": str(self.pool_size),
+            "API_TEST_CONNECT_TIMEOUT": str(self.connect_timeout),
+            "API_TEST_READ_TIMEOUT": str(self.read_timeout),
+            "API_TEST_TIMEOUT": str(test_timeout),
+            "API_TEST_PROGRESS_FILE": progress_file,
+        })
+        for name, value in (("API_TEST_RECORD_TO", record_to), ("API_TEST_REPLAY_FROM", replay_from),
+                            ("API_TEST_BASE_URL", base_url)):
+            if value:
+                env[name] = value
+            else:
+                env.pop(name, None)
+        return env
+
+    def _cassette_stats(self, progress_file: str) -> Dict[str, int]:
+        """Replay hits/misses reported by the conftest at the end of the session."""
+        stats = {"hits": 0, "misses": 0, "entries": 0}
+        if os.path.exists(progress_file):
+            with open(progress_file, "r") as f:
+                for line in f:
+                    if '"cassette"' not in line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    stats.update({k: entry.get(k, 0) for k in stats})
+        return stats
+
+    def _replay_source(self, baseline: Optional[Dict[str, Any]]) -> Optional[str]:
+        path = ((baseline or {}).get("cassette") or {}).get("path")
+        return path if path and os.path.exists(path) else None
+
+    def _harvest_progress(self, progress_file: str, budget: float) -> Tuple[Dict[str, str], Dict[str, float], List[Dict[str, Any]]]:
+        """
+        Rebuilds results from the conftest's progress journal after the run was
+        killed: completed tests keep their outcome, the rest are marked "timeout".
+        """
+        collected = []
+        cases = {}
+        durations = {}
+        failures = []
+        if os.path.exists(progress_file):
+            with open(progress_file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Partially written last line
+                    if entry.get("event") == "collected":
+                        collected = entry["nodeids"]
+                    elif entry.get("event") == "result":
+                        key = entry["nodeid"].split("::", 1)[-1]
+                        cases[key] = entry["outcome"]
+                        durations[key] = entry.get("duration") or 0.0
+                        if entry["outcome"] in ("failed", "error"):
+                            failures.append({
+                                "nodeid": key.split("::")[-1],
+                                "case": key,
+                                "file": entry["nodeid"].split("::", 1)[0],
+                                "line": None,
+                                "message": entry.get("message"),
+                                "longrepr": entry.get("longrepr")
+                            })
+
+        for nodeid in collected:
+            key = nodeid.split("::", 1)[-1]
+            if key not in cases:
+                cases[key] = "timeout"
+                failures.append({
+                    "nodeid": key.split("::")[-1],
+                    "case": key,
+                    "file": nodeid.split("::", 1)[0],
+                    "line": None,
+                    "message": f"Timed out: the run exceeded its global budget of {budget}s before this test finished",
+                    "longrepr": None
+                })
+        return cases, durations, failures
+
+    def _summarize_cases(self, cases: Dict[str, str]) -> Dict[str, int]:
+        summary = {outcome: sum(1 for v in cases.values() if v == outcome) for outcome in ("passed", "failed", "error", "timeout")}
+        summary["total"] = summary["passed"] + summary["failed"] + summary["error"] + summary["timeout"]
+        return summary
 
     def _parse_pytest_output(self, output: str) -> Dict[str, int]:
         summary = {"passed": 0, "failed": 0, "error": 0, "total": 0}
@@ -31,41 +181,57 @@ class TestExecutor:
         summary["total"] = summary["passed"] + summary["failed"] + summary["error"]
         return summary
 
-    def _parse_xml_report(self, xml_path: str) -> List[Dict[str, Any]]:
+    def _case_key(self, testcase: ET.Element) -> str:
+        """Node id relative to the test file: 'test_x' or 'TestClass::test_x'."""
+        name = testcase.get("name")
+        cls = (testcase.get("classname") or "").split(".")[-1]
+        return f"{cls}::{name}" if cls.startswith("Test") else name
+
+    def _parse_xml_report(self, xml_path: str) -> Tuple[Dict[str, str], Dict[str, float], List[Dict[str, Any]]]:
+        """Returns (outcome per test case, duration per test case, failure details)."""
+        cases = {}
+        durations = {}
         failures = []
         if not os.path.exists(xml_path):
-            return failures
+            return cases, durations, failures
             
         try:
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
-            
-            for testcase in root.findall(".//testcase"):
-                failure = testcase.find("failure")
-                if failure is not None:
-                    # Extract failure details
-                    failures.append({
-                        "nodeid": testcase.get("name"),
-                        "file": testcase.get("file"),
-                        "line": testcase.get("line"),
-                        "message": failure.get("message"),
-                        "longrepr": failure.text # Full traceback
-                    })
-                
-                error = testcase.find("error")
-                if error is not None:
-                     failures.append({
-                        "nodeid": testcase.get("name"),
-                        "file": testcase.get("file"),
-                        "line": testcase.get("line"),
-                        "message": error.get("message"),
-                        "longrepr": error.text
-                    })
+            # Stream the report so large suites never build the full tree in memory
+            for _, testcase in ET.iterparse(xml_path, events=("end",)):
+                if testcase.tag != "testcase":
+                    continue
+
+                key = self._case_key(testcase)
+                cases[key] = "skipped" if testcase.find("skipped") is not None else "passed"
+                durations[key] = float(testcase.get("time") or 0.0)
+
+                for tag in ("failure", "error"):
+                    problem = testcase.find(tag)
+                    if problem is not None:
+                        cases[key] = "failed" if tag == "failure" else "error"
+                        # Extract failure details
+                        failures.append({
+                            "nodeid": testcase.get("name"),
+                            "case": key,
+                            "file": testcase.get("file"),
+                            "line": testcase.get("line"),
+                            "message": problem.get("message"),
+                            "longrepr": problem.text # Full traceback
+                        })
+
+                testcase.clear()
                     
         except Exception as e:
             print(f"Error parsing XML report: {e}")
             
-        return failures
+        return cases, durations, failures
+
+    def _log_preview(self, logs: str) -> str:
+        encoded = logs.encode("utf-8", errors="replace")
+        if len(encoded) <= LOG_PREVIEW_BYTES:
+            return logs
+        tail = encoded[-LOG_PREVIEW_BYTES:].decode("utf-8", errors="ignore")
+        return f"... [{len(encoded) - LOG_PREVIEW_BYTES} bytes truncated, fetch full logs by run_id] ...\n{tail}"
 
     def _calculate_reward(self, summary: Dict[str, int], logs: str) -> float:
         reward = 0.0
@@ -75,10 +241,96 @@ class TestExecutor:
         if "500 Internal Server Error" in logs:
             reward += 10.0
         reward -= (summary["failed"] * 5.0)
+        reward -= (summary.get("timeout", 0) * 5.0)
         return reward
 
-    def run_test_suite(self, test_file_path: str) -> Dict[str, Any]:
-        print(f"Executing tests in: {test_file_path}")
+    def _top_level(self, case_key: str) -> str:
+        return top_level_name(case_key)
+
+    def _select_rerun(self, test_file_path: str, mode: str, baseline: Optional[Dict[str, Any]], hashes: Dict[str, str]) -> Optional[List[str]]:
+        """
+        Picks the tests to replay for a partial rerun, or None if a full run is needed
+        (no usable baseline for this file, or one whose cases can't be trusted).
+        """
+        if not baseline or baseline.get("test_file") != test_file_path:
+            return None
+        if not baseline.get("cases") or "function_hashes" not in baseline:
+            return None
+        if self._collection_failed(baseline):
+            return None
+
+        if mode == "failed":
+            failed = [k for k, outcome in baseline["cases"].items() if outcome in ("failed", "error", "timeout")]
+            selected = [k for k in failed if self._top_level(k) in hashes]
+            # Failures that no longer map to any function can't be replayed one by one
+            return None if failed and not selected else selected
+
+        with open(test_file_path, "r") as f:
+            return impacted_tests(baseline["function_hashes"], f.read())
+
+    def _collection_failed(self, baseline: Dict[str, Any]) -> bool:
+        """
+        True if the baseline errored before its tests ran: no test counted, or an
+        error entry that names no test function (e.g. the module itself).
+        """
+        summary = baseline.get("summary") or {}
+        if summary.get("error") and not summary.get("total"):
+            return True
+        hashes = baseline.get("function_hashes") or {}
+        return any(outcome == "error" and self._top_level(k) not in hashes for k, outcome in baseline["cases"].items())
+
+    def _merge_with_baseline(self, baseline: Dict[str, Any], rerun: Dict[str, Any], selected: List[str], hashes: Dict[str, str]) -> Dict[str, Any]:
+        """Reports a partial rerun against the previous full baseline."""
+        # Whole functions/classes rerun replace all their baseline cases;
+        # single parametrized cases only replace themselves.
+        whole = {k for k in selected if k == self._top_level(k)}
+
+        def carried(key):
+            top = self._top_level(key)
+            return top in hashes and top not in whole and key not in rerun["cases"]
+
+        cases = {k: v for k, v in baseline["cases"].items() if carried(k)}
+        cases.update(rerun["cases"])
+        failures = [f for f in baseline.get("failures", []) if carried(f.get("case") or f.get("nodeid", ""))]
+        failures += rerun["failures"]
+
+        summary = self._summarize_cases(cases)
+        # A collection error in the rerun itself still invalidates the result
+        if rerun["summary"].get("error") and not rerun["cases"]:
+            summary["error"] = max(summary["error"], 1)
+
+        merged = dict(rerun)
+        merged.update({
+            "status": "success" if summary["total"] == summary["passed"] else "failure",
+            "summary": summary,
+            "reward": self._calculate_reward(summary, rerun.get("logs", "")),
+            "cases": cases,
+            "failures": failures,
+            "rerun_summary": rerun["summary"],
+            "baseline_run_id": baseline.get("baseline_run_id") or baseline.get("run_id"),
+        })
+        return merged
+
+    def run_test_suite(self, test_file_path: str, namespace: str = "shared", mode: str = "full", baseline: Optional[Dict[str, Any]] = None,
+                       test_timeout: Optional[float] = None, global_timeout: Optional[float] = None,
+                       replay: bool = False, base_url: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Runs a suite in its own artifact directory (storage/results/<namespace>/<run_id>)
+        so concurrent runs never share a report file.
+
+        mode="failed" replays only the tests that failed in `baseline`; mode="impacted"
+        replays only tests whose code (or helpers) changed since `baseline`. Partial
+        runs are merged into the baseline so the summary still covers the whole suite.
+
+        test_timeout / global_timeout override the executor defaults for this run.
+
+        replay=True answers requests from the HTTP cassette recorded by `baseline`
+        (only unrecorded requests reach the live target), e.g. to verify heals.
+
+        base_url redirects every request of the suite to another target (e.g. a
+        local mock server) without editing the generated file.
+        """
+        print(f"Executing tests in: {test_file_path} (mode={mode})")
         
         if not os.path.exists(test_file_path):
             return {
@@ -89,42 +341,196 @@ class TestExecutor:
                 "failures": []
             }
 
+        with open(test_file_path, "r") as f:
+            source = f.read()
+        file_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        try:
+            hashes = function_hashes(source)
+        except SyntaxError:
+            hashes = {}
+
+        selected = None
+        if mode != "full" and hashes:
+            selected = self._select_rerun(test_file_path, mode, baseline, hashes)
+        if selected is None:
+            mode = "full"
+        elif not selected:
+            print("Nothing to rerun, reusing baseline results.")
+            return dict(baseline, mode=mode, selected=[], function_hashes=hashes, file_hash=file_hash, durations={},
+                        baseline_run_id=baseline.get("baseline_run_id") or baseline.get("run_id"),
+                        logs="No tests selected for rerun.")
+
+        targets = [test_file_path] if selected is None else [f"{test_file_path}::{k}" for k in selected]
+        result = self._run_pytest(
+            test_file_path, targets, namespace,
+            test_timeout if test_timeout is not None else self.test_timeout,
+            global_timeout if global_timeout is not None else self.global_timeout,
+            replay_from=self._replay_source(baseline) if replay else None,
+            base_url=base_url
+        )
+        result["mode"] = mode
+        result["function_hashes"] = hashes
+        result["file_hash"] = file_hash
+
+        if selected is not None and result["status"] != "error":
+            result["selected"] = selected
+            result = self._merge_with_baseline(baseline, result, selected, hashes)
+
+        return result
+
+    def run_nodes(self, test_file_path: str, node_keys: List[str], namespace: str = "shared",
+                  global_timeout: Optional[float] = None, cancel_event: Optional[threading.Event] = None,
+                  replay_from: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Runs only the given node ids ('test_x', 'TestApi::test_y') of a file, without
+        baseline merging. Setting cancel_event kills the run early (status "cancelled");
+        replay_from is a cassette path to answer requests from.
+        """
+        targets = [f"{test_file_path}::{key}" for key in node_keys]
+        return self._run_pytest(
+            test_file_path, targets, namespace, self.test_timeout,
+            global_timeout if global_timeout is not None else self.global_timeout,
+            cancel_event, replay_from
+        )
+
+    def run_across_targets(self, test_file_path: str, base_urls: List[str], namespace: str = "shared",
+                           test_timeout: Optional[float] = None, global_timeout: Optional[float] = None,
+                           labels: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Runs the same suite against several environments (dev, staging, canary...)
+        concurrently. Each environment is its own pytest process, so each gets its
+        own connection pool, artifact dir and cassette. Returns the per-environment
+        results plus a case-by-case comparison highlighting diverging outcomes.
+        Results are keyed by label (the URLs by default), so labels must be unique.
+        """
+        labels = labels or list(base_urls)
+        if len(labels) != len(base_urls) or len(set(labels)) != len(labels):
+            raise ValueError("Every target needs its own label; labels and base_urls must be unique")
+        with ThreadPoolExecutor(max_workers=max(1, len(base_urls))) as pool:
+            futures = {
+                label: pool.submit(self.run_test_suite, test_file_path, namespace,
+                                   test_timeout=test_timeout, global_timeout=global_timeout, base_url=url)
+                for label, url in zip(labels, base_urls)
+            }
+        environments = {}
+        for label, future in futures.items():
+            try:
+                environments[label] = future.result()
+            except Exception as e:
+                environments[label] = {"status": "error", "message": str(e), "cases": {}, "failures": []}
+
+        comparison = self._compare_environments(environments)
+        statuses = {r.get("status") for r in environments.values()}
+        return {
+            "status": statuses.pop() if len(statuses) == 1 else "mixed",
+            "environments": environments,
+            "comparison": comparison
+        }
+
+    def _compare_environments(self, environments: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        cases = {}
+        for label, result in environments.items():
+            for key, outcome in (result.get("cases") or {}).items():
+                cases.setdefault(key, {})[label] = outcome
+        for outcomes in cases.values():
+            for label in environments:
+                outcomes.setdefault(label, "missing")
+
+        differences = sorted(key for key, outcomes in cases.items() if len(set(outcomes.values())) > 1)
+        return {
+            "summary": {label: r.get("summary", {}) for label, r in environments.items()},
+            "cases": cases,
+            "differences": differences,
+            "consistent": not differences
+        }
+
+    def _run_pytest(self, test_file_path: str, targets: List[str], namespace: str,
+                    test_timeout: float, global_timeout: float,
+                    cancel_event: Optional[threading.Event] = None,
+                    replay_from: Optional[str] = None, base_url: Optional[str] = None) -> Dict[str, Any]:
+        run_id = self.artifacts.new_run(namespace)
+
         try:
             # Define XML report path
-            report_path = os.path.join(self.results_dir, "report.xml")
+            report_path = self.artifacts.report_path(namespace, run_id)
+            progress_path = os.path.join(self.artifacts.run_dir(namespace, run_id), "progress.jsonl")
+            cassette_path = self.artifacts.cassette_path(namespace, run_id) if self.record_http else None
+            self._ensure_conftest(test_file_path)
             
-            print(f"Running pytest command on {test_file_path}...")
+            print(f"Running pytest command on {len(targets)} target(s)...")
             # Run pytest with XML reporting
-            result = subprocess.run(
-                ["pytest", test_file_path, "-v", "-rP", f"--junitxml={report_path}"],
-                capture_output=True,
+            process = subprocess.Popen(
+                ["pytest", *targets, "-v", "-rP", f"--junitxml={report_path}"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
                 text=True,
-                timeout=60
+                env=self._suite_env(progress_path, test_timeout, cassette_path, replay_from, base_url)
             )
-            print(f"Pytest finished with return code: {result.returncode}")
+            timed_out = False
+            deadline = time.monotonic() + global_timeout
+            while True:
+                # Poll in short slices so a cancellation request is noticed quickly
+                try:
+                    stdout, stderr = process.communicate(timeout=min(0.5, max(0.0, deadline - time.monotonic())))
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel_event is not None and cancel_event.is_set():
+                        process.kill()
+                        process.communicate()
+                        return {"status": "cancelled", "run_id": run_id, "reward": 0.0, "logs": "Run cancelled.", "failures": []}
+                    if time.monotonic() >= deadline:
+                        # Keep whatever finished; only the stragglers are lost
+                        timed_out = True
+                        process.kill()
+                        stdout, stderr = process.communicate()
+                        break
+            print(f"Pytest finished with return code: {process.returncode} (timed_out={timed_out})")
             
-            logs = result.stdout + result.stderr
+            logs = stdout + stderr
             print(f"Parsing pytest output (len={len(logs)} chars)...")
             
-            summary = self._parse_pytest_output(logs)
+            if timed_out:
+                logs += f"\n[executor] Global timeout of {global_timeout}s exceeded; partial results harvested.\n"
+                cases, durations, failures = self._harvest_progress(progress_path, global_timeout)
+                summary = self._summarize_cases(cases)
+            else:
+                summary = self._parse_pytest_output(logs)
+                cases, durations, failures = self._parse_xml_report(report_path)
             print(f"Test Summary: {summary}")
             
             reward = self._calculate_reward(summary, logs)
-            failures = self._parse_xml_report(report_path)
             
             # If we have 0 total but logs exist, it's likely a collection error we missed
             if summary["total"] == 0 and len(logs) > 0:
                 summary["error"] = 1
                 reward = -5.0
 
+            logs_ref = self.artifacts.write_logs(namespace, run_id, logs)
+
+            if timed_out:
+                status = "timeout"
+            else:
+                status = "success" if process.returncode == 0 else "failure"
+
             return {
-                "status": "success" if result.returncode == 0 else "failure",
+                "status": status,
+                "run_id": run_id,
                 "summary": summary,
                 "reward": reward,
-                "logs": logs, # SEND RAW LOGS TO FRONTEND
+                "logs": self._log_preview(logs), # Bounded tail for the frontend
+                "logs_ref": logs_ref,
                 "test_file": test_file_path,
-                "failures": failures
+                "cases": cases,
+                "durations": durations, # Only the cases executed in this run
+                "failures": failures,
+                "timed_out": timed_out,
+                "base_url": base_url,
+                "cassette": {
+                    "path": cassette_path if cassette_path and os.path.exists(cassette_path) else None,
+                    "replayed_from": replay_from,
+                    **self._cassette_stats(progress_path)
+                }
             }
 
         except Exception as e:
-            return {"status": "error", "message": str(e), "reward": 0.0, "logs": str(e), "failures": []}
\ No newline at end of file
+            return {"status": "error", "run_id": run_id, "message": str(e), "reward": 0.0, "logs": str(e), "failures": []}
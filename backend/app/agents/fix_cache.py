@@ -0,0 +1,219 @@
+import os
+import re
+import ast
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+HTTP_VERBS = {"get", "post", "put", "patch", "delete", "head", "options", "request"}
+
+_EXCEPTION = re.compile(r'\b([A-Za-z_][\w.]*(?:Error|Exception|Timeout))\b')
+_HTTP_STATUS = re.compile(r'\b([1-5]\d\d)\b')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_QUOTED = re.compile(r'"[^"]*"|\'[^\']*\'')
+_RESPONSE_BODY = re.compile(r'Response:.*', re.DOTALL)
+
+def _normalize_message(message: str) -> str:
+    """Keeps status codes and wording, drops ids, payloads and response bodies."""
+    text = _RESPONSE_BODY.sub("", message or "")
+    text = _QUOTED.sub("<s>", text)
+    statuses = {}
+    def keep_status(match):
+        key = f"__status{len(statuses)}__"
+        statuses[key] = match.group(1)
+        return key
+    text = _HTTP_STATUS.sub(keep_status, text)
+    text = _NUMBER.sub("<n>", text)
+    for key, status in statuses.items():
+        text = text.replace(key, status)
+    return " ".join(text.lower().split())[:200]
+
+def _exception_type(failure: Dict[str, Any]) -> str:
+    for text in (failure.get("message") or "", failure.get("longrepr") or ""):
+        match = _EXCEPTION.search(text)
+        if match:
+            return match.group(1).split(".")[-1]
+    return "AssertionError"
+
+def _render_url(node: ast.AST) -> str:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return "".join(v.value if isinstance(v, ast.Constant) else "{}" for v in node.values)
+    return "?"
+
+def endpoint_patterns(function_source: str) -> List[str]:
+    """'api_client.post(f"{base_url}/cart/{pid}")' -> ['POST /cart/{}']"""
+    try:
+        tree = ast.parse(function_source)
+    except SyntaxError:
+        return []
+    patterns = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and node.func.attr in HTTP_VERBS and node.args:
+            url = _render_url(node.args[0])
+            url = re.sub(r'^(\{\}|https?://[^/]+)', "", url)  # Drop the base URL
+            url = re.sub(r'/\d+(?=/|$)', "/{}", url)
+            patterns.add(f"{node.func.attr.upper()} {url or '/'}")
+    return sorted(patterns)
+
+def failure_signature(failures: List[Dict[str, Any]], function_source: str) -> str:
+    """Fingerprint of *why* a test function fails, independent of project specifics."""
+    parts = sorted(f"{_exception_type(f)}|{_normalize_message(f.get('message') or '')}" for f in failures)
+    parts.append("|".join(endpoint_patterns(function_source)))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:20]
+
+def _nodes_with_parents(tree: ast.AST):
+    stack = [(tree, "")]
+    while stack:
+        node, parent = stack.pop()
+        yield node, parent
+        for child in reversed(list(ast.iter_child_nodes(node))):
+            stack.append((child, type(node).__name__))
+
+def derive_patch(old_source: str, new_source: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Describes a fix as constant/name substitutions (e.g. 200 -> 201 inside a
+    Compare, list -> dict inside a Call). Returns None when the fix changed the
+    code's structure, which can't be replayed safely on another test.
+    """
+    try:
+        old_nodes = list(_nodes_with_parents(ast.parse(old_source)))
+        new_nodes = list(_nodes_with_parents(ast.parse(new_source)))
+    except SyntaxError:
+        return None
+    if len(old_nodes) != len(new_nodes):
+        return None
+
+    patch = []
+    for (old, parent), (new, _) in zip(old_nodes, new_nodes):
+        if type(old) is not type(new):
+            return None
+        if isinstance(old, ast.Constant) and (type(old.value) is not type(new.value) or old.value != new.value):
+            change = {"kind": "const", "context": parent, "old": old.value, "new": new.value}
+        elif isinstance(old, ast.Name) and old.id != new.id:
+            change = {"kind": "name", "context": parent, "old": old.id, "new": new.id}
+        elif isinstance(old, ast.Attribute) and old.attr != new.attr:
+            change = {"kind": "attr", "context": parent, "old": old.attr, "new": new.attr}
+        else:
+            continue
+        if change not in patch:
+            patch.append(change)
+    return patch or None
+
+def apply_patch(function_source: str, patch: List[Dict[str, Any]]) -> Optional[str]:
+    """Replays a patch on another function; None unless every substantive substitution found a target."""
+    try:
+        tree = ast.parse(function_source)
+    except SyntaxError:
+        return None
+
+    applied = set()
+    for node, parent in _nodes_with_parents(tree):
+        for i, change in enumerate(patch):
+            if change["context"] != parent:
+                continue
+            if change["kind"] == "const" and isinstance(node, ast.Constant) \
+                    and type(node.value) is type(change["old"]) and node.value == change["old"]:
+                node.value = change["new"]
+                applied.add(i)
+            elif change["kind"] == "name" and isinstance(node, ast.Name) and node.id == change["old"]:
+                node.id = change["new"]
+                applied.add(i)
+            elif change["kind"] == "attr" and isinstance(node, ast.Attribute) and node.attr == change["old"]:
+                node.attr = change["new"]
+                applied.add(i)
+
+    # Message text inside f-strings is cosmetic; every other substitution must land
+    required = {i for i, change in enumerate(patch) if change["context"] != "JoinedStr"}
+    if not required or not required <= applied:
+        return None
+    return ast.unparse(tree) + "\n"
+
+class FixCache:
+    """
+    LRU cache of verified fixes keyed by failure signature, shared across
+    projects and users, so recurring failure shapes are healed without an LLM call.
+    """
+    def __init__(self, storage_path: str = "storage/fix_cache.json", max_entries: int = 1000):
+        self.storage_path = storage_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.storage_path):
+            try:
+                with open(self.storage_path, "r") as f:
+                    data = json.load(f)
+                self.entries = OrderedDict(data.get("entries", []))
+                self.counters.update(data.get("counters", {}))
+            except (ValueError, OSError) as e:
+                print(f"[FixCache] Ignoring unreadable cache file: {e}")
+
+    def _save(self):
+        directory = os.path.dirname(self.storage_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        data = json.dumps({"entries": list(self.entries.items()), "counters": self.counters})
+        # A private temp file per write, so concurrent heals never share one
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".fix_cache-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.storage_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def lookup(self, signature: str) -> Optional[List[Dict[str, Any]]]:
+        with self.lock:
+            entry = self.entries.get(signature)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(signature)
+            entry["hits"] += 1
+            self.counters["hits"] += 1
+            return entry["patch"]
+
+    def store(self, signature: str, patch: List[Dict[str, Any]]) -> bool:
+        """Caches a verified fix; returns False (and caches nothing) if the patch can't be persisted."""
+        try:
+            patch = json.loads(json.dumps(patch))  # e.g. bytes constants: check before touching the cache
+        except (TypeError, ValueError) as e:
+            print(f"[FixCache] Not caching a patch that can't be serialized: {e}")
+            return False
+        with self.lock:
+            entry = self.entries.pop(signature, {"hits": 0})
+            entry["patch"] = patch
+            self.entries[signature] = entry
+            self.counters["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            self._save()
+        return True
+
+    def invalidate(self, signature: str):
+        """Drops a cached fix that didn't make its test pass."""
+        with self.lock:
+            if self.entries.pop(signature, None) is not None:
+                self.counters["invalidations"] += 1
+                self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import asyncio
+import httpx
+import numpy as np
+from typing import Dict, Any, List, Optional
+from .reward_attribution import endpoint_key
+
+# Methods whose probes carry a mutated JSON body; the rest mutate the query string
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+# Probe rewards: the fuzzer is hunting for crashes, hangs and accepted garbage
+CRASH_REWARD = 10.0       # 5xx response
+TRANSPORT_REWARD = 5.0    # Timeout / dropped connection under a mutation
+SLOW_REWARD = 2.0         # Answered, but slower than slow_threshold
+ACCEPTED_REWARD = 1.0     # A mutated payload was accepted with 2xx
+
+MAX_FINDINGS = 200
+MAX_QUERY_VALUE = 8192  # Oversized query values are cut here; the client rejects URLs past 64 KB
+
+# Bounds on one fuzz session; the /fuzz request model exposes the same limits
+MAX_ROUNDS = 1000
+MAX_BATCH_SIZE = 50
+MAX_CONNECTIONS = 200
+MAX_TIMEOUT = 60.0
+MAX_RATE = float(os.getenv("FUZZ_MAX_RATE", 500))  # Requests per second against one target
+
+def fill_path(path: str, value: str = "1") -> str:
+    """'/users/:id/posts/{post_id}' -> '/users/1/posts/1'"""
+    return re.sub(r':[A-Za-z_]\w*|\{[^}]+\}', value, path)
+
+def probe_reward(action: str, status: Optional[int], latency: float, slow_threshold: float) -> float:
+    if status is None:
+        return TRANSPORT_REWARD
+    reward = 0.0
+    if status >= 500:
+        reward += CRASH_REWARD
+    elif 200 <= status < 300 and action != "standard":
+        reward += ACCEPTED_REWARD
+    if latency > slow_threshold:
+        reward += SLOW_REWARD
+    return reward
+
+def _summarize(request: Dict[str, Any], limit: int = 200) -> Dict[str, Any]:
+    """Finding-sized copy of a probe: huge bodies and params are truncated to their repr prefix."""
+    summary = {}
+    for key, value in request.items():
+        text = repr(value) if key in ("json", "params", "headers") else None
+        summary[key] = value if text is None or len(text) <= limit else text[:limit] + "..."
+    return summary
+
+class RateLimiter:
+    """Token bucket shared by every probe sent to one target."""
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class FuzzEngine:
+    """
+    Policy-driven mutation fuzzer. Each round asks the RL policy for one action
+    per endpoint (batched), draws `batch_size` typed mutations per endpoint from
+    the mutation catalog, fires them concurrently through one pooled async
+    client under the target's connection and rate limits, and feeds
+    status/latency rewards back as one batched policy update. With a `seed`
+    the mutations of every round are reproducible. Settings beyond the MAX_*
+    bounds raise ValueError; rate_limit=0 (unthrottled) is for local targets.
+    """
+    def __init__(self, rl_engine, max_connections: int = 50, rate_limit: float = 200.0,
+                 timeout: float = 5.0, slow_threshold: float = 2.0, batch_size: int = 1,
+                 seed: Optional[int] = None):
+        if not 1 <= max_connections <= MAX_CONNECTIONS:
+            raise ValueError(f"max_connections must be between 1 and {MAX_CONNECTIONS}")
+        if not 0 <= rate_limit <= MAX_RATE:
+            raise ValueError(f"rate_limit must be between 0 and {MAX_RATE:g} requests per second")
+        if not 0 < timeout <= MAX_TIMEOUT:
+            raise ValueError(f"timeout must be positive and at most {MAX_TIMEOUT:g} seconds")
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self.rl = rl_engine
+        self.batch_size = batch_size
+        self.seed = seed
+        self.max_connections = max_connections
+        self.rate_limit = rate_limit  # Requests per second per target; 0 disables
+        self.timeout = timeout
+        self.slow_threshold = slow_threshold
+
+    def _build_requests(self, endpoints: List[Dict[str, Any]], actions: List[str],
+                        round_number: int = 0) -> List[Dict[str, Any]]:
+        """batch_size requests per endpoint, grouped by endpoint in `endpoints` order."""
+        schemas = [endpoint.get("payload_schema") or {} for endpoint in endpoints]
+        seed = None if self.seed is None else (self.seed, round_number)
+        batches = self.rl.mutations.generate_batch(schemas, actions, self.batch_size, seed)
+        requests = []
+        for endpoint, mutations in zip(endpoints, batches):
+            method = endpoint["method"].upper()
+            for mutation in mutations:
+                request = {"method": method, "url": fill_path(endpoint["path"])}
+                params = list(mutation["query"])
+                if method in BODY_METHODS:
+                    request["json"] = mutation["body"]
+                else:
+                    params = [(k, "" if v is None else str(v)[:MAX_QUERY_VALUE])
+                              for k, v in mutation["body"].items()] + params
+                if params:
+                    request["params"] = params
+                if mutation["headers"]:
+                    request["headers"] = mutation["headers"]
+                request["operator"] = mutation["operator"]
+                requests.append(request)
+        return requests
+
+    async def _probe(self, client: httpx.AsyncClient, limiter: RateLimiter, slots: asyncio.Semaphore,
+                     request: Dict[str, Any]) -> Dict[str, Any]:
+        # Wait for a connection slot before starting the clock: time spent queued
+        # behind our own pool is not the target's latency and must not be rewarded
+        async with slots:
+            await limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = await client.request(**{k: v for k, v in request.items() if k != "operator"})
+                status, error = response.status_code, None
+            except httpx.HTTPError as e:
+                status, error = None, type(e).__name__
+            return {"status": status, "error": error, "latency": time.monotonic() - started}
+
+    async def fuzz_async(self, base_url: str, endpoints: List[Dict[str, Any]], rounds: int = 10,
+                         cancel: Optional[asyncio.Event] = None) -> Dict[str, Any]:
+        """Runs `rounds` policy rounds over all endpoints; setting `cancel` stops between rounds."""
+        if not 1 <= rounds <= MAX_ROUNDS:
+            raise ValueError(f"rounds must be between 1 and {MAX_ROUNDS}")
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        limiter = RateLimiter(self.rate_limit)
+        slots = asyncio.Semaphore(self.max_connections)  # Probes in flight never exceed pooled connections
+        keys = [endpoint_key(ep["method"], ep["path"]) for ep in endpoints]
+
+        statuses: Dict[str, int] = {}
+        latencies: List[float] = []
+        findings: List[Dict[str, Any]] = []
+        action_counts: Dict[str, int] = {}
+        operator_counts: Dict[str, int] = {}
+        started = time.monotonic()
+        probes = 0
+
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=self.timeout) as client:
+            for round_number in range(rounds):
+                if cancel is not None and cancel.is_set():
+                    break
+                actions = self.rl.choose_actions(keys)
+                requests = self._build_requests(endpoints, actions, round_number)
+                outcomes = await asyncio.gather(*(self._probe(client, limiter, slots, r) for r in requests))
+
+                # Every probe is one observation for its (endpoint, action)
+                probe_keys = [key for key in keys for _ in range(self.batch_size)]
+                probe_actions = [action for action in actions for _ in range(self.batch_size)]
+                rewards = []
+                for key, action, request, outcome in zip(probe_keys, probe_actions, requests, outcomes):
+                    reward = probe_reward(action, outcome["status"], outcome["latency"], self.slow_threshold)
+                    rewards.append(reward)
+                    label = str(outcome["status"]) if outcome["status"] is not None else outcome["error"]
+                    statuses[label] = statuses.get(label, 0) + 1
+                    action_counts[action] = action_counts.get(action, 0) + 1
+                    operator_counts[request["operator"]] = operator_counts.get(request["operator"], 0) + 1
+                    latencies.append(outcome["latency"])
+                    if reward >= TRANSPORT_REWARD and len(findings) < MAX_FINDINGS:
+                        findings.append({"endpoint": key, "action": action, "status": outcome["status"],
+                                         "error": outcome["error"], "latency": round(outcome["latency"], 4),
+                                         "request": _summarize(request)})
+                self.rl.update_policies(probe_keys, probe_actions, rewards)
+                probes += len(requests)
+
+        elapsed = time.monotonic() - started
+        latency_ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+        return {
+            "probes": probes,
+            "elapsed_seconds": round(elapsed, 3),
+            "probes_per_minute": round(probes / elapsed * 60, 1) if elapsed else 0.0,
+            "statuses": statuses,
+            "actions": action_counts,
+            "operators": operator_counts,
+            "latency_ms": {"p50": round(float(np.percentile(latency_ms, 50)), 2),
+                           "p95": round(float(np.percentile(latency_ms, 95)), 2)},
+            "findings": findings
+        }
+
+    def fuzz(self, base_url: str, endpoints: List[Dict[str, Any]], rounds: int = 10) -> Dict[str, Any]:
+        """Blocking entry point for sync callers (FastAPI runs sync endpoints in a worker thread)."""
+        print(f"[Fuzzer] {rounds} rounds x {len(endpoints)} endpoints x {self.batch_size} payloads against {base_url}")
+        return asyncio.run(self.fuzz_async(base_url, endpoints, rounds))
@@ -4,6 +4,7 @@ import google.generativeai as genai
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 from .llm_client import GeminiClient
+from .mutations import MutationCatalog, ACTION_OPERATORS, describe
 
 load_dotenv()
 
@@ -33,7 +34,19 @@ class TestGenerator:
         
         return text
 
-    def generate_test_suite(self, project_name: str, endpoints: List[Dict[str, Any]], base_url: str = "http://localhost:5000") -> str:
+    def _mutation_examples(self, schema: Any, seed: Any, per_action: int = 1) -> str:
+        """Compact catalog samples per RL action, so the prompt shows concrete adversarial inputs."""
+        catalog = MutationCatalog()
+        lines = []
+        for action in ACTION_OPERATORS:
+            if action == "standard":
+                continue
+            for mutation in catalog.generate(schema or {}, action, per_action, (*seed, len(lines))):
+                lines.append(f"{action}: {describe(mutation)}")
+        return "; ".join(lines)
+
+    def generate_test_suite(self, project_name: str, endpoints: List[Dict[str, Any]], base_url: str = "http://localhost:5000",
+                            mutation_seed: int = 0) -> str:
         print(f"Generating tests for {project_name}...")
 
         endpoints_context = ""
@@ -41,6 +54,7 @@ class TestGenerator:
             endpoints_context += f"""
             Endpoint {i+1}: {ep.get('method')} {ep.get('path')}
             Payload: {ep.get('payload_schema')}
+            Mutation examples: {self._mutation_examples(ep.get('payload_schema'), (mutation_seed, i))}
             """
 
         prompt = f"""
@@ -49,12 +63,21 @@ class TestGenerator:
         Endpoints: {endpoints_context}
 
         REQUIREMENTS:
-        1. Use 'import pytest' and 'import requests'.
+        1. Use 'import pytest'.
         2. Define a fixture 'base_url'.
         3. Write test functions starting with 'test_'.
-        4. CRITICAL: When asserting status code, ALWAYS print the response text if it fails.
+        4. HTTP CLIENT: Every test must take the 'api_client' fixture and make ALL requests through it
+           (api_client.get / api_client.post / ...). It is a pooled keep-alive requests.Session provided
+           by conftest.py. Do NOT define 'api_client' yourself and do NOT call requests.get/post directly.
+           Example: def test_list_users(base_url, api_client): response = api_client.get(f"{{base_url}}/users")
+        5. METADATA: Decorate every test with the route it targets, exactly as listed in the endpoints
+           above, and with the mutation it performs (one of: standard, null_injection, sql_injection,
+           overflow, type_mismatch). These markers attribute test results to endpoints.
+           Example: @pytest.mark.endpoint("GET", "/users/:id") and @pytest.mark.action("standard")
+           Base negative tests on the listed mutation examples; build huge values in code ("A" * 100000).
+        6. CRITICAL: When asserting status code, ALWAYS print the response text if it fails.
            Example: assert response.status_code == 200, f"Expected 200 but got {{response.status_code}}. Response: {{response.text}}"
-        5. Return ONLY raw python code.
+        7. Return ONLY raw python code.
         """
 
         try:
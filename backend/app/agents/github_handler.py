@@ -5,6 +5,8 @@ import zipfile
 from git import Repo
 import validators
 import stat
+import threading
+from typing import Optional
 
 def on_rm_error(func, path, exc_info):
     """
@@ -32,7 +34,8 @@ class GitHubHandler:
             return False
         return 'github.com' in url.lower()
     
-    def clone_and_zip(self, github_url: str, token: str = None, upload_dir: str = "storage/uploads") -> str:
+    def clone_and_zip(self, github_url: str, token: str = None, upload_dir: str = "storage/uploads",
+                      cancel: Optional[threading.Event] = None) -> str:
         """
         Clone a GitHub repository and convert it to a ZIP file
         
@@ -40,6 +43,7 @@ class GitHubHandler:
             github_url: GitHub repository URL
             token: Optional GitHub Personal Access Token for private repos
             upload_dir: Directory to save the ZIP file
+            cancel: Optional event; once set, the work stops at the next file
             
         Returns:
             Path to the created ZIP file
@@ -73,6 +77,7 @@ class GitHubHandler:
             
             # Use the auth_url for cloning but don't log it to avoid leaking tokens
             Repo.clone_from(auth_url, clone_path, depth=1)  # Shallow clone for speed
+            self._check_cancelled(cancel)
             
             # Remove .git directory to reduce size
             git_dir = os.path.join(clone_path, '.git')
@@ -87,6 +92,7 @@ class GitHubHandler:
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for root, dirs, files in os.walk(clone_path):
                     for file in files:
+                        self._check_cancelled(cancel)
                         file_path = os.path.join(root, file)
                         arcname = os.path.relpath(file_path, clone_path)
                         zipf.write(file_path, arcname)
@@ -108,6 +114,11 @@ class GitHubHandler:
                 except:
                     pass  # Best effort cleanup
     
+    @staticmethod
+    def _check_cancelled(cancel: Optional[threading.Event]):
+        if cancel is not None and cancel.is_set():
+            raise RuntimeError("cancelled")
+
     def cleanup(self):
         """Clean up temporary files - No-op now as we clean up per request"""
         pass
@@ -0,0 +1,163 @@
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from typing import Dict, Any, List, Optional, Tuple
+from .code_slicer import match_endpoint
+from .schema_sampling import sample_from_schema
+
+# Run targets use this in place of a base URL to get an auto-started mock server
+MOCK_TARGET = "mock"
+
+# Keeps the in-memory store bounded during long benchmark runs
+MAX_ITEMS_PER_COLLECTION = 1000
+
+class MockTargetServer:
+    """
+    Stand-in for the user's backend, synthesized from the scanned endpoint catalog.
+    Serves schema-shaped JSON from an in-memory store (POST creates, GET reads,
+    PUT/PATCH update, DELETE removes) with configurable latency, random error
+    rate and per-endpoint status overrides ({"GET /users/:id": 503}).
+    Seeded, so error injection is reproducible across benchmark runs.
+    """
+    def __init__(self, endpoints: List[Dict[str, Any]], latency: float = 0.0, error_rate: float = 0.0,
+                 status_overrides: Optional[Dict[str, int]] = None, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.endpoints = endpoints
+        self.settings = {"latency": latency, "error_rate": error_rate,
+                         "status_overrides": dict(status_overrides or {}), "seed": seed}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.status_overrides = {}
+        for key, status in (status_overrides or {}).items():
+            method, _, path = key.partition(" ")
+            self.status_overrides[f"{method.upper()} {path}"] = status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.collections: Dict[str, Dict[str, Any]] = {}
+        self.requests_served = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockTargetServer":
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+            self.thread.start()
+            print(f"[MockTarget] Serving {len(self.endpoints)} endpoints at {self.base_url}")
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+
+    def _entity(self, endpoint: Dict[str, Any], item_id: Any, body: Any) -> Dict[str, Any]:
+        shaped = sample_from_schema(endpoint.get("payload_schema") or {}, "field", 1)
+        entity = shaped if isinstance(shaped, dict) else {}
+        if isinstance(body, dict):
+            entity.update(body)
+        entity["id"] = item_id
+        return entity
+
+    def handle(self, method: str, raw_path: str, body: Any) -> Tuple[int, Any]:
+        """Computes the (status, payload) for one request; the HTTP plumbing lives in the handler."""
+        path = urlsplit(raw_path).path.rstrip("/") or "/"
+        endpoint = match_endpoint(f"{method} {path}", self.endpoints)
+
+        with self.lock:
+            self.requests_served += 1
+            failing = self.error_rate > 0 and self.random.random() < self.error_rate
+        if endpoint is None:
+            return 404, {"error": f"Cannot {method} {path}"}
+
+        override = self.status_overrides.get(f"{method} {endpoint['path']}")
+        if override:
+            return override, {"error": "Injected status"} if override >= 400 else {}
+        if failing:
+            return 500, {"error": "Injected failure"}
+
+        # /products/42 -> collection "/products", id "42"; /products -> collection itself
+        route_is_item = endpoint["path"].rstrip("/").split("/")[-1].startswith((":", "{"))
+        collection_key, _, item_id = path.rpartition("/") if route_is_item else (path, "", None)
+
+        with self.lock:
+            items = self.collections.setdefault(collection_key, {})
+            if method == "POST":
+                new_id = len(items) + 1
+                while str(new_id) in items:
+                    new_id += 1
+                entity = self._entity(endpoint, new_id, body)
+                if len(items) < MAX_ITEMS_PER_COLLECTION:
+                    items[str(new_id)] = entity
+                return 201, entity
+            if item_id is None:
+                if method == "GET":
+                    return 200, list(items.values()) or [self._entity(endpoint, 1, None)]
+                return 200, body if isinstance(body, dict) else {}
+
+            existing = items.get(item_id) or self._entity(endpoint, int(item_id) if item_id.isdigit() else item_id, None)
+            if method == "GET":
+                return 200, existing
+            if method in ("PUT", "PATCH"):
+                if isinstance(body, dict):
+                    existing.update(body)
+                    existing["id"] = int(item_id) if item_id.isdigit() else item_id
+                items[item_id] = existing
+                return 200, existing
+            if method == "DELETE":
+                items.pop(item_id, None)
+                return 200, {"message": "Deleted", "id": existing["id"]}
+        return 405, {"error": f"{method} not supported"}
+
+    def _handler_class(self):
+        target = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like a real backend
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                if target.latency > 0:
+                    time.sleep(target.latency)
+                status, payload = target.handle(self.command, self.path, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, format, *args):
+                pass  # Benchmarks would otherwise be dominated by stderr writes
+
+        return Handler
+
+if __name__ == "__main__":
+    # Serve a small catalog for manual benchmarking: python -m app.agents.mock_server
+    demo = [
+        {"method": "GET", "path": "/products", "payload_schema": {}},
+        {"method": "GET", "path": "/products/:id", "payload_schema": {}},
+        {"method": "POST", "path": "/products", "payload_schema": {"name": "string", "price": "number"}},
+    ]
+    server = MockTargetServer(demo, port=5050).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
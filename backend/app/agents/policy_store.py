@@ -0,0 +1,181 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+from .rl_engine import RLEngine
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+def partition_name(value: str) -> str:
+    """Filesystem-safe, collision-free directory name for a tenant or project."""
+    value = value or "default"
+    if _SAFE_NAME.match(value) and value not in (".", ".."):
+        return value
+    slug = re.sub(r'[^A-Za-z0-9_.-]', '_', value)[:48].strip(".") or "_"
+    return f"{slug}-{hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]}"
+
+class PolicyStore:
+    """
+    RL policies partitioned by tenant (X-User-ID) and project:
+    <root>/<tenant>/<project>/ holds one QTableStore, so tenants never share
+    rewards and parallel runs never contend on one file. Each partition has its
+    own engine and lock; the registry lock only guards the lookup table.
+
+    A new partition warm-starts from the shared `prior` engine (the legacy
+    global table): its Q-values are copied and its reward statistics scaled
+    by `prior_weight`, so bandit policies still explore. Legacy rows are keyed
+    by bare path; the partition's "METHOD /path" states start from them when
+    first seen (see QTableStore.intern). The prior is a frozen seed: tenant
+    updates never flow back into it, so tenants never share rewards.
+
+    At most `max_open` idle partitions stay in memory; the least recently used
+    one is closed (snapshotted) and reloaded from disk on its next use. Engines
+    held through checkout() are never closed under their users: eviction skips
+    them and release() unloads them when the last checkout ends. `mirror`, if
+    given, receives (tenant, project, q_table) whenever a partition closes;
+    `restore(tenant, project)` reads such a table back, and seeds a partition
+    whose directory holds no snapshot (e.g. a fresh disk) before the prior does.
+    """
+    def __init__(self, root: str = "storage/policies", prior: Optional[RLEngine] = None,
+                 policy: Optional[str] = None, prior_weight: float = 0.1, max_open: int = 64,
+                 mirror: Optional[Callable[[str, str, Dict[str, Dict[str, float]]], None]] = None,
+                 restore: Optional[Callable[[str, str], Dict[str, Dict[str, float]]]] = None):
+        self.root = root
+        self.mirror = mirror
+        self.restore = restore
+        self.prior = prior
+        self.policy = policy
+        self.prior_weight = prior_weight
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        self.engines: "OrderedDict[Tuple[str, str], RLEngine]" = OrderedDict()
+        self._partition_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._checkouts: Dict[Tuple[str, str], int] = {}
+        self._released: Set[Tuple[str, str]] = set()  # Unload once their last checkout ends
+
+    def partition_dir(self, tenant: str, project: str) -> str:
+        return os.path.join(self.root, partition_name(tenant), partition_name(project))
+
+    def engine(self, tenant: str, project: str) -> RLEngine:
+        """
+        The tenant's engine for one project, loading or warm-starting it on first
+        use. The engine may be evicted at any time afterwards; use checkout() to
+        hold it while updating.
+        """
+        return self._acquire(tenant, project, hold=False)
+
+    @contextmanager
+    def checkout(self, tenant: str, project: str) -> Iterator[RLEngine]:
+        """Like engine(), but the engine stays open until the block exits."""
+        key = (tenant, project)
+        engine = self._acquire(tenant, project, hold=True)
+        try:
+            yield engine
+        finally:
+            with self.lock:
+                remaining = self._checkouts.get(key, 0) - 1
+                if remaining > 0:
+                    self._checkouts[key] = remaining
+                    evicted = []
+                else:
+                    self._checkouts.pop(key, None)  # Already gone if close() ran meanwhile
+                    if key in self._released:
+                        self._released.discard(key)
+                        self.engines.pop(key, None)
+                        self._partition_locks.pop(key, None)
+                        evicted = [(key, engine)]
+                    else:
+                        evicted = self._evict()
+            self._close_all(evicted)
+
+    def _acquire(self, tenant: str, project: str, hold: bool) -> RLEngine:
+        key = (tenant, project)
+        with self.lock:
+            engine = self.engines.get(key)
+            if engine is not None:
+                self.engines.move_to_end(key)
+                if hold:
+                    self._checkouts[key] = self._checkouts.get(key, 0) + 1
+                    self._released.discard(key)
+                return engine
+            partition_lock = self._partition_locks.setdefault(key, threading.Lock())
+
+        # Only callers of the same partition wait for each other while it loads
+        with partition_lock:
+            with self.lock:
+                engine = self.engines.get(key)
+                if engine is not None and hold:
+                    self._checkouts[key] = self._checkouts.get(key, 0) + 1
+                    self._released.discard(key)
+            if engine is None:
+                engine = self._open(tenant, project)
+                with self.lock:
+                    self.engines[key] = engine
+                    if hold:
+                        self._checkouts[key] = self._checkouts.get(key, 0) + 1
+                    evicted = self._evict()
+                self._close_all(evicted)
+        return engine
+
+    def _open(self, tenant: str, project: str) -> RLEngine:
+        engine = RLEngine(storage_path=None, storage_dir=self.partition_dir(tenant, project), policy=self.policy)
+        if len(engine.store) == 0 and self.restore is not None:
+            try:
+                table = self.restore(tenant, project)
+            except Exception as e:
+                print(f"[Policies] Restoring {tenant}/{project} failed: {e}")
+                table = {}
+            if table:
+                restored = engine.store.import_table(table)
+                engine.store.save()
+                print(f"[Policies] Restored {tenant}/{project} with {restored} states from the repository")
+                return engine
+        if len(engine.store) == 0 and self.prior is not None and len(self.prior.store) > 0:
+            copied = engine.store.warm_start(self.prior.store, self.prior_weight)
+            print(f"[Policies] Warm-started {tenant}/{project} with {copied} states from the global prior")
+        return engine
+
+    def _evict(self):
+        """Unloads least recently used idle partitions down to max_open (call under self.lock)."""
+        evicted = []
+        idle = [key for key in self.engines if key not in self._checkouts]
+        excess = len(self.engines) - self.max_open
+        for key in idle[:max(0, excess)]:
+            evicted.append((key, self.engines.pop(key)))
+            self._partition_locks.pop(key, None)
+        return evicted
+
+    def _close_all(self, partitions):
+        for (tenant, project), engine in partitions:
+            engine.store.close()
+            if self.mirror is not None:
+                try:
+                    self.mirror(tenant, project, engine.q_table)
+                except Exception as e:
+                    print(f"[Policies] Mirroring {tenant}/{project} failed: {e}")
+
+    def release(self, tenant: str):
+        """
+        Snapshots and unloads every partition of a tenant (e.g. on logout); data
+        stays on disk. Partitions still checked out unload when they are returned.
+        """
+        with self.lock:
+            keys = [key for key in self.engines if key[0] == tenant]
+            self._released.update(key for key in keys if key in self._checkouts)
+            partitions = [(key, self.engines.pop(key)) for key in keys if key not in self._checkouts]
+            for key, _ in partitions:
+                self._partition_locks.pop(key, None)
+        self._close_all(partitions)
+
+    def close(self):
+        """Snapshots every partition (shutdown); checked-out engines are closed too."""
+        with self.lock:
+            partitions = list(self.engines.items())
+            self.engines.clear()
+            self._partition_locks.clear()
+            self._checkouts.clear()
+            self._released.clear()
+        self._close_all(partitions)
@@ -0,0 +1,341 @@
+import os
+import json
+import atexit
+import shutil
+import threading
+import numpy as np
+from typing import Dict, List, Sequence
+
+VALUES_FILE = "q_values.npy"
+STATS_FILE = "q_stats.npy"
+STATES_FILE = "states.json"
+JOURNAL_FILE = "journal.jsonl"
+PENDING_JOURNAL_FILE = "journal.pending.jsonl"  # Rotated out while a snapshot is being written
+
+# Per (state, action) reward statistics kept next to the Q-values for bandit policies
+STAT_FIELDS = ("count", "reward_sum", "reward_sq_sum", "successes")
+COUNT, REWARD_SUM, REWARD_SQ_SUM, SUCCESSES = range(len(STAT_FIELDS))
+
+class QTableStore:
+    """
+    Array-backed Q-table: state keys (endpoint paths) are interned to row ids and
+    the values live in one float32 [n_states, n_actions] matrix, with reward
+    statistics (STAT_FIELDS) in a parallel [n_states, n_actions, 4] array.
+
+    On disk: <storage_dir>/q_values.npy and q_stats.npy (memory-mapped on load,
+    copied into memory only on the first write) and states.json (row order).
+
+    Writes are write-behind: record() appends the batch's resulting values to
+    journal.jsonl, and a background flusher folds the journal into an atomic
+    snapshot every `snapshot_interval` seconds or `snapshot_every` journaled
+    batches. Loading replays the journal over the snapshot, so a crash loses
+    nothing that was journaled.
+    """
+    def __init__(self, actions: Sequence[str], storage_dir: str = "storage/q_table",
+                 snapshot_interval: float = 30.0, snapshot_every: int = 50):
+        self.actions = list(actions)
+        self.action_ids = {a: i for i, a in enumerate(self.actions)}
+        self.storage_dir = storage_dir
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_every = snapshot_every
+        self.lock = threading.RLock()
+        self._save_lock = threading.Lock()  # One snapshot at a time (flusher vs explicit saves)
+        self.index: Dict[str, int] = {}
+        self.keys: List[str] = []
+        self._values = np.zeros((0, len(self.actions)), dtype=np.float32)
+        self._stats = np.zeros((0, len(self.actions), len(STAT_FIELDS)), dtype=np.float32)
+        self._writable = True
+        self._journaled = 0  # Batches journaled since the last snapshot
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = None
+        self.load()
+
+    @property
+    def values(self) -> np.ndarray:
+        """The live [n_states, n_actions] view (capacity rows beyond n_states excluded)."""
+        return self._values[:len(self.keys)]
+
+    @property
+    def stats(self) -> np.ndarray:
+        """The live [n_states, n_actions, len(STAT_FIELDS)] reward statistics."""
+        return self._stats[:len(self.keys)]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def _ensure_writable(self, rows: int):
+        """Copies a memory-mapped table into memory and grows capacity geometrically."""
+        capacity = self._values.shape[0]
+        if self._writable and rows <= capacity:
+            return
+        new_capacity = max(rows, 2 * capacity, 64) if rows > capacity else capacity
+        grown = np.zeros((new_capacity, len(self.actions)), dtype=np.float32)
+        grown[:len(self.keys)] = self._values[:len(self.keys)]
+        grown_stats = np.zeros((new_capacity, len(self.actions), len(STAT_FIELDS)), dtype=np.float32)
+        grown_stats[:len(self.keys)] = self._stats[:len(self.keys)]
+        self._values, self._stats = grown, grown_stats
+        self._writable = True
+
+    def intern(self, keys: Sequence[str]) -> np.ndarray:
+        """
+        Row ids for the given keys, allocating rows for new ones. A new
+        "METHOD /path" state starts from the legacy path-only "/path" row if the
+        store has one (tables from before states carried the method); otherwise
+        it starts zeroed.
+        """
+        with self.lock:
+            ids = np.empty(len(keys), dtype=np.int64)
+            new_keys = [k for k in dict.fromkeys(keys) if k not in self.index]
+            if new_keys:
+                self._ensure_writable(len(self.keys) + len(new_keys))
+                for key in new_keys:
+                    row = len(self.keys)
+                    self.index[key] = row
+                    self.keys.append(key)
+                    legacy = self.index.get(key.split(" ", 1)[-1]) if " " in key else None
+                    if legacy is not None:
+                        self._values[row] = self._values[legacy]
+                        self._stats[row] = self._stats[legacy]
+            for i, key in enumerate(keys):
+                ids[i] = self.index[key]
+            return ids
+
+    def ids_for_actions(self, actions: Sequence[str]) -> np.ndarray:
+        return np.fromiter((self.action_ids[a] for a in actions), dtype=np.int64, count=len(actions))
+
+    def row(self, key: str) -> Dict[str, float]:
+        with self.lock:
+            if key not in self.index:
+                return {a: 0.0 for a in self.actions}
+            values = self._values[self.index[key]]
+            return {a: float(values[i]) for i, a in enumerate(self.actions)}
+
+    def set_values(self, ids: np.ndarray, action_ids: np.ndarray, new_values: np.ndarray,
+                   new_stats: np.ndarray = None):
+        with self.lock:
+            self._ensure_writable(len(self.keys))
+            self._values[ids, action_ids] = new_values
+            if new_stats is not None:
+                self._stats[ids, action_ids] = new_stats
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """The legacy { "endpoint_path": { "action": q } } shape."""
+        with self.lock:
+            return {key: self.row(key) for key in self.keys}
+
+    def load(self):
+        values_path = os.path.join(self.storage_dir, VALUES_FILE)
+        states_path = os.path.join(self.storage_dir, STATES_FILE)
+        if os.path.exists(values_path) and os.path.exists(states_path):
+            with open(states_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("actions") != self.actions:
+                raise ValueError(f"Q-table at {self.storage_dir} was saved with actions {meta.get('actions')}")
+            values = np.load(values_path, mmap_mode="r")
+            stats_path = os.path.join(self.storage_dir, STATS_FILE)
+            stats = np.load(stats_path, mmap_mode="r") if os.path.exists(stats_path) else None
+            with self.lock:
+                self.keys = list(meta["states"])
+                self.index = {key: i for i, key in enumerate(self.keys)}
+                self._values = values
+                self._writable = False  # Read straight from the mapping until something changes
+                if stats is not None and stats.shape[0] >= len(self.keys):
+                    self._stats = stats
+                else:
+                    # Tables saved before statistics existed (or a torn snapshot): start them at zero
+                    self._stats = np.zeros((len(self.keys), len(self.actions), len(STAT_FIELDS)), dtype=np.float32)
+                    if stats is not None:
+                        self._stats[:stats.shape[0]] = stats
+
+        replayed = 0
+        for name in (PENDING_JOURNAL_FILE, JOURNAL_FILE):
+            replayed += self._replay(os.path.join(self.storage_dir, name))
+        if replayed:
+            print(f"[QStore] Recovered {replayed} journaled update batches from {self.storage_dir}")
+            self._journaled = replayed
+            self.save()
+
+    def _replay(self, journal_path: str) -> int:
+        if not os.path.exists(journal_path):
+            return 0
+        batches = 0
+        with open(journal_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn last line from a crash mid-append
+                ids = self.intern(entry["states"])
+                stats = entry.get("stats")
+                self.set_values(ids, self.ids_for_actions(entry["actions"]),
+                                np.asarray(entry["values"], dtype=np.float32),
+                                None if stats is None else np.asarray(stats, dtype=np.float32))
+                batches += 1
+        return batches
+
+    def observe(self, ids: np.ndarray, action_ids: np.ndarray, rewards: np.ndarray) -> np.ndarray:
+        """Folds observed rewards into the statistics; returns the updated stat rows."""
+        rewards = np.asarray(rewards, dtype=np.float32)
+        update = np.stack([np.ones_like(rewards), rewards, rewards * rewards,
+                           (rewards > 0).astype(np.float32)], axis=1)
+        with self.lock:
+            self._ensure_writable(len(self.keys))
+            np.add.at(self._stats, (ids, action_ids), update)
+            return self._stats[ids, action_ids].copy()
+
+    def record(self, ids: np.ndarray, action_ids: np.ndarray, new_values: np.ndarray,
+               rewards: np.ndarray = None):
+        """
+        Applies a batch (and, with `rewards`, its reward statistics) and journals
+        the resulting values. Journal entries hold absolute values, so replaying
+        them more than once is harmless.
+        """
+        entry = {
+            "states": [self.keys[i] for i in ids.tolist()],
+            "actions": [self.actions[a] for a in action_ids.tolist()],
+            "values": [float(v) for v in new_values]
+        }
+        with self.lock:
+            self.set_values(ids, action_ids, new_values)
+            if rewards is not None:
+                entry["stats"] = self.observe(ids, action_ids, rewards).tolist()
+            os.makedirs(self.storage_dir, exist_ok=True)
+            with open(os.path.join(self.storage_dir, JOURNAL_FILE), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._journaled += 1
+            due = self._journaled >= self.snapshot_every
+        if self.snapshot_interval <= 0:
+            if due:
+                self.save()  # No background flusher: snapshot inline
+            return
+        self._start_flusher()
+        if due:
+            self._wake.set()
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            with self.lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self._flusher.start()
+                    atexit.register(self.close)
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.snapshot_interval)
+            self._wake.clear()
+            if self._journaled and not self._closed.is_set():
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"[QStore] Snapshot failed, journal kept: {e}")
+
+    def close(self):
+        """Stops the flusher and folds any journaled updates into a final snapshot."""
+        self._closed.set()
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        if self._journaled:
+            self.save()
+
+    def save(self):
+        """
+        Atomic snapshot: all files are written to temp names and swapped in. The
+        journal is rotated out under the lock first, so batches recorded while the
+        snapshot is written land in a fresh journal and are never dropped.
+        """
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        os.makedirs(self.storage_dir, exist_ok=True)
+        journal_path = os.path.join(self.storage_dir, JOURNAL_FILE)
+        pending_path = os.path.join(self.storage_dir, PENDING_JOURNAL_FILE)
+        with self.lock:
+            values = np.array(self._values[:len(self.keys)], dtype=np.float32)
+            stats = np.array(self._stats[:len(self.keys)], dtype=np.float32)
+            meta = {"actions": self.actions, "states": list(self.keys)}
+            if os.path.exists(journal_path):
+                if os.path.exists(pending_path):
+                    # A previous snapshot failed; keep its entries ahead of the newer ones
+                    with open(pending_path, "a") as pending, open(journal_path, "r") as journal:
+                        shutil.copyfileobj(journal, pending)
+                    os.remove(journal_path)
+                else:
+                    os.replace(journal_path, pending_path)
+            self._journaled = 0
+
+        values_tmp = os.path.join(self.storage_dir, f"{VALUES_FILE}.tmp")
+        stats_tmp = os.path.join(self.storage_dir, f"{STATS_FILE}.tmp")
+        states_tmp = os.path.join(self.storage_dir, f"{STATES_FILE}.tmp")
+        with open(values_tmp, "wb") as f:
+            np.save(f, values)
+        with open(stats_tmp, "wb") as f:
+            np.save(f, stats)
+        with open(states_tmp, "w") as f:
+            json.dump(meta, f)
+        # Rows are append-only, so a crash between the swaps leaves a states
+        # list that is a prefix of (or equal to) the matrix rows.
+        os.replace(values_tmp, os.path.join(self.storage_dir, VALUES_FILE))
+        os.replace(stats_tmp, os.path.join(self.storage_dir, STATS_FILE))
+        os.replace(states_tmp, os.path.join(self.storage_dir, STATES_FILE))
+        if os.path.exists(pending_path):
+            os.remove(pending_path)
+
+    def warm_start(self, prior: "QTableStore", stats_weight: float = 0.1) -> int:
+        """
+        Seeds an empty store from another one: Q-values are copied, reward
+        statistics scaled down to pseudo-counts. Snapshotted immediately.
+        """
+        if prior.actions != self.actions:
+            raise ValueError("Cannot warm-start from a Q-table with different actions")
+        with prior.lock:
+            keys = list(prior.keys)
+            values = np.array(prior.values, dtype=np.float32)
+            stats = np.array(prior.stats, dtype=np.float32) * stats_weight
+        with self.lock:
+            ids = self.intern(keys)
+            self._ensure_writable(len(self.keys))
+            self._values[ids] = values
+            self._stats[ids] = stats
+        self.save()
+        return len(keys)
+
+    def import_json(self, json_path: str) -> int:
+        """Loads a legacy q_table.json into the store; returns the number of states imported."""
+        with open(json_path, "r") as f:
+            return self.import_table(json.load(f))
+
+    def import_table(self, table: Dict[str, Dict[str, float]]) -> int:
+        """Sets Q-values from the { "state": { "action": q } } shape; unknown actions are skipped."""
+        keys = list(table)
+        row_ids, action_ids, values = [], [], []
+        for row_id, key in zip(self.intern(keys), keys):
+            for action, value in table[key].items():
+                if action in self.action_ids:
+                    row_ids.append(row_id)
+                    action_ids.append(self.action_ids[action])
+                    values.append(value)
+        self.set_values(np.array(row_ids, dtype=np.int64), np.array(action_ids, dtype=np.int64),
+                        np.array(values, dtype=np.float32))
+        return len(keys)
+
+def convert_json_table(json_path: str, storage_dir: str, actions: Sequence[str]) -> QTableStore:
+    """One-off converter from q_table.json to the binary format."""
+    store = QTableStore(actions, storage_dir)
+    store.import_json(json_path)
+    store.save()
+    return store
+
+if __name__ == "__main__":
+    import sys
+    from .rl_engine import RLEngine
+    source = sys.argv[1] if len(sys.argv) > 1 else "storage/q_table.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else "storage/q_table"
+    converted = convert_json_table(source, target, RLEngine.ACTIONS)
+    print(f"Converted {len(converted)} states from {source} to {target}")
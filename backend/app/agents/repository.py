@@ -0,0 +1,750 @@
+import os
+import abc
+import json
+import glob
+import base64
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: history writes are only serialized within one process
+    fcntl = None
+
+# STORAGE_BACKEND=sqlite (default) | json
+DEFAULT_BACKEND = "sqlite"
+HISTORY_LIMIT = 100  # Runs returned by list_runs
+HISTORY_SEGMENT_BYTES = 1024 * 1024  # JSONL history segment size before rotation
+HISTORY_SEGMENTS = 50                # Rotated segments kept per user (JSON backend)
+HISTORY_RETENTION = 50000            # Runs kept per user (SQLite backend)
+MAX_PAGE_SIZE = 500                  # Upper bound on a /history page
+MAX_SCAN = 5000                      # Runs examined per history query, whatever the filters
+HISTORY_FIELDS = ("timestamp", "run_id", "project_name", "status", "mode", "reward", "summary", "test_file")
+
+# Session keys with their own columns/tables; everything else goes to sessions.extra
+SESSION_COLUMNS = ("project_name", "upload_path", "test_file")
+
+def default_state() -> Dict[str, Any]:
+    return {
+        "project_name": None,
+        "upload_path": None,
+        "endpoints": [],
+        "test_file": None,
+        "latest_results": None
+    }
+
+def history_entry(results: Dict[str, Any], state: Dict[str, Any], test_file: Optional[str]) -> Dict[str, Any]:
+    """The run-history record kept for every /run-tests call."""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "run_id": results.get("run_id"),
+        "project_name": state.get("project_name", "Unknown"),
+        "status": "passed" if results.get("status") == "success" else "failed",
+        "mode": results.get("mode", "full"),
+        "reward": results.get("reward", 0),
+        "summary": results.get("summary", {}),
+        "test_file": test_file
+    }
+
+def empty_aggregates() -> Dict[str, Any]:
+    return {"total_runs": 0, "passed_runs": 0, "reward_sum": 0.0, "reward_count": 0, "projects": {}}
+
+def _add_to_aggregates(aggregates: Dict[str, Any], entry: Dict[str, Any]):
+    aggregates["total_runs"] += 1
+    aggregates["passed_runs"] += entry.get("status") == "passed"
+    if entry.get("reward") is not None:
+        aggregates["reward_sum"] += entry["reward"]
+        aggregates["reward_count"] += 1
+    project = entry.get("project_name") or ""
+    aggregates["projects"][project] = aggregates["projects"].get(project, 0) + 1
+
+def summarize_aggregates(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    """Dashboard numbers from running totals (all runs ever recorded, not just retained ones)."""
+    count = aggregates["reward_count"]
+    return {
+        "total_runs": aggregates["total_runs"],
+        "passed_runs": aggregates["passed_runs"],
+        "avg_reward": aggregates["reward_sum"] / count if count else 0,
+        "active_projects": len(aggregates["projects"])
+    }
+
+def encode_cursor(position: Any) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """A position from encode_cursor: [timestamp or segment seq, row id or line]."""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+    if not (isinstance(position, list) and len(position) == 2
+            and isinstance(position[0], (str, int)) and not isinstance(position[0], bool)
+            and isinstance(position[1], int) and not isinstance(position[1], bool)):
+        raise ValueError(f"Invalid history cursor: {cursor!r}")
+    return position[0], position[1]
+
+def _matches(entry: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    if filters.get("project") is not None and entry.get("project_name") != filters["project"]:
+        return False
+    if filters.get("status") is not None and entry.get("status") != filters["status"]:
+        return False
+    timestamp = entry.get("timestamp") or ""
+    if filters.get("since") is not None and timestamp < filters["since"]:
+        return False
+    if filters.get("until") is not None and timestamp >= filters["until"]:
+        return False
+    if filters.get("min_reward") is not None and (entry.get("reward") is None or entry["reward"] < filters["min_reward"]):
+        return False
+    return True
+
+def _project(entry: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    return entry if not fields else {field: entry.get(field) for field in fields}
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared by every process using the same file."""
+    with open(path, "a") as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+def _atomic_write_json(path: str, data: Any, indent: Optional[int] = None):
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=indent)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+class StateRepository(abc.ABC):
+    """
+    Storage for per-user session state, run history and (optionally) Q-value
+    mirrors. main.py only talks to this interface; per-test results belong to
+    RunStatsStore, which shares the SQLite database (see make_run_stats).
+    """
+    @abc.abstractmethod
+    def load_state(self, user_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save_state(self, user_id: str, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_session(self, user_id: str):
+        """Drops the user's session state (run history is persistent)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_run(self, user_id: str, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_runs(self, user_id: str, limit: int = HISTORY_LIMIT) -> List[Dict[str, Any]]:
+        """The latest `limit` history entries, oldest first."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_runs(self, user_id: str):
+        """Every retained history entry, oldest first (for migrations and exports)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def run_aggregates(self, user_id: str) -> Dict[str, Any]:
+        """The raw running totals (see empty_aggregates), including runs retention has dropped."""
+        raise NotImplementedError
+
+    def run_stats(self, user_id: str) -> Dict[str, Any]:
+        """Dashboard aggregates, maintained on write (O(1) to read)."""
+        return summarize_aggregates(self.run_aggregates(user_id))
+
+    @abc.abstractmethod
+    def query_runs(self, user_id: str, limit: int = HISTORY_LIMIT, cursor: Optional[str] = None,
+                   fields: Optional[Sequence[str]] = None, max_scan: int = MAX_SCAN, **filters) -> Dict[str, Any]:
+        """
+        One page of history, newest first: {"history": [...], "next_cursor": str | None}.
+        Filters: project, status, since / until (ISO timestamps, until exclusive)
+        and min_reward. At most `max_scan` runs are examined per call, so a page
+        may come back short with a cursor to continue from.
+        """
+        raise NotImplementedError
+
+    def save_q_values(self, tenant: str, project: str, q_table: Dict[str, Dict[str, float]]):
+        """Backends with queryable storage mirror learned policies here; others ignore it."""
+
+    def load_q_values(self, tenant: str, project: str) -> Dict[str, Dict[str, float]]:
+        """The mirrored policy of one partition ({} if this backend keeps none)."""
+        return {}
+
+    @abc.abstractmethod
+    def users(self) -> List[str]:
+        raise NotImplementedError
+
+class JsonRepository(StateRepository):
+    """
+    File layout: storage/sessions/<user>/system_state.json for state and an
+    append-only log under storage/users/<user>/ for history:
+    run_history.jsonl (active segment), run_history.<seq>.jsonl (rotated
+    segments, at most `max_segments` kept) and run_aggregates.json (running
+    totals updated on every append). State writes are atomic (temp + rename).
+
+    Appends hold run_history.lock, so several server processes sharing the
+    directory neither interleave rotations nor overwrite each other's totals:
+    the totals are re-read under the lock rather than kept in memory.
+    """
+    def __init__(self, sessions_root: str = os.path.join("storage", "sessions"),
+                 users_root: str = os.path.join("storage", "users"),
+                 segment_bytes: int = HISTORY_SEGMENT_BYTES, max_segments: int = HISTORY_SEGMENTS):
+        self.sessions_root = sessions_root
+        self.users_root = users_root
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.history_lock = threading.Lock()
+
+    def state_file(self, user_id: str) -> str:
+        return os.path.join(self.sessions_root, user_id, "system_state.json")
+
+    def history_dir(self, user_id: str) -> str:
+        return os.path.join(self.users_root, user_id)
+
+    def history_file(self, user_id: str) -> str:
+        return os.path.join(self.history_dir(user_id), "run_history.jsonl")
+
+    def load_state(self, user_id):
+        state_file = self.state_file(user_id)
+        if os.path.exists(state_file):
+            try:
+                with open(state_file, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return default_state()
+
+    def save_state(self, user_id, state):
+        state_file = self.state_file(user_id)
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        _atomic_write_json(state_file, state, indent=4)
+
+    def delete_session(self, user_id):
+        state_file = self.state_file(user_id)
+        if os.path.exists(state_file):
+            os.remove(state_file)
+
+    def _segments(self, user_id: str) -> List[str]:
+        """Rotated segments, oldest first."""
+        return sorted(glob.glob(os.path.join(self.history_dir(user_id), "run_history.[0-9]*.jsonl")))
+
+    def _migrate_legacy(self, user_id: str):
+        """Converts a pre-log run_history.json into the active segment (once)."""
+        legacy = os.path.join(self.history_dir(user_id), "run_history.json")
+        if not os.path.exists(legacy) or os.path.exists(self.history_file(user_id)):
+            return
+        try:
+            with open(legacy, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        with open(self.history_file(user_id), "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        os.replace(legacy, legacy + ".migrated")
+
+    def _read_segment(self, path: str) -> List[Optional[Dict[str, Any]]]:
+        """One entry per line; None keeps the line number of a torn (crash mid-append) line."""
+        entries = []
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        entries.append(None)
+        except OSError:
+            pass
+        return entries
+
+    def _positions(self, user_id: str) -> List[Tuple[int, str]]:
+        """(seq, path) oldest first; the active segment gets the seq it will have once rotated."""
+        segments = self._segments(user_id)
+        numbered = [(int(path.rsplit(".", 2)[-2]), path) for path in segments]
+        active_seq = numbered[-1][0] + 1 if numbered else 1
+        return numbered + [(active_seq, self.history_file(user_id))]
+
+    def _iter_newest_first(self, user_id: str, before: Optional[Tuple[int, int]] = None):
+        """
+        (position, entry) newest first, reading one bounded segment at a time.
+        A position is (segment seq, line); it stays valid across appends and
+        rotation, which makes it usable as a pagination cursor.
+        """
+        with self.history_lock:
+            self._migrate_legacy(user_id)
+            positions = self._positions(user_id)
+        for seq, path in reversed(positions):
+            if before is not None and seq > before[0]:
+                continue
+            entries = self._read_segment(path)
+            end = min(before[1], len(entries)) if before is not None and seq == before[0] else len(entries)
+            for line in range(end - 1, -1, -1):
+                if entries[line] is not None:
+                    yield (seq, line), entries[line]
+
+    def append_run(self, user_id, entry):
+        directory = self.history_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        with self.history_lock, _file_lock(os.path.join(directory, "run_history.lock")):
+            self._migrate_legacy(user_id)
+            aggregates = self._load_aggregates(user_id)
+            history_file = self.history_file(user_id)
+            with open(history_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            _add_to_aggregates(aggregates, entry)
+            _atomic_write_json(os.path.join(directory, "run_aggregates.json"), aggregates)
+            if os.path.getsize(history_file) >= self.segment_bytes:
+                self._rotate(user_id)
+
+    def _rotate(self, user_id: str):
+        segments = self._segments(user_id)
+        last = int(segments[-1].rsplit(".", 2)[-2]) if segments else 0
+        os.replace(self.history_file(user_id),
+                   os.path.join(self.history_dir(user_id), f"run_history.{last + 1:06d}.jsonl"))
+        for old in segments[:max(0, len(segments) + 1 - self.max_segments)]:
+            os.remove(old)  # Retention: aggregates keep counting what is dropped here
+
+    def _load_aggregates(self, user_id: str) -> Dict[str, Any]:
+        """Running totals as last written by any process; rebuilt from the log if the file is missing."""
+        path = os.path.join(self.history_dir(user_id), "run_aggregates.json")
+        aggregates = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    aggregates = json.load(f)
+            except (OSError, ValueError):
+                aggregates = None
+        if aggregates is None:
+            aggregates = empty_aggregates()
+            self._migrate_legacy(user_id)
+            for segment in self._segments(user_id) + [self.history_file(user_id)]:
+                for entry in self._read_segment(segment):
+                    if entry is not None:
+                        _add_to_aggregates(aggregates, entry)
+        return aggregates
+
+    def iter_runs(self, user_id):
+        with self.history_lock:
+            self._migrate_legacy(user_id)
+            positions = self._positions(user_id)
+        for _, path in positions:
+            for entry in self._read_segment(path):
+                if entry is not None:
+                    yield entry
+
+    def list_runs(self, user_id, limit=HISTORY_LIMIT):
+        newest = []
+        for _, entry in self._iter_newest_first(user_id):
+            if len(newest) >= limit:
+                break
+            newest.append(entry)
+        return newest[::-1]
+
+    def query_runs(self, user_id, limit=HISTORY_LIMIT, cursor=None, fields=None, max_scan=MAX_SCAN, **filters):
+        before = decode_cursor(cursor) if cursor else None
+        if before is not None and not isinstance(before[0], int):
+            raise ValueError(f"Invalid history cursor: {cursor!r}")
+        page, scanned, position = [], 0, None
+        for position, entry in self._iter_newest_first(user_id, before):
+            if filters.get("since") and (entry.get("timestamp") or "") < filters["since"]:
+                return {"history": page, "next_cursor": None}  # The log is in time order: nothing older matches
+            scanned += 1
+            if _matches(entry, filters):
+                page.append(_project(entry, fields))
+                if len(page) == limit:
+                    return {"history": page, "next_cursor": encode_cursor(position)}
+            if scanned >= max_scan:
+                return {"history": page, "next_cursor": encode_cursor(position)}
+        return {"history": page, "next_cursor": None}
+
+    def run_aggregates(self, user_id):
+        with self.history_lock:
+            return self._load_aggregates(user_id)
+
+    def users(self):
+        found = {os.path.basename(os.path.dirname(p)) for p in glob.glob(os.path.join(self.sessions_root, "*", "system_state.json"))}
+        for pattern in ("run_history.json", "run_history.jsonl"):
+            found |= {os.path.basename(os.path.dirname(p)) for p in glob.glob(os.path.join(self.users_root, "*", pattern))}
+        return sorted(found)
+
+# Per-test outcomes and durations of every executed case, queried by RunStatsStore
+# (slowest tests, trends, flakiness); it shares this database when the backend is SQLite
+TEST_RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS test_results (
+    project TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL NOT NULL,
+    file_hash TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_project_test ON test_results (project, nodeid, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_project_time ON test_results (project, timestamp);
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id TEXT PRIMARY KEY,
+    project_name TEXT,
+    upload_path TEXT,
+    test_file TEXT,
+    endpoints_hash TEXT,
+    extra TEXT NOT NULL DEFAULT '{}',
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    method TEXT,
+    path TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, position)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    run_id TEXT,
+    timestamp TEXT NOT NULL,
+    project_name TEXT,
+    status TEXT,
+    mode TEXT,
+    reward REAL,
+    summary TEXT,
+    test_file TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_user_time ON runs (user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_runs_user_project ON runs (user_id, project_name, timestamp);
+CREATE TABLE IF NOT EXISTS run_aggregates (
+    user_id TEXT PRIMARY KEY,
+    total_runs INTEGER NOT NULL,
+    passed_runs INTEGER NOT NULL,
+    reward_sum REAL NOT NULL,
+    reward_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_projects (
+    user_id TEXT NOT NULL,
+    project_name TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    PRIMARY KEY (user_id, project_name)
+);
+CREATE TABLE IF NOT EXISTS q_values (
+    tenant TEXT NOT NULL,
+    project TEXT NOT NULL,
+    state TEXT NOT NULL,
+    action TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (tenant, project, state, action)
+);
+""" + TEST_RESULTS_SCHEMA
+
+class SqliteRepository(StateRepository):
+    """
+    Embedded SQLite in WAL mode (readers never block the writer), one
+    connection per thread. Endpoints are only rewritten when the scanned
+    catalog changes; runs keep up to `max_runs` rows per user, while the
+    run_aggregates/run_projects totals are updated in the same transaction as
+    each insert and count every run ever recorded.
+    """
+    def __init__(self, db_path: str = os.path.join("storage", "app.db"), max_runs: int = HISTORY_RETENTION):
+        self.db_path = db_path
+        self.max_runs = max_runs
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._drop_run_test_results(conn)
+        conn.executescript(SCHEMA)
+        self._backfill_aggregates(conn)
+
+    def _drop_run_test_results(self, conn: sqlite3.Connection):
+        """
+        Earlier databases kept a second, per-run copy of the per-test rows that
+        RunStatsStore also stored; that copy is dropped for the shared table.
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(test_results)")}
+        if "run" in columns:
+            with conn:
+                conn.execute("DROP TABLE test_results")
+
+    def connection(self) -> sqlite3.Connection:
+        """This thread's connection, for stores sharing the database (see make_run_stats)."""
+        return self._conn()
+
+    def _backfill_aggregates(self, conn: sqlite3.Connection):
+        """Databases created before the aggregate tables existed get them computed once."""
+        with conn:
+            if conn.execute("SELECT 1 FROM run_aggregates LIMIT 1").fetchone() is None:
+                conn.execute("""
+                    INSERT INTO run_aggregates (user_id, total_runs, passed_runs, reward_sum, reward_count)
+                    SELECT user_id, COUNT(*), SUM(status = 'passed'), COALESCE(SUM(reward), 0), COUNT(reward)
+                    FROM runs GROUP BY user_id
+                """)
+                conn.execute("""
+                    INSERT INTO run_projects (user_id, project_name, runs)
+                    SELECT user_id, COALESCE(project_name, ''), COUNT(*) FROM runs GROUP BY 1, 2
+                """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; fsync at checkpoints
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def load_state(self, user_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT project_name, upload_path, test_file, extra FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return default_state()
+        state = default_state()
+        state.update(json.loads(row[3]))
+        state.update(dict(zip(SESSION_COLUMNS, row[:3])))
+        state["endpoints"] = [json.loads(data) for (data,) in conn.execute(
+            "SELECT data FROM endpoints WHERE user_id = ? ORDER BY position", (user_id,))]
+        return state
+
+    def save_state(self, user_id, state):
+        endpoints = state.get("endpoints") or []
+        encoded = [json.dumps(ep, sort_keys=True) for ep in endpoints]
+        endpoints_hash = hashlib.sha1("\n".join(encoded).encode("utf-8")).hexdigest()
+        extra = {k: v for k, v in state.items() if k not in SESSION_COLUMNS and k != "endpoints"}
+
+        conn = self._conn()
+        with conn:
+            previous = conn.execute("SELECT endpoints_hash FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+            conn.execute("""
+                INSERT INTO sessions (user_id, project_name, upload_path, test_file, endpoints_hash, extra, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET project_name = excluded.project_name,
+                    upload_path = excluded.upload_path, test_file = excluded.test_file,
+                    endpoints_hash = excluded.endpoints_hash, extra = excluded.extra, updated_at = excluded.updated_at
+            """, (user_id, *(state.get(c) for c in SESSION_COLUMNS), endpoints_hash, json.dumps(extra),
+                  datetime.now().isoformat()))
+            if previous is None or previous[0] != endpoints_hash:
+                conn.execute("DELETE FROM endpoints WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO endpoints (user_id, position, method, path, data) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, i, ep.get("method"), ep.get("path"), data)
+                     for i, (ep, data) in enumerate(zip(endpoints, encoded))]
+                )
+
+    def delete_session(self, user_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            conn.execute("DELETE FROM endpoints WHERE user_id = ?", (user_id,))
+
+    def append_run(self, user_id, entry):
+        conn = self._conn()
+        with conn:
+            self._insert_run(conn, user_id, entry)
+            reward = entry.get("reward")
+            conn.execute("""
+                INSERT INTO run_aggregates (user_id, total_runs, passed_runs, reward_sum, reward_count)
+                VALUES (?, 1, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET total_runs = total_runs + 1,
+                    passed_runs = passed_runs + excluded.passed_runs,
+                    reward_sum = reward_sum + excluded.reward_sum,
+                    reward_count = reward_count + excluded.reward_count
+            """, (user_id, int(entry.get("status") == "passed"), reward or 0.0, int(reward is not None)))
+            conn.execute("""
+                INSERT INTO run_projects (user_id, project_name, runs) VALUES (?, ?, 1)
+                ON CONFLICT (user_id, project_name) DO UPDATE SET runs = runs + 1
+            """, (user_id, entry.get("project_name") or ""))
+            self._apply_retention(conn, user_id)
+
+    def _insert_run(self, conn: sqlite3.Connection, user_id: str, entry: Dict[str, Any]):
+        conn.execute("""
+                INSERT INTO runs (user_id, run_id, timestamp, project_name, status, mode, reward, summary, test_file)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, entry.get("run_id"), entry.get("timestamp") or datetime.now().isoformat(),
+                  entry.get("project_name"), entry.get("status"), entry.get("mode"), entry.get("reward"),
+                  json.dumps(entry.get("summary") or {}), entry.get("test_file")))
+
+    def _apply_retention(self, conn: sqlite3.Connection, user_id: str):
+        conn.execute("""
+            DELETE FROM runs WHERE user_id = ? AND id <= (
+                SELECT id FROM runs WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+        """, (user_id, user_id, self.max_runs))
+
+    def iter_runs(self, user_id):
+        for row in self._conn().execute("""
+            SELECT timestamp, run_id, project_name, status, mode, reward, summary, test_file
+            FROM runs WHERE user_id = ? ORDER BY id
+        """, (user_id,)):
+            entry = dict(zip(HISTORY_FIELDS, row))
+            entry["summary"] = json.loads(entry["summary"] or "{}")
+            yield entry
+
+    def list_runs(self, user_id, limit=HISTORY_LIMIT):
+        rows = self._conn().execute("""
+            SELECT timestamp, run_id, project_name, status, mode, reward, summary, test_file
+            FROM runs WHERE user_id = ? ORDER BY id DESC LIMIT ?
+        """, (user_id, limit)).fetchall()
+        return [{
+            "timestamp": ts, "run_id": run_id, "project_name": project, "status": status, "mode": mode,
+            "reward": reward, "summary": json.loads(summary or "{}"), "test_file": test_file
+        } for ts, run_id, project, status, mode, reward, summary, test_file in reversed(rows)]
+
+    def query_runs(self, user_id, limit=HISTORY_LIMIT, cursor=None, fields=None, max_scan=MAX_SCAN, **filters):
+        # Keyset pagination on (timestamp, id) over idx_runs_user_time / idx_runs_user_project;
+        # the range part runs in the index, status/reward are checked on at most max_scan rows
+        where, params = ["user_id = ?"], [user_id]
+        if filters.get("project") is not None:
+            where.append("project_name = ?")
+            params.append(filters["project"])
+        if filters.get("since") is not None:
+            where.append("timestamp >= ?")
+            params.append(filters["since"])
+        if filters.get("until") is not None:
+            where.append("timestamp < ?")
+            params.append(filters["until"])
+        if cursor:
+            timestamp, run = decode_cursor(cursor)
+            if not isinstance(timestamp, str):
+                raise ValueError(f"Invalid history cursor: {cursor!r}")
+            where.append("(timestamp < ? OR (timestamp = ? AND id < ?))")
+            params += [timestamp, timestamp, run]
+
+        conn = self._conn()
+        scanned = conn.execute(f"""
+            SELECT id, timestamp, status, reward FROM runs WHERE {' AND '.join(where)}
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        """, (*params, max_scan)).fetchall()
+
+        selected, next_cursor = [], None
+        for run, timestamp, status, reward in scanned:
+            if _matches({"status": status, "reward": reward},
+                        {"status": filters.get("status"), "min_reward": filters.get("min_reward")}):
+                selected.append(run)
+                if len(selected) == limit:
+                    next_cursor = encode_cursor([timestamp, run])
+                    break
+        else:
+            if len(scanned) == max_scan:
+                next_cursor = encode_cursor(list(scanned[-1][:2]))
+
+        columns = [f for f in (fields or HISTORY_FIELDS) if f in HISTORY_FIELDS]
+        rows = {}
+        for start in range(0, len(selected), 500):
+            chunk = selected[start:start + 500]
+            for row in conn.execute(
+                    f"SELECT id, {', '.join(columns)} FROM runs WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                entry = dict(zip(columns, row[1:]))
+                if "summary" in entry:
+                    entry["summary"] = json.loads(entry["summary"] or "{}")
+                rows[row[0]] = entry
+        return {"history": [rows[run] for run in selected if run in rows], "next_cursor": next_cursor}
+
+    def run_aggregates(self, user_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT total_runs, passed_runs, reward_sum, reward_count FROM run_aggregates WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        aggregates = empty_aggregates()
+        if row is not None:
+            aggregates.update(zip(("total_runs", "passed_runs", "reward_sum", "reward_count"), row))
+            aggregates["projects"] = dict(conn.execute(
+                "SELECT project_name, runs FROM run_projects WHERE user_id = ?", (user_id,)).fetchall())
+        return aggregates
+
+    def save_q_values(self, tenant, project, q_table):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM q_values WHERE tenant = ? AND project = ?", (tenant, project))
+            conn.executemany(
+                "INSERT INTO q_values (tenant, project, state, action, value) VALUES (?, ?, ?, ?, ?)",
+                [(tenant, project, state, action, value)
+                 for state, row in q_table.items() for action, value in row.items()]
+            )
+
+    def load_q_values(self, tenant, project):
+        table: Dict[str, Dict[str, float]] = {}
+        for state, action, value in self._conn().execute(
+                "SELECT state, action, value FROM q_values WHERE tenant = ? AND project = ?", (tenant, project)):
+            table.setdefault(state, {})[action] = value
+        return table
+
+    def users(self):
+        return [u for (u,) in self._conn().execute(
+            "SELECT user_id FROM sessions UNION SELECT DISTINCT user_id FROM runs ORDER BY 1")]
+
+    def import_from(self, source: StateRepository) -> Dict[str, int]:
+        """
+        Copies every session, the whole run history and its running totals from
+        another backend (e.g. the JSON files). The totals are carried over as
+        they are, since they also count runs the source's retention has dropped.
+        """
+        counts = {"sessions": 0, "runs": 0}
+        conn = self._conn()
+        for user_id in source.users():
+            state = source.load_state(user_id)
+            if state != default_state():
+                self.save_state(user_id, state)
+                counts["sessions"] += 1
+            aggregates = source.run_aggregates(user_id)
+            with conn:
+                for entry in source.iter_runs(user_id):
+                    self._insert_run(conn, user_id, entry)
+                    counts["runs"] += 1
+                self._apply_retention(conn, user_id)
+                conn.execute("DELETE FROM run_aggregates WHERE user_id = ?", (user_id,))
+                conn.execute("DELETE FROM run_projects WHERE user_id = ?", (user_id,))
+                if aggregates["total_runs"]:
+                    conn.execute("""
+                        INSERT INTO run_aggregates (user_id, total_runs, passed_runs, reward_sum, reward_count)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (user_id, aggregates["total_runs"], aggregates["passed_runs"],
+                          aggregates["reward_sum"], aggregates["reward_count"]))
+                    conn.executemany("INSERT INTO run_projects (user_id, project_name, runs) VALUES (?, ?, ?)",
+                                     [(user_id, project, runs) for project, runs in aggregates["projects"].items()])
+        return counts
+
+def make_repository(backend: Optional[str] = None, db_path: str = os.path.join("storage", "app.db")) -> StateRepository:
+    """
+    The backend named by STORAGE_BACKEND. A fresh SQLite database is populated
+    from the JSON files on first start, so switching backends keeps existing data.
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND") or DEFAULT_BACKEND).lower()
+    if backend == "json":
+        return JsonRepository()
+    if backend != "sqlite":
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'sqlite' or 'json')")
+    fresh = not os.path.exists(db_path)
+    repository = SqliteRepository(db_path)
+    if fresh:
+        counts = repository.import_from(JsonRepository())
+        if counts["sessions"] or counts["runs"]:
+            print(f"[Storage] Migrated {counts['sessions']} sessions and {counts['runs']} runs from JSON to {db_path}")
+    return repository
+
+if __name__ == "__main__":
+    # Explicit migration: python -m app.agents.repository [db_path]
+    import sys
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join("storage", "app.db")
+    counts = SqliteRepository(target).import_from(JsonRepository())
+    print(f"Imported {counts['sessions']} sessions and {counts['runs']} runs into {target}")
@@ -0,0 +1,120 @@
+import ast
+from typing import Dict, Any, List, Optional, Tuple
+from .fix_cache import endpoint_patterns
+from .code_slicer import match_endpoint
+
+DEFAULT_ACTION = "standard"
+
+# Test-name hints for suites generated before tests carried an action marker
+ACTION_HINTS = [
+    ("sql", "sql_injection"),
+    ("null", "null_injection"),
+    ("overflow", "overflow"),
+    ("too_long", "overflow"),
+    ("large", "overflow"),
+    ("type_mismatch", "type_mismatch"),
+    ("wrong_type", "type_mismatch"),
+    ("invalid_type", "type_mismatch"),
+]
+
+# Per-case rewards, consistent with TestExecutor._calculate_reward for whole suites
+CASE_REWARDS = {"passed": 1.0, "failed": -5.0, "timeout": -5.0, "error": -10.0}
+SERVER_ERROR_BONUS = 10.0  # The mutation made the endpoint crash: that's what we are hunting for
+
+def endpoint_key(method: str, path: str) -> str:
+    """RL state for one route: 'GET /users/:id'."""
+    return f"{method.upper()} {path}"
+
+def _marker(node: ast.AST, name: str) -> Optional[List[Any]]:
+    """Literal args of @pytest.mark.<name>(...) on a test, if present."""
+    for decorator in getattr(node, "decorator_list", []):
+        if isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Attribute) \
+                and decorator.func.attr == name:
+            try:
+                return [ast.literal_eval(arg) for arg in decorator.args]
+            except ValueError:
+                return None
+    return None
+
+def _action_for(node: ast.AST, actions: List[str]) -> str:
+    marked = _marker(node, "action")
+    if marked and marked[0] in actions:
+        return marked[0]
+    name = node.name.lower()
+    for hint, action in ACTION_HINTS:
+        if hint in name and action in actions:
+            return action
+    return DEFAULT_ACTION
+
+def _test_nodes(tree: ast.Module):
+    """('test_x', node) and ('TestApi::test_y', node) for every test in the module."""
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            yield node.name, node, []
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) and child.name.startswith("test"):
+                    yield f"{node.name}::{child.name}", child, [node]
+
+def map_tests_to_endpoints(test_source: str, endpoints: List[Dict[str, Any]],
+                           actions: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Maps each test to the scanned routes it exercises and the RL action it embodies.
+    @pytest.mark.endpoint("GET", "/users/:id") / @pytest.mark.action("overflow")
+    markers win; otherwise routes come from the URLs the test requests.
+    """
+    tree = ast.parse(test_source)
+    mapping = {}
+    for key, node, parents in _test_nodes(tree):
+        routes = []
+        marked = _marker(node, "endpoint")
+        for parent in parents:
+            marked = marked or _marker(parent, "endpoint")  # Class-level marker applies to its methods
+        if marked and len(marked) == 2:
+            routes.append(endpoint_key(*marked))
+        else:
+            for pattern in endpoint_patterns(ast.unparse(node)):
+                endpoint = match_endpoint(pattern, endpoints)
+                if endpoint is not None:
+                    routes.append(endpoint_key(endpoint["method"], endpoint["path"]))
+        mapping[key] = {"endpoints": sorted(set(routes)), "action": _action_for(node, actions)}
+    return mapping
+
+def _case_reward(outcome: str, message: Optional[str]) -> float:
+    reward = CASE_REWARDS.get(outcome, 0.0)
+    if outcome in ("failed", "error") and message and "500" in message:
+        reward += SERVER_ERROR_BONUS
+    return reward
+
+def attribute_rewards(test_source: str, results: Dict[str, Any], endpoints: List[Dict[str, Any]],
+                      actions: List[str]) -> List[Dict[str, Any]]:
+    """
+    Splits a run's outcome into one reward per (endpoint, action), from the
+    per-case results. A test touching several routes credits each of them;
+    routes no test touched get no update at all.
+
+    Partial reruns (results with "selected") report cases merged with their
+    baseline; only the cases that actually ran (those with a duration) are
+    rewarded, so carried-over outcomes are not counted twice.
+    """
+    mapping = map_tests_to_endpoints(test_source, endpoints, actions)
+    messages = {f.get("case"): f.get("message") for f in results.get("failures", [])}
+    cases = results.get("cases") or {}
+    if "selected" in results:
+        ran = results.get("durations") or {}
+        cases = {case: outcome for case, outcome in cases.items() if case in ran}
+
+    totals: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for case, outcome in cases.items():
+        base = case.split("[")[0]
+        test = mapping.get(base)
+        if not test:
+            continue
+        reward = _case_reward(outcome, messages.get(case))
+        for route in test["endpoints"]:
+            entry = totals.setdefault((route, test["action"]), {
+                "endpoint": route, "action": test["action"], "reward": 0.0, "tests": []
+            })
+            entry["reward"] += reward
+            entry["tests"].append(case)
+    return list(totals.values())
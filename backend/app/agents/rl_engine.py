@@ -1,41 +1,62 @@
-import random
-import json
 import os
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from .q_store import QTableStore, COUNT
+from .policies import Policy, make_policy
+from .mutations import MutationCatalog
 
 class RLEngine:
-    def __init__(self, storage_path: str = "storage/q_table.json"):
-        self.storage_path = storage_path
-        self.epsilon = 0.3  # Exploration rate (30% chance to try random new things)
-        self.alpha = 0.1    # Learning rate
-        self.gamma = 0.9    # Discount factor
-        
-        # Define the "Actions" our Agent can take to attack the API
-        self.actions = [
-            "standard",       # Run the test as generated (Happy Path)
-            "null_injection", # Send null values for required fields
-            "sql_injection",  # Try ' OR 1=1 -- types of attacks
-            "overflow",       # Send massive strings (>10kb)
-            "type_mismatch"   # Send integers instead of strings
-        ]
-        
-        self.q_table = self._load_q_table()
-
-    def _load_q_table(self) -> Dict[str, Dict[str, float]]:
+    # The "Actions" our Agent can take to attack the API
+    ACTIONS = [
+        "standard",       # Run the test as generated (Happy Path)
+        "null_injection", # Send null values for required fields
+        "sql_injection",  # Try ' OR 1=1 -- types of attacks
+        "overflow",       # Send massive strings (>10kb)
+        "type_mismatch"   # Send integers instead of strings
+    ]
+
+    def __init__(self, storage_path: Optional[str] = "storage/q_table.json", storage_dir: str = "storage/q_table",
+                 policy: Optional[str] = None):
+        self.storage_path = storage_path  # Legacy JSON table, migrated on first start (None: no migration)
+        # Exploration strategy: ucb1 (default), epsilon_greedy, decaying_epsilon, thompson_beta, thompson_gaussian
+        self.policy: Policy = make_policy(policy or os.getenv("RL_POLICY"))
+        self.alpha = 0.1    # Step-size floor: early visits average exactly, later ones track drift
+        self.gamma = 0.0    # Probes don't change the endpoint's state: this is a bandit, nothing to bootstrap
+        self.actions = list(self.ACTIONS)
+        self.rng = np.random.default_rng()
+        self.mutations = MutationCatalog()  # Each RL action samples a family of typed operators
+
+        self.store = self._load_q_table(storage_dir)
+
+    def _load_q_table(self, storage_dir: str) -> QTableStore:
         """
-        Loads the Q-Table from disk so learning persists between runs.
-        Structure: { "endpoint_path": { "action1": 0.0, "action2": 5.0 } }
+        Loads the array-backed Q-Table so learning persists between runs.
+        Rows are endpoint paths, columns are self.actions.
         """
-        if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r') as f:
-                return json.load(f)
-        return {}
+        store = QTableStore(self.actions, storage_dir)
+        if len(store) == 0 and self.storage_path and os.path.exists(self.storage_path):
+            imported = store.import_json(self.storage_path)
+            store.save()
+            print(f"[RL] Migrated {imported} states from {self.storage_path} to {storage_dir}")
+        return store
+
+    @property
+    def epsilon(self) -> Optional[float]:
+        """Exploration rate of epsilon-style policies (None for UCB/Thompson)."""
+        return getattr(self.policy, "epsilon", None)
+
+    @epsilon.setter
+    def epsilon(self, value: float):
+        self.policy.epsilon = value
+
+    @property
+    def q_table(self) -> Dict[str, Dict[str, float]]:
+        """Read-only { "endpoint_path": { "action": q } } view of the store."""
+        return self.store.to_dict()
 
     def save_q_table(self):
-        """Persists the agent's knowledge."""
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.q_table, f, indent=4)
+        """Persists the agent's knowledge (a full snapshot; updates are journaled in between)."""
+        self.store.save()
 
     def get_state(self, endpoint_path: str) -> str:
         """
@@ -45,85 +66,79 @@ class RLEngine:
 
     def choose_action(self, endpoint_path: str) -> str:
         """
-        Epsilon-Greedy Strategy:
-        - With probability epsilon, explore a random mutation.
-        - Otherwise, exploit the best known strategy for this endpoint.
+        Delegates to the configured policy. With the default UCB1 strategy:
+        - Every untried mutation is tried once first.
+        - Then pick the best mean reward plus a bonus that shrinks with visits.
         """
-        state = self.get_state(endpoint_path)
-        
-        # Initialize state in Q-table if new
-        if state not in self.q_table:
-            self.q_table[state] = {action: 0.0 for action in self.actions}
-
-        # Exploration: Try something random
-        if random.random() < self.epsilon:
-            return random.choice(self.actions)
-        
-        # Exploitation: Choose the action with the highest Q-value
-        q_values = self.q_table[state]
-        best_action = max(q_values, key=q_values.get)
-        return best_action
+        return self.choose_actions([endpoint_path])[0]
+
+    def choose_actions(self, endpoint_paths: List[str]) -> List[str]:
+        """Policy choice over a whole endpoint set in one vectorized pass."""
+        if not endpoint_paths:
+            return []
+        ids = self.store.intern([self.get_state(p) for p in endpoint_paths])
+        with self.store.lock:
+            q, stats = self.store.values[ids], self.store.stats[ids]
+        chosen = self.policy.select(q, stats, self.rng)
+        return [self.actions[i] for i in chosen]
 
     def update_policy(self, endpoint_path: str, action: str, reward: float):
         """
-        Updates the Q-Value using the Bellman Equation:
-        Q(s,a) = Q(s,a) + alpha * (reward + gamma * max(Q(s',a')) - Q(s,a))
+        Updates the Q-Value as an incremental mean of the observed rewards:
+        Q(s,a) = Q(s,a) + max(1/n, alpha) * (reward + gamma * max(Q(s,a')) - Q(s,a)), gamma = 0
         """
-        state = self.get_state(endpoint_path)
-        
-        if state not in self.q_table:
-            self.q_table[state] = {a: 0.0 for a in self.actions}
-            
-        current_q = self.q_table[state][action]
-        
-        # Since the 'next state' is the same endpoint (just the next iteration),
-        # we look at the max Q-value for this state currently.
-        max_future_q = max(self.q_table[state].values())
-        
-        # Calculate new Q-value
-        new_q = current_q + self.alpha * (reward + (self.gamma * max_future_q) - current_q)
-        self.q_table[state][action] = new_q
-        
-        self.save_q_table()
+        new_q = self.update_policies([endpoint_path], [action], [reward])[0]
         print(f"RL Update for {endpoint_path} | Action: {action} | Reward: {reward} | New Q-Val: {new_q:.2f}")
 
+    def update_policies(self, endpoint_paths: List[str], actions: List[str], rewards: List[float]) -> List[float]:
+        """
+        Batched update (see update_policy). A probe doesn't move the endpoint to
+        another state, so with gamma = 0 Q(s,a) is the running mean reward of the
+        action, with step 1/n for its n-th observation, floored at alpha so old
+        results fade once the API changes. Repeated (endpoint, action) pairs are
+        applied in order, one round per repetition.
+        """
+        if not endpoint_paths:
+            return []
+        ids = self.store.intern([self.get_state(p) for p in endpoint_paths])
+        action_ids = self.store.ids_for_actions(actions)
+        rewards = np.asarray(rewards, dtype=np.float32)
+
+        # Occurrence rank of each row within the batch; rows repeat only across rounds
+        rounds = np.zeros(len(ids), dtype=np.int64)
+        seen: Dict[int, int] = {}
+        for i, row in enumerate(ids.tolist()):
+            rounds[i] = seen.get(row, 0)
+            seen[row] = rounds[i] + 1
+
+        new_values = np.empty(len(ids), dtype=np.float32)
+        with self.store.lock:
+            for r in range(int(rounds.max()) + 1):
+                mask = rounds == r
+                rows, cols = ids[mask], action_ids[mask]
+                values = self.store.values
+                current_q = values[rows, cols]
+                max_future_q = values[rows].max(axis=1)
+                visits = self.store.stats[rows, cols, COUNT] + 1
+                step = np.maximum(1.0 / visits, self.alpha)
+                updated = current_q + step * (rewards[mask] + self.gamma * max_future_q - current_q)
+                self.store.record(rows, cols, updated, rewards[mask])
+                new_values[mask] = updated
+
+        # Persisted write-behind: journaled now, folded into a snapshot by the store's flusher
+        return new_values.tolist()
+
     def generate_mutation_payload(self, schema: Dict[str, Any], action: str) -> Dict[str, Any]:
         """
         Applies the chosen RL Action to mutate the request payload.
         This is called by the Test Generator/Executor before sending a request.
         """
-        payload = {}
-        
-        # Basic valid payload generation (simplified)
-        for key, value_type in schema.items():
-            payload[key] = "test_string" # Default
-        
-        # Apply RL Mutation Logic
-        if action == "standard":
-            pass # Keep default valid data
-            
-        elif action == "null_injection":
-            # Set a random field to None
-            if payload:
-                target_key = random.choice(list(payload.keys()))
-                payload[target_key] = None
-                
-        elif action == "sql_injection":
-            if payload:
-                target_key = random.choice(list(payload.keys()))
-                payload[target_key] = "' OR '1'='1"
-                
-        elif action == "overflow":
-            if payload:
-                target_key = random.choice(list(payload.keys()))
-                payload[target_key] = "A" * 10000
-                
-        elif action == "type_mismatch":
-            if payload:
-                target_key = random.choice(list(payload.keys()))
-                payload[target_key] = 12345 # Send int where string is expected
-                
-        return payload
+        return self.mutations.generate(schema, action, 1)[0]["body"]
+
+    def generate_mutations(self, schema: Dict[str, Any], action: str, n: int = 1,
+                           seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """N schema-aware mutations (body, query and headers) for one RL action; see MutationCatalog."""
+        return self.mutations.generate(schema, action, n, seed)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+from .repository import StateRepository, SqliteRepository, TEST_RESULTS_SCHEMA
+
+LEGACY_DB = os.path.join("storage", "test_stats.db")
+
+class RunStatsStore:
+    """
+    Per-test durations and outcomes for every run, indexed by project and test,
+    used for slow-test, trend and flakiness reporting. With `connect` the rows
+    live in that database (the repository's test_results table, on its
+    per-thread connection); otherwise in a file of their own at `db_path`.
+    """
+    def __init__(self, db_path: str = LEGACY_DB, connect: Optional[Callable[[], sqlite3.Connection]] = None):
+        self.db_path = db_path
+        self.shared = connect
+        if connect is None:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(TEST_RESULTS_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        if self.shared is not None:
+            conn = self.shared()
+            with conn:  # The owner keeps the connection open
+                yield conn
+            return
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:  # Commits on success
+                yield conn
+        finally:
+            conn.close()
+
+    def import_file(self, db_path: str) -> int:
+        """
+        Moves the rows of a standalone stats database into this store once; the
+        file is renamed to <db_path>.imported so restarts don't copy it again.
+        """
+        if self.shared is None or not os.path.exists(db_path):
+            return 0
+        source = sqlite3.connect(db_path, timeout=30)
+        try:
+            rows = source.execute(
+                "SELECT project, run_id, nodeid, outcome, duration, file_hash, timestamp FROM test_results").fetchall()
+        finally:
+            source.close()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO test_results (project, run_id, nodeid, outcome, duration, file_hash, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        os.replace(db_path, db_path + ".imported")
+        return len(rows)
+
+    def record_run(self, project: str, results: Dict[str, Any]):
+        """Stores one row per test case that was actually executed in this run."""
+        durations = results.get("durations") or {}
+        outcomes = results.get("cases") or {}
+        timestamp = datetime.now().isoformat()
+        rows = [
+            (project, results.get("run_id"), nodeid, outcomes.get(nodeid, "unknown"), duration,
+             results.get("file_hash"), timestamp)
+            for nodeid, duration in durations.items()
+        ]
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO test_results (project, run_id, nodeid, outcome, duration, file_hash, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def average_durations(self, project: str, last_n_runs: int = 20) -> Dict[str, float]:
+        """Mean duration per test over its most recent runs (for scheduling/sharding)."""
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT nodeid, AVG(duration) FROM (
+                    SELECT nodeid, duration,
+                           ROW_NUMBER() OVER (PARTITION BY nodeid ORDER BY timestamp DESC, rowid DESC) AS rn
+                    FROM test_results WHERE project = ?
+                ) WHERE rn <= ? GROUP BY nodeid
+            """, (project, last_n_runs)).fetchall()
+        return {nodeid: avg for nodeid, avg in rows}
+
+    def slowest_tests(self, project: str, limit: int = 10, last_n_runs: int = 20) -> List[Dict[str, Any]]:
+        averages = self.average_durations(project, last_n_runs)
+        ranked = sorted(averages.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"nodeid": nodeid, "avg_duration": round(avg, 4)} for nodeid, avg in ranked]
+
+    def duration_trend(self, project: str, nodeid: str, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT timestamp, duration, outcome FROM test_results
+                WHERE project = ? AND nodeid = ? ORDER BY timestamp DESC, rowid DESC LIMIT ?
+            """, (project, nodeid, limit)).fetchall()
+        return [{"timestamp": ts, "duration": d, "outcome": o} for ts, d, o in reversed(rows)]
+
+    def flakiness(self, project: str) -> Dict[str, float]:
+        """
+        Flakiness score per test: how often the outcome flipped between consecutive
+        runs of the *same* test file (identical file hash), in [0, 1]. Outcome
+        changes across different file versions are edits, not flakiness.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("""
+                SELECT nodeid, file_hash, outcome FROM test_results
+                WHERE project = ? AND outcome IN ('passed', 'failed', 'error')
+                ORDER BY nodeid, file_hash, timestamp, rowid
+            """, (project,)).fetchall()
+
+        flips: Dict[str, int] = {}
+        pairs: Dict[str, int] = {}
+        previous = None
+        for nodeid, file_hash, outcome in rows:
+            passed = outcome == "passed"
+            if previous and previous[:2] == (nodeid, file_hash):
+                pairs[nodeid] = pairs.get(nodeid, 0) + 1
+                if previous[2] != passed:
+                    flips[nodeid] = flips.get(nodeid, 0) + 1
+            previous = (nodeid, file_hash, passed)
+
+        return {nodeid: flips.get(nodeid, 0) / count for nodeid, count in pairs.items()}
+
+    def report(self, project: str, limit: int = 10) -> Dict[str, Any]:
+        slowest = self.slowest_tests(project, limit)
+        flaky = sorted(self.flakiness(project).items(), key=lambda item: item[1], reverse=True)
+        return {
+            "project": project,
+            "slowest": slowest,
+            "trends": {entry["nodeid"]: self.duration_trend(project, entry["nodeid"]) for entry in slowest},
+            "flaky": [{"nodeid": nodeid, "score": round(score, 3)} for nodeid, score in flaky if score > 0][:limit]
+        }
+
+def make_run_stats(repository: StateRepository) -> RunStatsStore:
+    """
+    Stats on the repository's own database and connection when it is SQLite
+    (rows from an older standalone test_stats.db are imported on first start);
+    the JSON backend keeps them in test_stats.db.
+    """
+    if not isinstance(repository, SqliteRepository):
+        return RunStatsStore()
+    store = RunStatsStore(connect=repository.connection)
+    imported = store.import_file(LEGACY_DB)
+    if imported:
+        print(f"[Storage] Imported {imported} per-test results from {LEGACY_DB} into {repository.db_path}")
+    return store
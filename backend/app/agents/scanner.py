@@ -3,6 +3,7 @@ import zipfile
 import re
 import shutil
 from typing import List, Dict, Any
+from .code_slicer import js_call_span, python_block_span, route_middleware
 
 class ProjectScanner:
     def __init__(self):
@@ -44,31 +45,37 @@ class ProjectScanner:
         # Matches: app.get('/path', ...), router.post('/path', ...)
         pattern = re.compile(r'(app|router)\.(get|post|put|delete|patch)\s*\(\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
         
-        matches = pattern.findall(file_content)
-        
-        for match in matches:
-            _, method, path = match
+        for match in pattern.finditer(file_content):
+            _, method, path = match.groups()
             method = method.upper()
+            start_line, end_line = js_call_span(file_content, match.start())
             
             endpoints.append({
                 "path": path,
                 "method": method,
                 "description": f"Detected {method} endpoint at {path}",
-                "payload_schema": {} 
+                "payload_schema": {},
+                # Handler location, so diagnosis can send just this slice
+                "start_line": start_line,
+                "end_line": end_line,
+                "middleware": route_middleware(file_content, match.start())
             })
             
         # Regex for FastAPI/Flask (Python)
         # @app.get("/path") or @app.route("/path", methods=["GET"])
         python_pattern = re.compile(r'@app\.(get|post|put|delete|patch)\s*\(\s*[\'"]([^\'"]+)[\'"]', re.IGNORECASE)
-        py_matches = python_pattern.findall(file_content)
-        for match in py_matches:
-            method, path = match
+        for match in python_pattern.finditer(file_content):
+            method, path = match.groups()
             method = method.upper()
+            start_line, end_line = python_block_span(file_content, match.start())
             endpoints.append({
                 "path": path,
                 "method": method,
                 "description": f"Detected {method} endpoint at {path}",
-                "payload_schema": {}
+                "payload_schema": {},
+                "start_line": start_line,
+                "end_line": end_line,
+                "middleware": []
             })
 
         return endpoints
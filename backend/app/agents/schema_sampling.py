@@ -0,0 +1,27 @@
+from typing import Any
+
+def sample_from_schema(schema: Any, name: str = "value", index: int = 1) -> Any:
+    """
+    Builds a value shaped like `schema`: JSON-schema style
+    ({"type": "object", "properties": ...}) or a plain {field: "type"} map.
+    """
+    if isinstance(schema, str):
+        schema = {"type": schema}
+    if not isinstance(schema, dict):
+        return None
+
+    kind = schema.get("type")
+    if kind is None and schema and "properties" not in schema:
+        # Plain field map as produced by generators: {"name": "string", "price": "number"}
+        return {field: sample_from_schema(value, field, index) for field, value in schema.items()}
+    if kind == "object" or "properties" in schema:
+        return {field: sample_from_schema(value, field, index) for field, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_from_schema(schema.get("items", {}), name, index)]
+    if kind == "integer":
+        return index
+    if kind == "number":
+        return float(index)
+    if kind == "boolean":
+        return True
+    return f"{name} {index}"
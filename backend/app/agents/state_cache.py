@@ -0,0 +1,153 @@
+import copy
+import time
+import atexit
+import threading
+from typing import Dict, Any, Optional, Set
+from .repository import StateRepository
+
+_MISSING = object()
+
+class StateSnapshot(dict):
+    """A caller's private copy of a user's state, remembering what it was loaded from."""
+    def __init__(self, data: Dict[str, Any], base: Dict[str, Any]):
+        super().__init__(data)
+        self.base = base
+
+class StateCache:
+    """
+    Write-behind, per-user cache in front of a StateRepository.
+
+    load() serves a deep copy from memory (the repository is read once per user).
+    save() merges only the keys the caller changed since its load() into the
+    cached state under that user's lock, so two overlapping requests of one
+    user no longer overwrite each other's updates. Dirty users are written by a
+    background flusher `flush_delay` seconds later: bursts of saves coalesce
+    into one write, and the repository writes atomically.
+
+    invalidate() is the hook for multi-worker setups (another process changed
+    the repository); `ttl` makes entries expire on their own as a fallback.
+    """
+    def __init__(self, repository: StateRepository, flush_delay: float = 0.2, ttl: Optional[float] = None):
+        self.repository = repository
+        self.flush_delay = flush_delay
+        self.ttl = ttl
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.loaded_at: Dict[str, float] = {}
+        self.dirty: Set[str] = set()
+        self.lock = threading.Lock()  # Guards the maps and the lock table, never held during I/O
+        self.user_locks: Dict[str, threading.RLock] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = None
+
+    def user_lock(self, user_id: str) -> threading.RLock:
+        with self.lock:
+            return self.user_locks.setdefault(user_id, threading.RLock())
+
+    def _current(self, user_id: str) -> Dict[str, Any]:
+        """The cached state (loading it if needed); caller holds the user's lock."""
+        with self.lock:
+            state = self.states.get(user_id)
+            expired = (self.ttl is not None and user_id not in self.dirty
+                       and time.monotonic() - self.loaded_at.get(user_id, 0) > self.ttl)
+        if state is None or expired:
+            state = self.repository.load_state(user_id)
+            with self.lock:
+                self.states[user_id] = state
+                self.loaded_at[user_id] = time.monotonic()
+        return state
+
+    def load(self, user_id: str) -> StateSnapshot:
+        with self.user_lock(user_id):
+            current = self._current(user_id)
+            # The cache only ever replaces top-level values, so `current` can serve as the base
+            return StateSnapshot(copy.deepcopy(current), dict(current))
+
+    def save(self, user_id: str, state: Dict[str, Any]):
+        with self.user_lock(user_id):
+            current = dict(self._current(user_id))
+            base = state.base if isinstance(state, StateSnapshot) else None
+            for key in set(state) | set(base or {}):
+                value = state.get(key, _MISSING)
+                if base is not None and key in base and value is not _MISSING and value == base[key]:
+                    continue  # Untouched by this caller: keep whatever is current
+                if value is _MISSING:
+                    current.pop(key, None)
+                else:
+                    current[key] = copy.deepcopy(value)
+            with self.lock:
+                self.states[user_id] = current
+                self.dirty.add(user_id)
+            if isinstance(state, StateSnapshot):
+                state.base = dict(current)  # Later saves of the same snapshot diff against this one
+        self._schedule()
+
+    def _schedule(self):
+        if self.flush_delay <= 0 or self._closed:
+            self.flush()
+            return
+        if self._flusher is None:
+            with self.lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self._flusher.start()
+                    atexit.register(self.close)
+        self._wake.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            if self._closed:
+                break
+            time.sleep(self.flush_delay)  # Let bursts of saves coalesce into one write
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[StateCache] Flush failed, will retry: {e}")
+                self._wake.set()
+
+    def flush(self, user_id: Optional[str] = None):
+        """Writes dirty users (or just `user_id`) to the repository now."""
+        with self.lock:
+            users = [user_id] if user_id is not None else list(self.dirty)
+        for user in users:
+            with self.user_lock(user):
+                with self.lock:
+                    if user not in self.dirty:
+                        continue
+                    state = self.states[user]
+                    self.dirty.discard(user)
+                try:
+                    self.repository.save_state(user, state)
+                except Exception:
+                    with self.lock:
+                        self.dirty.add(user)
+                    raise
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drops cached state (after writing pending changes) so the next load re-reads the repository."""
+        self.flush(user_id)
+        with self.lock:
+            if user_id is None:
+                self.states.clear()
+                self.loaded_at.clear()
+            else:
+                self.states.pop(user_id, None)
+                self.loaded_at.pop(user_id, None)
+
+    def delete(self, user_id: str):
+        """Forgets the user's session, in memory and in the repository."""
+        with self.user_lock(user_id):
+            with self.lock:
+                self.states.pop(user_id, None)
+                self.loaded_at.pop(user_id, None)
+                self.dirty.discard(user_id)
+            self.repository.delete_session(user_id)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
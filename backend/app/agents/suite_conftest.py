@@ -0,0 +1,212 @@
+# Generated by Agentic AI Tester executor. Do not edit: this file is refreshed before every run.
+"""
+Shared runtime for generated test suites. The executor copies this module as
+`conftest.py` next to the suite it runs, and configures it through env vars.
+"""
+import os
+import json
+import base64
+import signal
+import hashlib
+import datetime
+import threading
+import pytest
+import requests
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+POOL_SIZE = int(os.getenv("API_TEST_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("API_TEST_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("API_TEST_READ_TIMEOUT", "10"))
+TEST_TIMEOUT = float(os.getenv("API_TEST_TIMEOUT", "0"))  # 0 disables the per-test limit
+PROGRESS_FILE = os.getenv("API_TEST_PROGRESS_FILE")
+RECORD_TO = os.getenv("API_TEST_RECORD_TO")  # Cassette written at the end of the session
+REPLAY_FROM = os.getenv("API_TEST_REPLAY_FROM")  # Cassette answering requests before going live
+TARGET_BASE_URL = os.getenv("API_TEST_BASE_URL")  # Redirects the suite's baked-in base_url
+
+HTTP_VERBS = ("request", "get", "post", "put", "patch", "delete", "head", "options")
+
+class Cassette:
+    """
+    Recorded request/response pairs keyed by method, URL and body. Repeated
+    identical requests replay their recorded responses in order.
+    """
+    def __init__(self, replay_from=None):
+        self.entries = {}
+        self.positions = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if replay_from and os.path.exists(replay_from):
+            with open(replay_from, "r") as f:
+                self.entries = json.load(f).get("entries", {})
+        self.replaying = bool(replay_from)
+
+    @staticmethod
+    def key(prepared):
+        body = prepared.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return f"{prepared.method} {prepared.url} {hashlib.sha1(body).hexdigest()[:16]}"
+
+    def play(self, key, prepared):
+        with self.lock:
+            recorded = self.entries.get(key) if self.replaying else None
+            if not recorded:
+                self.misses += self.replaying
+                return None
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            self.hits += 1
+            entry = recorded[min(position, len(recorded) - 1)]
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry.get("headers", {}))
+        response._content = base64.b64decode(entry["body"])
+        response.encoding = entry.get("encoding")
+        response.url = entry.get("url", prepared.url)
+        response.request = prepared
+        response.elapsed = datetime.timedelta(0)
+        return response
+
+    def record(self, key, response):
+        entry = {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode("ascii"),
+            "encoding": response.encoding,
+            "url": response.url
+        }
+        with self.lock:
+            recorded = self.entries.setdefault(key, [])
+            recorded.append(entry)
+            self.positions[key] = len(recorded)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries}, f)
+        os.replace(tmp_path, path)
+
+CASSETTE = Cassette(REPLAY_FROM) if (RECORD_TO or REPLAY_FROM) else None
+
+def retarget(url):
+    """Points a request at API_TEST_BASE_URL, keeping its path and query."""
+    if not TARGET_BASE_URL:
+        return url
+    parts = urlsplit(url)
+    target = urlsplit(TARGET_BASE_URL)
+    return urlunsplit((target.scheme, target.netloc, target.path.rstrip("/") + parts.path, parts.query, parts.fragment))
+
+class PooledSession(requests.Session):
+    """Keep-alive session that applies the default timeouts to every request."""
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        url = retarget(url)
+        if CASSETTE is None:
+            return super().request(method, url, **kwargs)
+
+        prepared = self.prepare_request(requests.Request(
+            method.upper(), url, headers=kwargs.get("headers"), files=kwargs.get("files"),
+            data=kwargs.get("data"), json=kwargs.get("json"), params=kwargs.get("params"),
+            auth=kwargs.get("auth"), cookies=kwargs.get("cookies")
+        ))
+        key = Cassette.key(prepared)
+        response = CASSETTE.play(key, prepared)
+        if response is None:
+            response = super().request(method, url, **kwargs)
+            CASSETTE.record(key, response)
+        return response
+
+def build_session() -> PooledSession:
+    session = PooledSession()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@pytest.fixture(scope="session")
+def api_client():
+    """One pooled HTTP client shared by every test in the session."""
+    session = build_session()
+    yield session
+    session.close()
+
+@pytest.fixture(scope="session", autouse=True)
+def _route_requests_through_pool(api_client):
+    """
+    Older generated suites call requests.get/post/... directly; route those
+    module-level helpers through the shared pool as well.
+    """
+    patcher = pytest.MonkeyPatch()
+    for verb in HTTP_VERBS:
+        patcher.setattr(requests, verb, getattr(api_client, verb))
+    yield
+    patcher.undo()
+
+class TestTimeoutError(Exception):
+    """Raised inside a test that exceeded API_TEST_TIMEOUT."""
+
+def _progress(entry):
+    # One JSON line per event, flushed immediately so the executor can harvest
+    # completed results even if the whole process is killed.
+    if PROGRESS_FILE:
+        with open(PROGRESS_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+def pytest_configure(config):
+    # Metadata markers the backend uses to attribute results to (endpoint, action)
+    config.addinivalue_line("markers", "endpoint(method, path): the scanned route this test targets")
+    config.addinivalue_line("markers", "action(name): the RL mutation this test performs")
+
+def pytest_collection_finish(session):
+    _progress({"event": "collected", "nodeids": [item.nodeid for item in session.items]})
+
+def pytest_sessionfinish(session):
+    if CASSETTE is not None:
+        if RECORD_TO:
+            CASSETTE.save(RECORD_TO)
+        _progress({"event": "cassette", "hits": CASSETTE.hits, "misses": CASSETTE.misses,
+                   "entries": len(CASSETTE.entries)})
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    # SIGALRM is POSIX-only; elsewhere the per-request timeouts still bound each test
+    use_alarm = TEST_TIMEOUT > 0 and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        def on_timeout(signum, frame):
+            raise TestTimeoutError(f"Test exceeded the per-test timeout of {TEST_TIMEOUT}s")
+        previous = signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, TEST_TIMEOUT)
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+def _failure_message(report):
+    crash = getattr(report.longrepr, "reprcrash", None)
+    if crash is not None:
+        return crash.message
+    lines = report.longreprtext.splitlines()
+    return lines[-1] if lines else None
+
+def pytest_runtest_logreport(report):
+    # The call phase decides the outcome; setup/teardown only matter when they fail or skip
+    if report.when == "call" or report.failed or report.skipped:
+        outcome = report.outcome
+        if report.failed and report.when != "call":
+            outcome = "error"
+        _progress({
+            "event": "result",
+            "nodeid": report.nodeid,
+            "outcome": outcome,
+            "duration": report.duration,
+            "message": _failure_message(report) if report.failed else None,
+            "longrepr": report.longreprtext if report.failed else None
+        })
@@ -0,0 +1,161 @@
+import ast
+import hashlib
+from typing import Dict, Any, List, Set
+
+# Key used for everything at module level that is not a function
+# (imports, constants, ...). A change there can affect every test.
+MODULE_KEY = "__module__"
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def function_hashes(source: str) -> Dict[str, str]:
+    """
+    Hashes every top-level function of a test module by its AST, so formatting-only
+    edits don't count as changes. Everything else is folded into MODULE_KEY.
+    """
+    tree = ast.parse(source)
+    hashes = {}
+    module_parts = []
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            hashes[node.name] = _hash(ast.dump(node))
+        else:
+            module_parts.append(ast.dump(node))
+
+    hashes[MODULE_KEY] = _hash("\n".join(module_parts))
+    return hashes
+
+def referenced_names(source: str) -> Dict[str, Set[str]]:
+    """
+    Maps each top-level function to the names it depends on: its arguments
+    (pytest fixtures) and every global name used in its body.
+    """
+    tree = ast.parse(source)
+    refs = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+            if not isinstance(node, ast.ClassDef):
+                names |= {a.arg for a in node.args.args + node.args.kwonlyargs}
+            names.discard(node.name)
+            refs[node.name] = names
+    return refs
+
+def impacted_tests(old_hashes: Dict[str, str], source: str) -> List[str]:
+    """
+    Returns the test functions whose own code, or any helper/fixture they use
+    (transitively), differs from old_hashes. Module-level changes impact all tests.
+    """
+    new_hashes = function_hashes(source)
+    refs = referenced_names(source)
+    tests = [name for name in new_hashes if name.startswith(("test", "Test"))]
+
+    if old_hashes.get(MODULE_KEY) != new_hashes[MODULE_KEY]:
+        return tests
+
+    changed = {name for name, h in new_hashes.items() if old_hashes.get(name) != h}
+
+    # Propagate changes through helper -> helper / fixture -> fixture dependencies
+    grew = True
+    while grew:
+        grew = False
+        for name, deps in refs.items():
+            if name not in changed and deps & changed:
+                changed.add(name)
+                grew = True
+
+    return [name for name in tests if name in changed]
+
+def top_level_name(nodeid: str) -> str:
+    """'test_x[1]' -> 'test_x', 'TestApi::test_y' -> 'TestApi', 'path.py::test_z' -> 'test_z'."""
+    parts = nodeid.split("::")
+    if parts[0].endswith(".py") and len(parts) > 1:
+        parts = parts[1:]
+    return parts[0].split("[")[0]
+
+def _span(node: ast.AST):
+    # Decorators sit above the def line but belong to the function
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+def _segment(lines: List[str], node: ast.AST) -> str:
+    start, end = _span(node)
+    return "".join(lines[start - 1:end])
+
+def _definitions(tree: ast.Module) -> Dict[str, ast.AST]:
+    """Top-level functions, classes and simple assignments by name."""
+    defs = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defs[node.name] = node
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name):
+                    defs[target.id] = node
+    return defs
+
+def extract_for_healing(source: str, test_names: List[str]) -> Dict[str, str]:
+    """
+    Returns the source of the given test functions plus the context they need:
+    imports and the helpers, fixtures and constants they reference (transitively).
+    Result keys: "targets" (name -> source) and "context" (source text).
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    defs = _definitions(tree)
+    wanted = [name for name in dict.fromkeys(test_names) if name in defs]
+
+    # Walk dependencies from the failing tests outwards
+    needed = set()
+    stack = list(wanted)
+    while stack:
+        node = defs[stack.pop()]
+        names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            names |= {a.arg for a in node.args.args + node.args.kwonlyargs}
+        for name in names:
+            if name in defs and name not in needed and name not in wanted:
+                needed.add(name)
+                stack.append(name)
+
+    context_nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            context_nodes.append(node)
+        elif any(defs.get(name) is node for name in needed):
+            context_nodes.append(node)
+
+    return {
+        "targets": {name: _segment(lines, defs[name]) for name in wanted},
+        "context": "".join(_segment(lines, node) for node in context_nodes)
+    }
+
+def splice_functions(source: str, replacement_source: str, allowed: List[str]) -> Dict[str, Any]:
+    """
+    Replaces top-level definitions in `source` with the same-named ones found in
+    `replacement_source`, restricted to `allowed` names. Returns the new source
+    and the names that were replaced. Raises SyntaxError if either side doesn't parse.
+    """
+    tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    new_tree = ast.parse(replacement_source)
+    new_lines = replacement_source.splitlines(keepends=True)
+
+    originals = {node.name: node for node in tree.body
+                 if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+    replacements = {}
+    for node in new_tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) \
+                and node.name in allowed and node.name in originals:
+            segment = _segment(new_lines, node)
+            replacements[node.name] = segment if segment.endswith("\n") else segment + "\n"
+
+    # Replace bottom-up so earlier line numbers stay valid
+    for name in sorted(replacements, key=lambda n: _span(originals[n])[0], reverse=True):
+        start, end = _span(originals[name])
+        lines[start - 1:end] = [replacements[name]]
+
+    return {"source": "".join(lines), "replaced": sorted(replacements)}
@@ -2,19 +2,32 @@ import os
 import shutil
 import json
 import glob
+import queue
+import threading
+from functools import partial
 from datetime import datetime
-from typing import List, Dict, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, status, Header, Depends
+from typing import ContextManager, List, Dict, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, status, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 # Import Agents
 from app.agents.scanner import ProjectScanner
 from app.agents.generator import TestGenerator
-from app.agents.executor import TestExecutor
+from app.agents.executor import TestExecutor, RERUN_MODES
 from app.agents.healer import SelfHealingAgent
 from app.agents.rl_engine import RLEngine
+from app.agents.policy_store import PolicyStore
+from app.agents.repository import make_repository, history_entry, HISTORY_LIMIT, HISTORY_FIELDS, MAX_PAGE_SIZE
+from app.agents.state_cache import StateCache
+from app.agents.execution import ExecutionLayer, PoolBusy, JobCancelled
+from app.agents.reward_attribution import attribute_rewards
+from app.agents.fuzzer import FuzzEngine, MAX_ROUNDS, MAX_BATCH_SIZE, MAX_CONNECTIONS, MAX_TIMEOUT, MAX_RATE
 from app.agents.github_handler import GitHubHandler
+from app.agents.run_stats import make_run_stats
+from app.agents.orchestrator import HealingLoop, SpeculativeHealer
+from app.agents.mock_server import MockTargetServer, MOCK_TARGET
 from app.agents.llm_client import GeminiQuotaError, GeminiRateLimitError
 
 app = FastAPI(title="Agentic AI Tester", version="1.1.0")
@@ -32,8 +45,21 @@ scanner = ProjectScanner()
 generator = TestGenerator()
 executor = TestExecutor()
 healer = SelfHealingAgent()
-rl_engine = RLEngine()
+repository = make_repository()  # STORAGE_BACKEND=sqlite (default) or json
+# Per-user state served from memory, written back coalesced; STATE_CACHE_TTL bounds staleness across workers
+state_cache = StateCache(repository, ttl=float(os.environ["STATE_CACHE_TTL"]) if os.getenv("STATE_CACHE_TTL") else None)
+rl_engine = RLEngine()  # Global prior: new tenant/project policies warm-start from it
+policy_store = PolicyStore(prior=rl_engine, mirror=repository.save_q_values, restore=repository.load_q_values)
 github_handler = GitHubHandler()
+test_stats = make_run_stats(repository)  # Shares the SQLite database and connection
+healing_loop = HealingLoop(executor, healer)
+speculative_healer = SpeculativeHealer(executor, healer)
+# Scans run in a process pool, clones/zips/copies in a thread pool, so async endpoints never block the loop
+execution = ExecutionLayer()
+
+# Local mock targets, one per user, started on demand by runs with base_url="mock"
+mock_targets: Dict[str, MockTargetServer] = {}
+mock_targets_lock = threading.Lock()
 
 # --- User Dependency ---
 async def get_current_user_id(x_user_id: Optional[str] = Header(None)):
@@ -45,55 +71,90 @@ async def get_current_user_id(x_user_id: Optional[str] = Header(None)):
     return x_user_id
 
 # --- State Management ---
+created_dirs = set()  # Directories known to exist, so hot paths skip os.makedirs
+created_dirs_lock = threading.Lock()
+
+def ensure_dir(path: str) -> str:
+    if path not in created_dirs:
+        os.makedirs(path, exist_ok=True)
+        with created_dirs_lock:
+            created_dirs.add(path)
+    return path
+
+def forget_dirs(root: str):
+    """Call after deleting `root`, so ensure_dir recreates it and its children."""
+    with created_dirs_lock:
+        for path in [p for p in created_dirs if p == root or p.startswith(root + os.sep)]:
+            created_dirs.discard(path)
+
 def get_user_session_path(user_id: str):
     # Changed to storage/sessions/<user_id>
-    path = os.path.join("storage", "sessions", user_id)
-    os.makedirs(path, exist_ok=True)
-    return path
+    return ensure_dir(os.path.join("storage", "sessions", user_id))
 
 def get_user_upload_dir(user_id: str):
-    path = os.path.join(get_user_session_path(user_id), "uploads")
-    os.makedirs(path, exist_ok=True)
-    return path
+    return ensure_dir(os.path.join(get_user_session_path(user_id), "uploads"))
 
 def get_user_extract_dir(user_id: str):
-    path = os.path.join(get_user_session_path(user_id), "extracted")
-    os.makedirs(path, exist_ok=True)
-    return path
-
-def get_state_file(user_id: str):
-    return os.path.join(get_user_session_path(user_id), "system_state.json")
+    return ensure_dir(os.path.join(get_user_session_path(user_id), "extracted"))
 
 def load_state(user_id: str):
-    state_file = get_state_file(user_id)
-    if os.path.exists(state_file):
-        try:
-            with open(state_file, "r") as f:
-                return json.load(f)
-        except:
-            pass
-    return {
-        "project_name": None,
-        "upload_path": None,
-        "endpoints": [],
-        "test_file": None,
-        "latest_results": None
-    }
+    """The user's state from the in-memory cache; edit it and pass it to save_state."""
+    return state_cache.load(user_id)
 
 def save_state(new_state, user_id: str):
-    state_file = get_state_file(user_id)
-    with open(state_file, "w") as f:
-        json.dump(new_state, f, indent=4)
+    """Merges the keys this request changed; the write to the repository is coalesced."""
+    state_cache.save(user_id, new_state)
+
+def get_project_key(user_id: str, state: Dict) -> str:
+    """Key used to scope per-project data (test stats, ...) to a user's project."""
+    project_name = (state.get("project_name") or "unknown").replace(".zip", "")
+    return f"{user_id}/{project_name}"
+
+def get_policy_engine(user_id: str, state: Dict) -> ContextManager[RLEngine]:
+    """
+    Checks out the RL engine for this user's current project (policies never
+    leak across tenants); it can't be evicted or released until the block exits.
+    """
+    project_name = (state.get("project_name") or "unknown").replace(".zip", "")
+    return policy_store.checkout(user_id, project_name)
+
+def resolve_target(user_id: str, state: Dict, base_url: Optional[str], mock: Optional["MockTargetConfig"]) -> Optional[str]:
+    """
+    Returns the base URL a run should hit. "mock" (re)starts the user's local
+    mock server from the scanned endpoints whenever the catalog or settings change.
+    """
+    if base_url != MOCK_TARGET:
+        return base_url
+    endpoints = state.get("endpoints") or []
+    if not endpoints:
+        raise HTTPException(status_code=400, detail="No scanned endpoints to mock. Upload a project first.")
+    settings = (mock or MockTargetConfig()).model_dump()
+
+    with mock_targets_lock:
+        server = mock_targets.get(user_id)
+        if server is None or server.endpoints != endpoints or server.settings != settings:
+            if server is not None:
+                server.stop()
+            server = MockTargetServer(endpoints, **settings).start()
+            mock_targets[user_id] = server
+        return server.base_url
+
+def stop_mock_target(user_id: str):
+    with mock_targets_lock:
+        server = mock_targets.pop(user_id, None)
+    if server is not None:
+        server.stop()
 
 def cleanup_user_session(user_id: str):
     """Deletes the entire session directory for a user."""
-    session_path = get_user_session_path(user_id)
+    session_path = os.path.join("storage", "sessions", user_id)
     if os.path.exists(session_path):
         try:
             shutil.rmtree(session_path)
             print(f"Cleaned up session for user: {user_id}")
         except Exception as e:
             print(f"Error cleaning up session for {user_id}: {e}")
+    forget_dirs(session_path)
 
 def cleanup_previous_uploads(user_id: str):
     """Deletes previous uploads and extracted files for a user within the session."""
@@ -125,6 +186,20 @@ def cleanup_previous_uploads(user_id: str):
                 print(f"Failed to delete {file_path}. Reason: {e}")
 
 # --- Helper to Find Test File if State is Broken ---
+async def run_blocking(pool, request: Request, fn, *args, on_cancel=None):
+    """Runs fn in an execution pool, cancelling it if the client disconnects (503 when the pool is full)."""
+    try:
+        return await pool.run(fn, *args, is_disconnected=request.is_disconnected, on_cancel=on_cancel)
+    except PoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except JobCancelled as e:
+        print(f"[Execution] {e}")
+        raise HTTPException(status_code=499, detail=str(e))
+
+def copy_upload(source, destination: str):
+    with open(destination, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
 def find_test_file(project_name):
     # If project is "server.zip", look for "test_server.py"
     if not project_name: return None
@@ -144,6 +219,25 @@ def find_test_file(project_name):
 class GenerateRequest(BaseModel):
     base_url: str = "http://localhost:5000"
 
+class MockTargetConfig(BaseModel):
+    latency: float = 0.0                          # Seconds added to every response
+    error_rate: float = 0.0                       # Fraction of requests answered with 500
+    status_overrides: Dict[str, int] = {}         # e.g. {"GET /users/:id": 503}
+    seed: int = 0                                 # Makes injected errors reproducible
+
+class RunTestsRequest(BaseModel):
+    # "full", "failed" (last failures only) or "impacted" (tests changed since last run)
+    mode: str = "full"
+    # Optional overrides of the executor's per-test limit and whole-run budget (seconds)
+    test_timeout: Optional[float] = None
+    global_timeout: Optional[float] = None
+    replay: bool = False  # Answer requests from the previous run's recorded HTTP cassette
+    # Overrides the suite's baked-in base_url; "mock" targets a local mock server
+    base_url: Optional[str] = None
+    mock: Optional[MockTargetConfig] = None
+    # Runs the suite against every listed target concurrently and compares outcomes
+    base_urls: Optional[List[str]] = None
+
 class ProcessGitHubRequest(BaseModel):
     github_url: str
     token: Optional[str] = None
@@ -151,10 +245,36 @@ class ProcessGitHubRequest(BaseModel):
 class HealTestRequest(BaseModel):
     test_file: str
     failure_logs: str
+    # "full" rewrites the whole file; "targeted" only the failing functions;
+    # "speculative" tries `candidates` fixes per failing test in parallel and keeps the first green one
+    mode: str = "full"
+    candidates: int = 3
+    replay: bool = True  # Heals are verified against the latest run's HTTP recording
+
+class HealLoopRequest(BaseModel):
+    max_iterations: int = 5
+    token_budget: Optional[int] = None     # Estimated LLM tokens
+    time_budget: Optional[float] = None    # Wall-clock seconds
+    stream: bool = False                   # Stream progress events as NDJSON
+    replay: bool = True                    # Verify heals against the first run's HTTP recording
+    base_url: Optional[str] = None         # Same as RunTestsRequest.base_url
+    mock: Optional[MockTargetConfig] = None
+
+# Bounds come from the fuzzer (FUZZ_MAX_RATE caps the probe rate server-side); callers can only go lower
+class FuzzRequest(BaseModel):
+    base_url: str                                        # Target to probe; "mock" uses the local mock server
+    rounds: int = Field(10, ge=1, le=MAX_ROUNDS)         # One policy-chosen action per endpoint per round
+    batch_size: int = Field(1, ge=1, le=MAX_BATCH_SIZE)  # Mutated payloads sent per endpoint per round
+    seed: Optional[int] = None                           # Reproducible mutations across runs
+    max_connections: int = Field(50, ge=1, le=MAX_CONNECTIONS)
+    rate_limit: float = Field(200.0, gt=0, le=MAX_RATE)  # Requests per second against the target
+    timeout: float = Field(5.0, gt=0, le=MAX_TIMEOUT)
+    mock: Optional[MockTargetConfig] = None
 
 class DiagnoseRequest(BaseModel):
     source_file: Optional[str] = None
     error_logs: str
+    test_names: Optional[List[str]] = None  # Failing tests; defaults to the latest run's failures
 
 # --- Endpoints ---
 
@@ -163,21 +283,20 @@ def read_root():
     return {"status": "System Operational"}
 
 @app.post("/upload")
-async def upload_project(file: UploadFile = File(...), user_id: str = Depends(get_current_user_id)):
+async def upload_project(request: Request, file: UploadFile = File(...), user_id: str = Depends(get_current_user_id)):
     try:
         # Cleanup previous session data
-        cleanup_previous_uploads(user_id)
+        await run_blocking(execution.io, request, cleanup_previous_uploads, user_id)
         
         uploads_dir = get_user_upload_dir(user_id)
         extract_dir = get_user_extract_dir(user_id)
         
         file_location = os.path.join(uploads_dir, file.filename)
         
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await run_blocking(execution.io, request, copy_upload, file.file, file_location)
 
         # Pass specific extract_dir to scanner
-        endpoints = scanner.scan_project(file_location, extract_dir)
+        endpoints = await run_blocking(execution.cpu, request, scanner.scan_project, file_location, extract_dir)
         
         state = load_state(user_id)
         state["project_name"] = file.filename
@@ -192,6 +311,8 @@ async def upload_project(file: UploadFile = File(...), user_id: str = Depends(ge
             "endpoints_found": len(endpoints),
             "endpoints_data": endpoints
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -225,7 +346,11 @@ def generate_tests(request: GenerateRequest, user_id: str = Depends(get_current_
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/run-tests")
-def run_tests(user_id: str = Depends(get_current_user_id)):
+def run_tests(request: Optional[RunTestsRequest] = None, user_id: str = Depends(get_current_user_id)):
+    request = request or RunTestsRequest()
+    if request.mode not in RERUN_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{request.mode}'. Use one of: {', '.join(RERUN_MODES)}")
+
     state = load_state(user_id)
     test_file = state.get("test_file")
 
@@ -240,70 +365,212 @@ def run_tests(user_id: str = Depends(get_current_user_id)):
         else:
             raise HTTPException(status_code=400, detail="No test file found. Please generate tests first.")
 
+    if request.base_urls:
+        return run_tests_across_targets(request, test_file, state, user_id)
+
     try:
-        results = executor.run_test_suite(test_file)
+        results = executor.run_test_suite(
+            test_file,
+            namespace=user_id,
+            mode=request.mode,
+            baseline=state.get("latest_results"),
+            test_timeout=request.test_timeout,
+            global_timeout=request.global_timeout,
+            replay=request.replay,
+            base_url=resolve_target(user_id, state, request.base_url, request.mock)
+        )
         
-        state["latest_results"] = results
+        # State only references the logs; the full text lives in the run's artifact dir
+        state["latest_results"] = {k: v for k, v in results.items() if k != "logs"}
         save_state(state, user_id)
-        
-        # Save to run history (Global history for now, or per user?)
-        # User requested session-scoped uploads, but history might be persistent?
-        # "The system keeps old extracted folders even when they are no longer needed."
-        # "Make project uploads SESSION-SCOPED"
-        # History is likely persistent per user, but let's store it in session for now as requested "A user only sees the project they uploaded DURING that session."
-        # Wait, history usually persists. But the prompt says "When the user logs out, the project should be removed."
-        # It doesn't explicitly say delete HISTORY. But it says "Logging out should delete the session folder completely."
-        # If we store history in session folder, it gets deleted.
-        # Let's assume history should persist in a separate "persistent" folder if we wanted it to, but based on "delete the session folder completely", maybe they want a clean slate?
-        # Actually, usually history is persistent.
-        # Let's keep history in `storage/users/<user_id>/run_history.json` (persistent) and project files in `storage/sessions/<user_id>` (ephemeral).
-        
-        # Persistent storage for history
-        persistent_user_storage = os.path.join("storage", "users", user_id)
-        os.makedirs(persistent_user_storage, exist_ok=True)
-        history_file = os.path.join(persistent_user_storage, "run_history.json")
-        
-        history = []
-        if os.path.exists(history_file):
-            try:
-                with open(history_file, "r") as f:
-                    history = json.load(f)
-            except:
-                history = []
-        
-        # Add new run to history
-        history.append({
-            "timestamp": datetime.now().isoformat(),
-            "project_name": state.get("project_name", "Unknown"),
-            "status": "passed" if results.get("status") == "success" else "failed",
-            "reward": results.get("reward", 0),
-            "summary": results.get("summary", {}),
-            "test_file": test_file
-        })
-        
-        # Keep only last 100 runs
-        history = history[-100:]
-        
-        with open(history_file, "w") as f:
-            json.dump(history, f, indent=2)
-        
-        # RL Update
-        if state.get("endpoints"):
-            for ep in state["endpoints"]:
-                rl_engine.update_policy(ep['path'], "standard", results['reward'])
+
+        test_stats.record_run(get_project_key(user_id, state), results)
+        
+        # Run history is persistent (it survives logout, unlike the session state)
+        repository.append_run(user_id, history_entry(results, state, test_file))
+
+        # RL Update: one reward per (endpoint, action) from the per-test results,
+        # applied as a single batch and persisted write-behind
+        endpoint_rewards = []
+        # A rerun that selected nothing just echoes the baseline: it has nothing new to learn from
+        if state.get("endpoints") and results.get("cases") and results.get("selected") != []:
+            with open(test_file, "r") as f:
+                test_source = f.read()
+            with get_policy_engine(user_id, state) as engine:
+                try:
+                    endpoint_rewards = attribute_rewards(test_source, results, state["endpoints"], engine.actions)
+                except SyntaxError:
+                    endpoint_rewards = []
+                if endpoint_rewards:
+                    engine.update_policies(
+                        [r["endpoint"] for r in endpoint_rewards],
+                        [r["action"] for r in endpoint_rewards],
+                        [r["reward"] for r in endpoint_rewards]
+                    )
 
         return {
             "status": "Execution Complete",
-            "results": results
+            "results": results,
+            "endpoint_rewards": endpoint_rewards
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def run_tests_across_targets(request: RunTestsRequest, test_file: str, state: Dict, user_id: str):
+    """Full runs against several environments at once; the comparison is kept in state."""
+    # Results are keyed by URL: a repeated target would silently overwrite the other run
+    duplicates = sorted({url for url in request.base_urls if request.base_urls.count(url) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate base_urls: {', '.join(duplicates)}")
+    try:
+        targets = [resolve_target(user_id, state, url, request.mock) for url in request.base_urls]
+        outcome = executor.run_across_targets(
+            test_file, targets, namespace=user_id,
+            test_timeout=request.test_timeout,
+            global_timeout=request.global_timeout,
+            labels=request.base_urls
+        )
+        project_key = get_project_key(user_id, state)
+        for label, results in outcome["environments"].items():
+            test_stats.record_run(f"{project_key}@{label}", results)
+
+        state["latest_environment_results"] = {
+            "timestamp": datetime.now().isoformat(),
+            "status": outcome["status"],
+            "comparison": outcome["comparison"],
+            "run_ids": {label: r.get("run_id") for label, r in outcome["environments"].items()}
         }
+        save_state(state, user_id)
+        return outcome
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/test-stats")
+def get_test_stats(limit: int = 10, user_id: str = Depends(get_current_user_id)):
+    """Slowest tests, their duration trends and flakiness scores for the current project"""
+    try:
+        state = load_state(user_id)
+        return test_stats.report(get_project_key(user_id, state), limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/runs/{run_id}/logs")
+def get_run_logs(run_id: str, offset: int = 0, length: Optional[int] = None, user_id: str = Depends(get_current_user_id)):
+    """Returns a byte range of a run's stored (compressed) logs"""
+    try:
+        return executor.artifacts.read_logs(user_id, run_id, offset, length)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @app.post("/heal-test")
 def heal_test(request: HealTestRequest, user_id: str = Depends(get_current_user_id)):
     try:
-        result = healer.heal_test_case(request.test_file, request.failure_logs)
+        latest = load_state(user_id).get("latest_results") or {}
+        replay_from = (latest.get("cassette") or {}).get("path") if request.replay else None
+        if request.mode == "speculative":
+            failures = healer.parse_failures(request.failure_logs)
+            if not failures:
+                raise HTTPException(status_code=400, detail="Speculative healing needs the JSON failure list from /run-tests.")
+            return speculative_healer.heal(request.test_file, failures, namespace=user_id,
+                                           candidates=request.candidates, replay_from=replay_from)
+
+        # Rerunning the healed tests lets the fix cache keep fixes that work and drop ones that don't
+        def verify(test_file: str, names: List[str]):
+            return executor.run_nodes(test_file, names, namespace=user_id, replay_from=replay_from)
+
+        result = healer.heal_test_case(request.test_file, request.failure_logs, request.mode, verify=verify)
         return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/fix-cache-stats")
+def get_fix_cache_stats(user_id: str = Depends(get_current_user_id)):
+    """Size, hit rate and eviction counters of the healer's failure-signature fix cache"""
+    return healer.fix_cache.stats()
+
+@app.post("/heal-loop")
+def heal_loop(request: HealLoopRequest, user_id: str = Depends(get_current_user_id)):
+    """Runs run -> heal (concurrently per failing test) -> rerun until green or out of budget"""
+    state = load_state(user_id)
+    test_file = state.get("test_file")
+    if not test_file or not os.path.exists(test_file):
+        raise HTTPException(status_code=400, detail="No test file found. Please generate tests first.")
+
+    project_key = get_project_key(user_id, state)
+    base_url = resolve_target(user_id, state, request.base_url, request.mock)
+
+    def run_loop(on_event=None):
+        outcome = healing_loop.run(
+            test_file,
+            namespace=user_id,
+            max_iterations=request.max_iterations,
+            token_budget=request.token_budget,
+            time_budget=request.time_budget,
+            replay=request.replay,
+            base_url=base_url,
+            on_event=on_event,
+            on_run=lambda results: test_stats.record_run(project_key, results)
+        )
+        latest = load_state(user_id)
+        latest["latest_results"] = {k: v for k, v in outcome["results"].items() if k != "logs"}
+        save_state(latest, user_id)
+        return outcome
+
+    if not request.stream:
+        try:
+            return run_loop()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    events = queue.Queue()
+
+    def worker():
+        try:
+            run_loop(on_event=events.put)
+        except Exception as e:
+            events.put({"type": "error", "message": str(e)})
+        finally:
+            events.put(None)
+
+    def stream():
+        threading.Thread(target=worker, daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/fuzz")
+def fuzz(request: FuzzRequest, user_id: str = Depends(get_current_user_id)):
+    """Fires RL-chosen mutation probes at every scanned endpoint and learns from the responses"""
+    state = load_state(user_id)
+    if not state.get("endpoints"):
+        raise HTTPException(status_code=400, detail="No endpoints found. Please upload project first.")
+    try:
+        base_url = resolve_target(user_id, state, request.base_url, request.mock)
+        with get_policy_engine(user_id, state) as policy:
+            engine = FuzzEngine(policy, max_connections=request.max_connections,
+                                rate_limit=request.rate_limit, timeout=request.timeout,
+                                batch_size=request.batch_size, seed=request.seed)
+            report = engine.fuzz(base_url, state["endpoints"], rounds=request.rounds)
+
+        latest = load_state(user_id)
+        latest["latest_fuzz"] = {k: v for k, v in report.items() if k != "findings"}
+        latest["latest_fuzz"]["findings"] = len(report["findings"])
+        save_state(latest, user_id)
+        return report
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -312,6 +579,17 @@ def diagnose_code(request: DiagnoseRequest, user_id: str = Depends(get_current_u
     try:
         state = load_state(user_id)
         project_name = state.get("project_name", "server").replace(".zip", "")
+
+        # Preferred: send only the handlers the failing tests hit
+        if not request.source_file and state.get("endpoints"):
+            failures = (state.get("latest_results") or {}).get("failures", [])
+            if request.test_names:
+                failures = [{"case": name} for name in request.test_names]
+            result = healer.diagnose_failing_endpoints(
+                state["endpoints"], state.get("test_file"), failures, request.error_logs
+            )
+            if result is not None:
+                return result
         
         # Look in session extracted dir
         extract_dir = get_user_extract_dir(user_id)
@@ -331,20 +609,23 @@ def diagnose_code(request: DiagnoseRequest, user_id: str = Depends(get_current_u
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process-github")
-async def process_github(request: ProcessGitHubRequest, user_id: str = Depends(get_current_user_id)):
+async def process_github(request: ProcessGitHubRequest, http_request: Request, user_id: str = Depends(get_current_user_id)):
     """Process a GitHub repository - clone, zip, and scan for endpoints"""
     try:
         # Cleanup previous session data
-        cleanup_previous_uploads(user_id)
+        await run_blocking(execution.io, http_request, cleanup_previous_uploads, user_id)
         
         uploads_dir = get_user_upload_dir(user_id)
         extract_dir = get_user_extract_dir(user_id)
         
         # Clone and convert to ZIP
-        zip_path = github_handler.clone_and_zip(request.github_url, request.token, uploads_dir)
+        cancel = threading.Event()  # Stops the zip step if the client leaves mid-clone
+        zip_path = await run_blocking(execution.io, http_request,
+                                      partial(github_handler.clone_and_zip, cancel=cancel),
+                                      request.github_url, request.token, uploads_dir, on_cancel=cancel.set)
         
         # Scan the project
-        endpoints = scanner.scan_project(zip_path, extract_dir)
+        endpoints = await run_blocking(execution.cpu, http_request, scanner.scan_project, zip_path, extract_dir)
         
         # Extract project name from URL
         repo_name = request.github_url.rstrip('/').split('/')[-1]
@@ -365,11 +646,13 @@ async def process_github(request: ProcessGitHubRequest, user_id: str = Depends(g
             "endpoints_found": len(endpoints),
             "endpoints_data": endpoints
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/scan-project")
-async def scan_project_manual(user_id: str = Depends(get_current_user_id)):
+async def scan_project_manual(request: Request, user_id: str = Depends(get_current_user_id)):
     """Manually trigger a re-scan of the current project"""
     try:
         state = load_state(user_id)
@@ -381,7 +664,7 @@ async def scan_project_manual(user_id: str = Depends(get_current_user_id)):
         extract_dir = get_user_extract_dir(user_id)
         
         # Re-scan
-        endpoints = scanner.scan_project(upload_path, extract_dir)
+        endpoints = await run_blocking(execution.cpu, request, scanner.scan_project, upload_path, extract_dir)
         
         # Update state
         state["endpoints"] = endpoints
@@ -392,40 +675,22 @@ async def scan_project_manual(user_id: str = Depends(get_current_user_id)):
             "endpoints_found": len(endpoints),
             "endpoints_data": endpoints
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/execution-stats")
+def get_execution_stats():
+    """Worker pool sizes, queue depths and job counters"""
+    return execution.metrics()
+
 @app.get("/dashboard-stats")
-async def get_dashboard_stats(user_id: str = Depends(get_current_user_id)):
+def get_dashboard_stats(user_id: str = Depends(get_current_user_id)):
     """Get dashboard statistics from run history"""
     try:
-        # Load run history from PERSISTENT storage
-        persistent_user_storage = os.path.join("storage", "users", user_id)
-        history_file = os.path.join(persistent_user_storage, "run_history.json")
-        
-        if os.path.exists(history_file):
-            with open(history_file, "r") as f:
-                history = json.load(f)
-        else:
-            history = []
-        
-        # Calculate stats
-        total_runs = len(history)
-        passed_runs = sum(1 for run in history if run.get("status") == "passed")
-        
-        # Calculate average reward
-        rewards = [run.get("reward", 0) for run in history if "reward" in run]
-        avg_reward = sum(rewards) / len(rewards) if rewards else 0
-        
-        # Count unique projects
-        unique_projects = len(set(run.get("project_name", "") for run in history))
-        
-        return {
-            "total_runs": total_runs,
-            "passed_runs": passed_runs,
-            "avg_reward": avg_reward,
-            "active_projects": unique_projects
-        }
+        # Running aggregates maintained on every recorded run
+        return repository.run_stats(user_id)
     except Exception as e:
         print(f"Error getting dashboard stats: {e}")
         return {
@@ -436,28 +701,42 @@ async def get_dashboard_stats(user_id: str = Depends(get_current_user_id)):
         }
 
 @app.get("/history")
-async def get_history(user_id: str = Depends(get_current_user_id)):
-    """Get test execution history"""
+def get_history(limit: int = HISTORY_LIMIT, cursor: Optional[str] = None, project: Optional[str] = None,
+                status: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                min_reward: Optional[float] = None, fields: Optional[str] = None,
+                user_id: str = Depends(get_current_user_id)):
+    """
+    Get test execution history, most recent first, one page at a time.
+    Pass the returned next_cursor back as `cursor` for the next page;
+    `fields` (comma separated) trims each entry, e.g. fields=timestamp,status,reward.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    unknown = set(projection or []) - set(HISTORY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    for name, value in (("since", since), ("until", until)):
+        if value is not None:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"{name} must be an ISO timestamp")
     try:
-        # Load run history from PERSISTENT storage
-        persistent_user_storage = os.path.join("storage", "users", user_id)
-        history_file = os.path.join(persistent_user_storage, "run_history.json")
-        
-        if os.path.exists(history_file):
-            with open(history_file, "r") as f:
-                history = json.load(f)
-            # Sort by timestamp, most recent first
-            history.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-            return {"history": history}
-        else:
-            return {"history": []}
+        return repository.query_runs(user_id, limit=limit, cursor=cursor, fields=projection, project=project,
+                                     status=status, since=since, until=until, min_reward=min_reward)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/logout")
-async def logout(user_id: str = Depends(get_current_user_id)):
+def logout(user_id: str = Depends(get_current_user_id)):
     """Cleans up the user session on logout"""
     try:
+        stop_mock_target(user_id)
+        policy_store.release(user_id)  # Learned policies persist; only the in-memory engines go
+        state_cache.delete(user_id)
         cleanup_user_session(user_id)
         return {"message": "Logged out and session cleaned up"}
     except Exception as e:
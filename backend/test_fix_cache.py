@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+from app.agents.fix_cache import FixCache, failure_signature, derive_patch, apply_patch
+
+BROKEN = '''def test_create_order(base_url, api_client):
+    response = api_client.post(f"{base_url}/orders/42", json={"qty": 1})
+    assert response.status_code == 200, f"Expected 200 but got {response.status_code}"
+    assert isinstance(response.json(), list)
+'''
+HEALED = BROKEN.replace("== 200, f\"Expected 200", "== 201, f\"Expected 201").replace("list)", "dict)")
+
+def test_signature_ignores_ids_and_bodies_but_keeps_status_codes():
+    a = [{"message": "AssertionError: Expected 200 but got 201. Response: {\"id\": 7}"}]
+    b = [{"message": "AssertionError: Expected 200 but got 201. Response: {\"id\": 99}"}]
+    c = [{"message": "AssertionError: Expected 200 but got 404. Response: {}"}]
+    other_id = BROKEN.replace("/orders/42", "/orders/7")
+    assert failure_signature(a, BROKEN) == failure_signature(b, other_id)
+    assert failure_signature(a, BROKEN) != failure_signature(c, BROKEN)
+
+def test_patch_replays_on_a_similar_test():
+    patch = derive_patch(BROKEN, HEALED)
+    assert {"kind": "const", "context": "Compare", "old": 200, "new": 201} in patch
+    assert {"kind": "name", "context": "Call", "old": "list", "new": "dict"} in patch
+
+    similar = BROKEN.replace("test_create_order", "test_create_review").replace("/orders/42", "/reviews")
+    fixed = apply_patch(similar, patch)
+    assert "status_code == 201" in fixed and "dict)" in fixed and "def test_create_review" in fixed
+
+    # Structural rewrites aren't cacheable; unrelated tests don't match
+    assert derive_patch(BROKEN, BROKEN + "    assert True\n") is None
+    assert apply_patch("def test_x():\n    assert 1\n", patch) is None
+
+def test_lru_eviction_and_hit_rate():
+    root = tempfile.mkdtemp()
+    try:
+        cache = FixCache(os.path.join(root, "fix_cache.json"), max_entries=2)
+        patch = derive_patch(BROKEN, HEALED)
+        cache.store("a", patch)
+        cache.store("b", patch)
+        assert cache.lookup("a") == patch   # "a" becomes most recent
+        cache.store("c", patch)             # evicts "b"
+        assert cache.lookup("b") is None
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        assert stats["hit_rate"] == 0.5
+
+        reloaded = FixCache(os.path.join(root, "fix_cache.json"), max_entries=2)
+        assert reloaded.lookup("c") == patch
+
+        # A patch that can't be persisted is refused without breaking the cache
+        assert not reloaded.store("d", [{"kind": "const", "context": "Compare", "old": b"x", "new": b"y"}])
+        assert reloaded.lookup("d") is None
+        reloaded.invalidate("c")
+        assert reloaded.store("e", patch) and reloaded.stats()["entries"] == 2
+        assert sorted(os.listdir(root)) == ["fix_cache.json"]  # No temp files left behind
+    finally:
+        shutil.rmtree(root)
+
+class ScriptedLLM:
+    """Stands in for GeminiClient: returns canned responses and counts the calls."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return self.responses.pop(0)
+
+def test_full_and_targeted_heals_go_through_the_cache_and_get_confirmed(monkeypatch):
+    import json
+    from app.agents.healer import SelfHealingAgent
+
+    monkeypatch.setenv("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY") or "test")
+    root = tempfile.mkdtemp()
+    try:
+        healer = SelfHealingAgent()
+        healer.fix_cache = FixCache(os.path.join(root, "fix_cache.json"))
+        outcomes = {}
+        verified = []
+
+        def verify(path, names):
+            verified.append(names)
+            return {"status": "success", "cases": {name: outcomes[name] for name in names}}
+
+        def failure(name):
+            return json.dumps([{"case": name, "message": "AssertionError: Expected 200 but got 201"}])
+
+        # 1. Full-file heal: the LLM fixes it, the rerun passes, the fix is cached
+        suite = os.path.join(root, "test_orders.py")
+        with open(suite, "w") as f:
+            f.write(BROKEN)
+        healer.client = ScriptedLLM(HEALED)
+        outcomes["test_create_order"] = "passed"
+        result = healer.heal_test_case(suite, failure("test_create_order"), verify=verify)
+        assert result["verification"]["passed"] == ["test_create_order"]
+        assert healer.fix_cache.stats()["entries"] == 1
+
+        # 2. Same failure shape in another suite: healed from the cache, no LLM call.
+        #    The rerun fails this time, so the cached fix is evicted.
+        other = os.path.join(root, "test_shop.py")
+        similar = BROKEN.replace("test_create_order", "test_place_order")
+        with open(other, "w") as f:
+            f.write(similar)
+        healer.client = ScriptedLLM()
+        outcomes["test_place_order"] = "failed"
+        result = healer.heal_test_case(other, failure("test_place_order"), verify=verify)
+        assert result["cache_hits"] == ["test_place_order"] and healer.client.calls == 0
+        with open(other) as f:
+            assert "status_code == 201" in f.read()
+        assert healer.fix_cache.stats()["entries"] == 0 and healer.fix_cache.stats()["invalidations"] == 1
+
+        # 3. Targeted heal learns the fix again once its rerun passes, then reuses it
+        with open(other, "w") as f:
+            f.write(similar)
+        healer.client = ScriptedLLM(HEALED.replace("test_create_order", "test_place_order"))
+        outcomes["test_place_order"] = "passed"
+        result = healer.heal_test_case(other, failure("test_place_order"), mode="targeted", verify=verify)
+        assert result["verification"]["passed"] == ["test_place_order"] and healer.client.calls == 1
+        assert healer.fix_cache.stats()["entries"] == 1
+
+        with open(other, "w") as f:
+            f.write(similar)
+        result = healer.heal_test_case(other, failure("test_place_order"), mode="targeted", verify=verify)
+        assert result["cache_hits"] == ["test_place_order"] and healer.client.calls == 1
+        assert verified == [["test_create_order"]] + [["test_place_order"]] * 3
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import pytest
+from app.agents.mock_server import MockTargetServer
+from app.agents.rl_engine import RLEngine
+from app.agents.fuzzer import FuzzEngine, MAX_RATE, MAX_ROUNDS
+from app.agents.mutations import MutationCatalog, ACTION_OPERATORS
+
+ENDPOINTS = [
+    {"method": "GET", "path": "/products", "payload_schema": {}},
+    {"method": "POST", "path": "/products", "payload_schema": {"name": "string", "price": "number"}},
+]
+
+def test_latency_excludes_time_queued_for_a_pooled_connection():
+    root = tempfile.mkdtemp()
+    server = MockTargetServer(ENDPOINTS[:1], latency=0.5).start()
+    try:
+        rl = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "q_table"))
+        fuzzer = FuzzEngine(rl, max_connections=2, rate_limit=0, batch_size=10, slow_threshold=1.0)
+        report = fuzzer.fuzz(server.base_url, ENDPOINTS[:1], rounds=1)
+        assert report["probes"] == 10
+        assert report["elapsed_seconds"] >= 2.5  # Five waves of two connections
+        assert 500 <= report["latency_ms"]["p50"] < 800 and report["latency_ms"]["p95"] < 1000
+        assert report["findings"] == []  # Nothing was slow on the target's side
+        rl.store.close()
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+def test_fuzzer_probes_concurrently_and_rewards_crashes():
+    root = tempfile.mkdtemp()
+    server = MockTargetServer(ENDPOINTS, status_overrides={"POST /products": 500}).start()
+    try:
+        rl = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "q_table"))
+        report = FuzzEngine(rl, rate_limit=0).fuzz(server.base_url, ENDPOINTS, rounds=5)
+        assert report["probes"] == 5 * len(ENDPOINTS)
+        assert report["statuses"]["500"] == 5
+        assert {f["endpoint"] for f in report["findings"]} == {"POST /products"}
+        # Crashes raise the policy's value for the crashing route only
+        assert max(rl.q_table["POST /products"].values()) > 0
+        assert max(rl.q_table["GET /products"].values()) < max(rl.q_table["POST /products"].values())
+        rl.store.close()
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+def test_mutation_catalog_is_schema_aware_and_reproducible():
+    schema = {"type": "object", "required": ["name"],
+              "properties": {"name": {"type": "string"}, "price": {"type": "number"}}}
+    catalog = MutationCatalog()
+    first = catalog.generate_batch([schema, schema], ["overflow", "type_mismatch"], n=50, seed=11)
+    again = catalog.generate_batch([schema, schema], ["overflow", "type_mismatch"], n=50, seed=11)
+    assert [[m["operator"] for m in batch] for batch in first] == [[m["operator"] for m in batch] for batch in again]
+    assert [m["body"] for m in first[1]] == [m["body"] for m in again[1]]
+    assert {m["operator"] for m in first[0]} == set(ACTION_OPERATORS["overflow"])
+
+    for mutation in catalog.generate(schema, "null_injection", 100, seed=1):
+        if mutation["operator"] == "missing_required":
+            assert "name" not in mutation["body"] and mutation["body"]["price"] == 1.0
+    confused = [m for m in first[1] if m["operator"] == "type_confusion" and m["field"] == "price"]
+    assert confused and all(not isinstance(m["body"]["price"], float) for m in confused)
+    assert any(m["headers"] for m in first[1])
+
+def test_fuzzer_sends_seeded_payload_batches():
+    root = tempfile.mkdtemp()
+    server = MockTargetServer(ENDPOINTS).start()
+    try:
+        rl = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "q_table"))
+        engine = FuzzEngine(rl, rate_limit=0, batch_size=8, seed=3)
+        report = engine.fuzz(server.base_url, ENDPOINTS, rounds=2)
+        assert report["probes"] == 2 * 8 * len(ENDPOINTS)
+        assert sum(report["operators"].values()) == report["probes"]
+        # Every probe is one policy observation
+        assert rl.store.stats[:, :, 0].sum() == report["probes"]
+        actions = ["overflow"] * len(ENDPOINTS)
+        assert engine._build_requests(ENDPOINTS, actions, 1) == engine._build_requests(ENDPOINTS, actions, 1)
+        rl.store.close()
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+def test_fuzz_sessions_are_bounded():
+    rl = object()  # Rejected before the policy is ever used
+    for bad in ({"rate_limit": -1}, {"rate_limit": MAX_RATE + 1}, {"batch_size": 0}, {"batch_size": 1000},
+                {"max_connections": 10 ** 4}, {"timeout": 0}):
+        with pytest.raises(ValueError):
+            FuzzEngine(rl, **bad)
+    for rounds in (0, MAX_ROUNDS + 1):
+        with pytest.raises(ValueError, match="rounds"):
+            FuzzEngine(rl).fuzz("http://localhost:1", ENDPOINTS, rounds=rounds)
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+from app.agents.scanner import ProjectScanner
+from app.agents.code_slicer import diagnosis_context, match_endpoint
+
+SERVER = '''const express = require('express');
+const app = express();
+app.use(express.json());
+
+function findUser(id) {
+  return users.find(u => u.id === id);
+}
+
+app.get('/users/:id', (req, res) => {
+  const user = findUser(req.params.id); // ) in a comment
+  res.json({ name: user.name, note: "a)b" });
+});
+
+app.get('/health', (req, res) => res.send('ok'));
+'''
+
+ROUTER = '''const router = require('express').Router();
+const { auth } = require('./auth');
+
+router.post('/:id', auth, async (req, res) => {
+  res.status(201).json({});
+});
+module.exports = router;
+'''
+
+AUTH = '''function auth(req, res, next) {
+  next();
+}
+module.exports = { auth };
+'''
+
+def _scan(root):
+    scanner = ProjectScanner()
+    endpoints = []
+    for name, content in (("server.js", SERVER), ("products.js", ROUTER), ("auth.js", AUTH)):
+        path = os.path.join(root, name)
+        with open(path, "w") as f:
+            f.write(content)
+        for ep in scanner.analyze_file_static(content, name):
+            ep["source_file"] = path
+            endpoints.append(ep)
+    return endpoints
+
+def test_scanner_records_handler_spans_and_middleware():
+    root = tempfile.mkdtemp()
+    try:
+        endpoints = {(ep["method"], ep["path"]): ep for ep in _scan(root)}
+        assert (endpoints[("GET", "/users/:id")]["start_line"], endpoints[("GET", "/users/:id")]["end_line"]) == (9, 12)
+        assert endpoints[("GET", "/health")]["start_line"] == endpoints[("GET", "/health")]["end_line"] == 14
+        assert endpoints[("POST", "/:id")]["middleware"] == ["auth"]
+    finally:
+        shutil.rmtree(root)
+
+def test_diagnosis_context_sends_only_the_hit_handlers():
+    root = tempfile.mkdtemp()
+    try:
+        endpoints = _scan(root)
+        # Mounted router paths match on their suffix
+        assert match_endpoint("POST /products/{}", endpoints)["path"] == "/:id"
+        assert match_endpoint("DELETE /users/{}", endpoints) is None
+
+        context = diagnosis_context(endpoints, ["GET /users/{}", "POST /products/{}"])
+        assert context["endpoints"] == ["GET /users/:id", "POST /:id"]
+        source = context["source"]
+        assert "function findUser" in source and "function auth" in source
+        assert "app.use(express.json())" in source
+        assert "/health" not in source
+
+        assert len(diagnosis_context(endpoints, ["GET /users/{}"], max_chars=100)["source"]) <= 100
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import pytest
+from app.agents.mock_server import MockTargetServer
+from app.agents.executor import TestExecutor as Executor
+from app.agents.fix_cache import FixCache
+from app.agents.orchestrator import HealingLoop, SpeculativeHealer
+
+ENDPOINTS = [
+    {"method": "GET", "path": "/products", "payload_schema": {}},
+    {"method": "POST", "path": "/products", "payload_schema": {"name": "string"}},
+]
+
+SUITE = '''import pytest
+
+@pytest.fixture
+def base_url():
+    return BASE_URL
+
+def test_list(base_url, api_client):
+    assert isinstance(api_client.get(f"{base_url}/products").json(), list)
+
+def test_create(base_url, api_client):
+    assert api_client.post(f"{base_url}/products", json={"name": "Pen"}).status_code == 200
+
+def test_missing(base_url, api_client):
+    assert api_client.get(f"{base_url}/nope").status_code == 200
+'''
+
+def fix(name, path, status):
+    if name == "test_create":
+        return f'''def test_create(base_url, api_client):
+    assert api_client.post(f"{{base_url}}{path}", json={{"name": "Pen"}}).status_code == {status}
+'''
+    return f'''def test_missing(base_url, api_client):
+    assert api_client.get(f"{{base_url}}{path}").status_code == {status}
+'''
+
+class PromptLLM:
+    """
+    Stands in for GeminiClient under concurrent prompts: answers with the fix
+    registered for the test being healed (and speculative candidate number).
+    """
+    def __init__(self, fixes, block=None):
+        self.fixes = fixes
+        self.block = block or {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self.lock:
+            self.calls += 1
+        name = re.search(r"these functions: (\w+)", prompt).group(1)
+        candidate = re.search(r"Candidate #(\d+)", prompt)
+        key = (name, int(candidate.group(1)) - 1 if candidate else 0)
+        if key in self.block:
+            self.block[key].wait(10)
+        return self.fixes.get(key, self.fixes.get(name))
+
+@pytest.fixture
+def workspace(monkeypatch):
+    from app.agents.healer import SelfHealingAgent
+    monkeypatch.setenv("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY") or "test")
+    root = tempfile.mkdtemp()
+    server = MockTargetServer(ENDPOINTS).start()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(f"BASE_URL = {server.base_url!r}\n" + SUITE)
+        healer = SelfHealingAgent()
+        healer.fix_cache = FixCache(os.path.join(root, "fix_cache.json"))
+        yield suite, healer, Executor(global_timeout=30, record_http=False)
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+def test_loop_heals_independent_failures_until_green(workspace):
+    suite, healer, executor = workspace
+    healer.client = PromptLLM({"test_create": fix("test_create", "/products", 201),
+                               "test_missing": fix("test_missing", "/nope", 404)})
+    events = []
+    outcome = HealingLoop(executor, healer).run(suite, "ns", on_event=events.append)
+
+    report = outcome["report"]
+    assert report["stop_reason"] == "green" and outcome["results"]["status"] == "success"
+    assert len(report["iterations"]) == 1 and healer.client.calls == 2
+    assert sorted(report["iterations"][0]["healed"]) == ["test_create", "test_missing"]
+    assert report["tokens_used"] > 0
+    assert outcome["results"]["selected"] == ["test_create", "test_missing"]  # Only the healed tests reran
+    assert [e["type"] for e in events] == ["run_started", "run_finished", "healing_started", "healing_finished",
+                                           "run_started", "run_finished", "finished"]
+
+def test_loop_stops_when_a_budget_or_the_iteration_limit_runs_out(workspace):
+    suite, healer, executor = workspace
+    wrong = {"test_create": fix("test_create", "/products", 202), "test_missing": fix("test_missing", "/nope", 202)}
+    with open(suite) as f:
+        original = f.read()
+
+    def run(**kwargs):
+        with open(suite, "w") as f:
+            f.write(original)
+        healer.client = PromptLLM(wrong)
+        return HealingLoop(executor, healer).run(suite, "ns", **kwargs)["report"]
+
+    report = run(max_iterations=2)
+    assert report["stop_reason"] == "max_iterations" and len(report["iterations"]) == 2
+
+    report = run(max_iterations=5, token_budget=1)
+    assert report["stop_reason"] == "token_budget" and len(report["iterations"]) == 1
+
+    report = run(max_iterations=5, time_budget=0.0)
+    assert report["stop_reason"] == "time_budget" and report["iterations"] == [] and healer.client.calls == 0
+
+def test_loop_stops_when_no_fix_can_be_applied(workspace):
+    suite, healer, executor = workspace
+    healer.client = PromptLLM({"test_create": "def test_create(:\n", "test_missing": "def test_missing(:\n"})
+    with open(suite) as f:
+        original = f.read()
+    report = HealingLoop(executor, healer).run(suite, "ns")["report"]
+    assert report["stop_reason"] == "no_progress"
+    assert sorted(report["iterations"][0]["errors"]) == ["test_create", "test_missing"]
+    with open(suite) as f:
+        assert f.read() == original
+
+def test_speculative_keeps_the_first_green_candidate_and_cancels_the_rest(workspace):
+    suite, healer, executor = workspace
+    release = threading.Event()
+    healer.client = PromptLLM({
+        ("test_create", 0): fix("test_create", "/products", 202),
+        ("test_create", 1): fix("test_create", "/products", 201),
+        ("test_create", 2): fix("test_create", "/products", 203),  # Still thinking when the winner lands
+    }, block={("test_create", 2): release})
+
+    sandboxes = []
+    run_nodes = executor.run_nodes
+    def recording_run_nodes(test_file_path, *args, **kwargs):
+        with open(test_file_path) as f:
+            sandboxes.append((os.path.dirname(test_file_path), f.read()))
+        return run_nodes(test_file_path, *args, **kwargs)
+    executor.run_nodes = recording_run_nodes
+
+    failures = executor.run_test_suite(suite, "ns")["failures"]
+    create = [f for f in failures if f["case"] == "test_create"]
+    try:
+        result = SpeculativeHealer(executor, healer).heal(suite, create, "ns", candidates=3)
+    finally:
+        release.set()
+
+    assert result["status"] == "healed" and result["winners"] == {"test_create": 1}
+    with open(suite) as f:
+        healed = f.read()
+    assert "status_code == 201" in healed and "/nope\").status_code == 200" in healed
+
+    # The blocked candidate sees the cancel event and never reaches pytest;
+    # every sandbox that did run is removed once its run ends
+    deadline = time.monotonic() + 10
+    while healer.client.calls < 3 or any(os.path.exists(d) for d, _ in sandboxes):
+        assert time.monotonic() < deadline, "speculative candidates did not wind down"
+        time.sleep(0.1)
+    time.sleep(0.5)
+    assert 1 <= len(sandboxes) <= 2
+    assert not any("== 203" in code for _, code in sandboxes)
+    assert all(os.path.basename(d).startswith("heal_candidate_") for d, _ in sandboxes)
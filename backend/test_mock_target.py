@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import pytest
+from app.agents.mock_server import MockTargetServer
+from app.agents.executor import TestExecutor as Executor
+
+ENDPOINTS = [
+    {"method": "GET", "path": "/products", "payload_schema": {}},
+    {"method": "POST", "path": "/products", "payload_schema": {"name": "string", "price": "number"}},
+    # Mounted router route: only the suffix is known to the scanner
+    {"method": "GET", "path": "/:id", "payload_schema": {}},
+    {"method": "DELETE", "path": "/products/:id", "payload_schema": {}},
+]
+
+SUITE = '''import pytest
+
+@pytest.fixture
+def base_url():
+    return "http://localhost:1"  # Nothing listens here; the executor retargets the run
+
+def test_create_then_read(base_url, api_client):
+    created = api_client.post(f"{base_url}/products", json={"name": "Pen"})
+    assert created.status_code == 201
+    item_id = created.json()["id"]
+    fetched = api_client.get(f"{base_url}/products/{item_id}")
+    assert fetched.json()["name"] == "Pen"
+
+def test_list(base_url, api_client):
+    assert isinstance(api_client.get(f"{base_url}/products").json(), list)
+'''
+
+def test_store_overrides_and_seeded_errors():
+    server = MockTargetServer(ENDPOINTS, status_overrides={"delete /products/:id": 403})
+    try:
+        status, created = server.handle("POST", "/products", {"name": "Pen"})
+        assert status == 201 and created["price"] == 1.0 and created["name"] == "Pen"
+        assert server.handle("GET", f"/products/{created['id']}", None) == (200, created)
+        assert server.handle("DELETE", "/products/1", None)[0] == 403
+        assert server.handle("PUT", "/products/1", {})[0] == 404
+    finally:
+        server.stop()
+
+    def outcomes():
+        flaky = MockTargetServer(ENDPOINTS, error_rate=0.5, seed=7)
+        try:
+            return [flaky.handle("GET", "/products", None)[0] for _ in range(20)]
+        finally:
+            flaky.stop()
+    first = outcomes()
+    assert 500 in first and 200 in first
+    assert first == outcomes()
+
+def test_run_targets_the_mock_server(monkeypatch):
+    root = tempfile.mkdtemp()
+    server = MockTargetServer(ENDPOINTS).start()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(SUITE)
+        results = Executor(global_timeout=30).run_test_suite(suite, "ns", base_url=server.base_url)
+        assert results["status"] == "success", results["logs"]
+        assert results["summary"]["passed"] == 2
+    finally:
+        server.stop()
+        shutil.rmtree(root)
+
+def test_environments_run_concurrently_and_differences_are_flagged(monkeypatch):
+    root = tempfile.mkdtemp()
+    stable = MockTargetServer(ENDPOINTS).start()
+    canary = MockTargetServer(ENDPOINTS, status_overrides={"GET /products": 503}).start()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(SUITE)
+        outcome = Executor(global_timeout=30).run_across_targets(
+            suite, [stable.base_url, canary.base_url], "ns", labels=["stable", "canary"]
+        )
+        assert outcome["status"] == "mixed"
+        comparison = outcome["comparison"]
+        assert comparison["differences"] == ["test_list"]
+        assert comparison["cases"]["test_list"] == {"stable": "passed", "canary": "failed"}
+        assert comparison["summary"]["stable"]["passed"] == 2
+    finally:
+        stable.stop()
+        canary.stop()
+        shutil.rmtree(root)
+
+def test_environments_need_unique_labels():
+    executor = Executor(global_timeout=30)
+    with pytest.raises(ValueError, match="unique"):
+        executor.run_across_targets("test_suite.py", ["http://a", "http://a"], "ns")
+    with pytest.raises(ValueError, match="unique"):
+        executor.run_across_targets("test_suite.py", ["http://a", "http://b"], "ns", labels=["env", "env"])
@@ -0,0 +1,244 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import pytest
+from app.agents.repository import JsonRepository, SqliteRepository, default_state, make_repository
+
+STATE = {
+    "project_name": "shop.zip",
+    "upload_path": "storage/sessions/u1/uploads/shop.zip",
+    "endpoints": [{"method": "GET", "path": "/items", "payload_schema": {}},
+                  {"method": "POST", "path": "/items", "payload_schema": {"name": "string"}}],
+    "test_file": "tests/generated/test_shop.py",
+    "latest_results": {"status": "success", "run_id": "r1"},
+}
+
+def make_backend(kind, root):
+    if kind == "json":
+        return JsonRepository(os.path.join(root, "sessions"), os.path.join(root, "users"))
+    return SqliteRepository(os.path.join(root, "app.db"))
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_backends_round_trip_state_and_history(kind):
+    root = tempfile.mkdtemp()
+    try:
+        repo = make_backend(kind, root)
+        assert repo.load_state("u1") == default_state()
+        repo.save_state("u1", STATE)
+        assert repo.load_state("u1") == STATE
+        assert repo.load_state("u2") == default_state()
+
+        for i in range(105):
+            repo.append_run("u1", {"timestamp": f"2026-01-01T00:00:{i:03d}", "run_id": f"r{i}", "project_name": "shop.zip",
+                                   "status": "passed", "mode": "full", "reward": i, "summary": {"passed": i},
+                                   "test_file": "t.py"})
+        runs = repo.list_runs("u1")
+        assert len(runs) == 100 and runs[0]["run_id"] == "r5" and runs[-1]["summary"] == {"passed": 104}
+        assert len(repo.list_runs("u1", limit=500)) == 105  # No longer capped at 100
+        assert repo.run_stats("u1") == {"total_runs": 105, "passed_runs": 105, "avg_reward": 52.0, "active_projects": 1}
+
+        repo.delete_session("u1")
+        assert repo.load_state("u1") == default_state()
+        assert len(repo.list_runs("u1", limit=3)) == 3  # History survives logout
+    finally:
+        shutil.rmtree(root)
+
+def test_sqlite_uses_wal_and_migrates_json_files(monkeypatch):
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        legacy = JsonRepository()
+        legacy.save_state("alice", STATE)
+        legacy.append_run("alice", {"timestamp": "2026-01-01", "run_id": "r1", "status": "failed", "summary": {}})
+
+        repo = make_repository("sqlite", "storage/app.db")
+        assert isinstance(repo, SqliteRepository)
+        assert repo.load_state("alice") == STATE
+        assert [r["run_id"] for r in repo.list_runs("alice")] == ["r1"]
+        assert sqlite3.connect("storage/app.db").execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        # Unchanged endpoint catalogs are not rewritten
+        before = repo._conn().total_changes
+        repo.save_state("alice", dict(STATE, test_file="other.py"))
+        assert repo._conn().total_changes - before == 1  # Just the session row
+        repo.save_state("alice", dict(STATE, endpoints=STATE["endpoints"][:1]))
+        assert len(repo.load_state("alice")["endpoints"]) == 1
+
+        repo.save_q_values("alice", "shop", {"GET /items": {"standard": 1.5}})
+        assert repo.load_q_values("alice", "shop") == {"GET /items": {"standard": 1.5}}
+        assert isinstance(make_repository("json"), JsonRepository)
+    finally:
+        shutil.rmtree(root)
+
+def test_sqlite_migration_copies_the_whole_json_log_and_its_totals():
+    root = tempfile.mkdtemp()
+    try:
+        source = JsonRepository(os.path.join(root, "sessions"), os.path.join(root, "users"),
+                                segment_bytes=5000, max_segments=3)
+        for i in range(250):
+            source.append_run("u1", {"timestamp": f"2026-02-01T00:{i // 60:02d}:{i % 60:02d}", "run_id": f"r{i}",
+                                     "project_name": f"p{i % 3}.zip", "status": "passed" if i % 2 else "failed",
+                                     "reward": 1.0})
+        retained = [e["run_id"] for e in source.iter_runs("u1")]
+        assert 100 < len(retained) < 250 and retained[-1] == "r249"  # More than a page, less than was logged
+
+        target = SqliteRepository(os.path.join(root, "app.db"))
+        counts = target.import_from(source)
+        assert counts["runs"] == len(retained)
+        assert [e["run_id"] for e in target.iter_runs("u1")] == retained
+        # Totals still count the runs retention dropped, projects included
+        assert target.run_stats("u1") == source.run_stats("u1") == {
+            "total_runs": 250, "passed_runs": 125, "avg_reward": 1.0, "active_projects": 3}
+    finally:
+        shutil.rmtree(root)
+
+def test_state_cache_merges_overlapping_requests_and_coalesces_writes():
+    import threading
+    from app.agents.state_cache import StateCache
+
+    class CountingRepository(JsonRepository):
+        writes = 0
+        def save_state(self, user_id, state):
+            CountingRepository.writes += 1
+            super().save_state(user_id, state)
+
+    root = tempfile.mkdtemp()
+    try:
+        repo = CountingRepository(os.path.join(root, "sessions"), os.path.join(root, "users"))
+        repo.save_state("u1", STATE)
+        CountingRepository.writes = 0
+        cache = StateCache(repo, flush_delay=0.2)
+
+        # Two requests load the same state; each changes a different key
+        run = cache.load("u1")
+        fuzz = cache.load("u1")
+        run["latest_results"] = {"status": "failed"}
+        fuzz["latest_fuzz"] = {"probes": 10}
+        cache.save("u1", run)
+        cache.save("u1", fuzz)
+        merged = cache.load("u1")
+        assert merged["latest_results"] == {"status": "failed"} and merged["latest_fuzz"] == {"probes": 10}
+
+        def burst():
+            for i in range(20):
+                state = cache.load("u1")
+                state["counter"] = i
+                cache.save("u1", state)
+        threads = [threading.Thread(target=burst) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert repo.writes < 10  # 82 saves, coalesced
+        cache.close()
+        on_disk = repo.load_state("u1")
+        assert on_disk["latest_fuzz"] == {"probes": 10} and on_disk["counter"] == 19
+
+        # Another worker changes the repository; invalidation makes this one re-read it
+        repo.save_state("u1", dict(on_disk, project_name="other.zip"))
+        assert cache.load("u1")["project_name"] == "shop.zip"
+        cache.invalidate("u1")
+        assert cache.load("u1")["project_name"] == "other.zip"
+    finally:
+        shutil.rmtree(root)
+
+def test_json_history_log_rotates_and_keeps_running_aggregates():
+    import json
+    root = tempfile.mkdtemp()
+    try:
+        users = os.path.join(root, "users")
+        os.makedirs(os.path.join(users, "u1"))
+        with open(os.path.join(users, "u1", "run_history.json"), "w") as f:
+            json.dump([{"run_id": "legacy", "status": "failed", "reward": -5, "project_name": "old.zip"}], f)
+
+        repo = JsonRepository(os.path.join(root, "sessions"), users, segment_bytes=1000, max_segments=3)
+        for i in range(60):
+            repo.append_run("u1", {"run_id": f"r{i}", "status": "passed" if i % 2 else "failed",
+                                   "reward": 1.0, "project_name": f"p{i % 3}.zip", "summary": {}})
+        files = sorted(os.listdir(os.path.join(users, "u1")))
+        assert "run_history.json.migrated" in files and "run_aggregates.json" in files
+        assert len([f for f in files if f.startswith("run_history.0")]) == 3  # Older segments were dropped
+
+        # Aggregates still count every run, including the migrated and the rotated-away ones
+        fresh = JsonRepository(os.path.join(root, "sessions"), users)
+        assert fresh.run_stats("u1") == {"total_runs": 61, "passed_runs": 30, "avg_reward": 55 / 61, "active_projects": 4}
+        assert [r["run_id"] for r in fresh.list_runs("u1", limit=3)] == ["r57", "r58", "r59"]
+    finally:
+        shutil.rmtree(root)
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_history_pages_are_filtered_projected_and_stable_under_appends(kind):
+    root = tempfile.mkdtemp()
+    try:
+        repo = make_backend(kind, root)
+        if kind == "json":
+            repo.segment_bytes = 2000  # Pages must span rotated segments too
+        for i in range(40):
+            repo.append_run("u1", {"timestamp": f"2026-03-{1 + i // 10:02d}T10:00:{i:02d}", "run_id": f"r{i}",
+                                   "project_name": "a.zip" if i % 2 else "b.zip", "status": "passed" if i % 4 else "failed",
+                                   "reward": float(i), "summary": {"passed": i}, "test_file": "t.py"})
+
+        page = repo.query_runs("u1", limit=5, project="a.zip", fields=["run_id", "reward"])
+        assert page["history"] == [{"run_id": f"r{i}", "reward": float(i)} for i in (39, 37, 35, 33, 31)]
+
+        repo.append_run("u1", {"timestamp": "2026-03-05T00:00:00", "run_id": "new", "project_name": "a.zip", "status": "passed"})
+        rest, cursor = [], page["next_cursor"]
+        while cursor:
+            more = repo.query_runs("u1", limit=5, cursor=cursor, project="a.zip", fields=["run_id"])
+            rest += [e["run_id"] for e in more["history"]]
+            cursor = more["next_cursor"]
+        assert rest == [f"r{i}" for i in range(29, 0, -2)]  # No duplicates or gaps despite the append
+
+        window = repo.query_runs("u1", since="2026-03-02", until="2026-03-03", status="failed", min_reward=13)
+        assert [e["run_id"] for e in window["history"]] == ["r16"]
+        assert window["history"][0]["summary"] == {"passed": 16}
+
+        # Well-formed base64 with the wrong payload is a bad cursor, not a crash
+        for cursor in ("MQ", "WzEsMiwzXQ", "WyJhIiwgImIiXQ", "not base64!"):  # 1, [1,2,3], ["a", "b"]
+            with pytest.raises(ValueError):
+                repo.query_runs("u1", cursor=cursor)
+
+        # A bounded scan returns a short page plus a cursor rather than walking the whole history
+        short = repo.query_runs("u1", limit=5, status="failed", max_scan=6)
+        assert len(short["history"]) < 5 and short["next_cursor"]
+    finally:
+        shutil.rmtree(root)
+
+def test_json_totals_survive_concurrent_writers_sharing_the_directory():
+    import threading
+    root = tempfile.mkdtemp()
+    try:
+        # Two repositories over one directory stand in for two server workers
+        workers = [JsonRepository(os.path.join(root, "sessions"), os.path.join(root, "users"), segment_bytes=3000)
+                   for _ in range(2)]
+        assert workers[1].run_stats("u1")["total_runs"] == 0
+
+        def append(repo, prefix):
+            for i in range(60):
+                repo.append_run("u1", {"timestamp": f"2026-04-01T00:00:{i:02d}", "run_id": f"{prefix}{i}",
+                                       "status": "passed", "reward": 1.0})
+
+        threads = [threading.Thread(target=append, args=(repo, name)) for repo, name in zip(workers, "ab")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for repo in workers:
+            assert repo.run_stats("u1")["total_runs"] == 120
+        assert len(list(workers[0].iter_runs("u1"))) == 120
+    finally:
+        shutil.rmtree(root)
+
+def test_backends_must_implement_the_whole_interface():
+    from app.agents.repository import StateRepository
+
+    class StateOnly(StateRepository):
+        def load_state(self, user_id):
+            return {}
+
+        def save_state(self, user_id, state):
+            pass
+
+    with pytest.raises(TypeError, match="append_run"):
+        StateOnly()
@@ -0,0 +1,258 @@
+import os
+import json
+import atexit
+import shutil
+import tempfile
+import numpy as np
+from app.agents.rl_engine import RLEngine
+from app.agents.policies import make_policy
+
+def test_batched_update_matches_sequential_updates():
+    root = tempfile.mkdtemp()
+    try:
+        paths = ["/a", "/b", "/a", "/c", "/a"]
+        actions = ["standard", "overflow", "standard", "null_injection", "sql_injection"]
+        rewards = [1.0, -2.0, 3.0, 0.5, 10.0]
+
+        batched = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "batched"), policy="epsilon_greedy")
+        batched.update_policies(paths, actions, rewards)
+
+        sequential = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "sequential"))
+        for path, action, reward in zip(paths, actions, rewards):
+            sequential.update_policy(path, action, reward)
+
+        for path in set(paths):
+            assert np.allclose(list(batched.q_table[path].values()), list(sequential.q_table[path].values()))
+
+        batched.epsilon = 0.0
+        assert batched.choose_actions(["/a", "/b", "/new"]) == ["sql_injection", "standard", "standard"]
+        batched.store.close()
+        sequential.store.close()
+    finally:
+        shutil.rmtree(root)
+
+def test_legacy_json_is_migrated_and_reloaded_memory_mapped():
+    root = tempfile.mkdtemp()
+    try:
+        legacy = os.path.join(root, "q_table.json")
+        with open(legacy, "w") as f:
+            json.dump({"/api/users": {"standard": -2.5, "overflow": 4.0}}, f)
+        storage_dir = os.path.join(root, "q_table")
+
+        RLEngine(legacy, storage_dir)
+        assert sorted(os.listdir(storage_dir)) == ["q_stats.npy", "q_values.npy", "states.json"]
+
+        reloaded = RLEngine(legacy, storage_dir)
+        assert isinstance(reloaded.store.values, np.memmap)
+        assert reloaded.q_table["/api/users"]["overflow"] == 4.0
+
+        # The first write copies the mapping instead of touching the file
+        reloaded.update_policies(["/api/new"], ["standard"], [1.0])
+        assert not isinstance(reloaded.store.values, np.memmap)
+        reloaded.store.close()
+        assert len(RLEngine(legacy, storage_dir).store) == 2
+    finally:
+        shutil.rmtree(root)
+
+def test_legacy_path_rows_seed_the_method_qualified_states_of_a_partition():
+    from app.agents.policy_store import PolicyStore
+    root = tempfile.mkdtemp()
+    try:
+        legacy = os.path.join(root, "q_table.json")
+        with open(legacy, "w") as f:
+            json.dump({"/api/users": {"standard": -2.5, "overflow": 4.0}}, f)
+        prior = RLEngine(legacy, os.path.join(root, "q_table"))
+        store = PolicyStore(os.path.join(root, "policies"), prior=prior)
+
+        engine = store.engine("alice", "shop")
+        assert engine.q_table["/api/users"]["overflow"] == 4.0
+        engine.policy = make_policy("epsilon_greedy", epsilon=0.0)
+        assert engine.choose_actions(["GET /api/users", "GET /api/other"]) == ["overflow", "standard"]
+        assert engine.q_table["GET /api/users"] == prior.q_table["/api/users"]
+        store.close()
+        prior.store.close()
+    finally:
+        shutil.rmtree(root)
+
+def test_partition_without_a_snapshot_is_restored_from_the_repository_mirror():
+    from app.agents.policy_store import PolicyStore
+    from app.agents.repository import SqliteRepository
+    root = tempfile.mkdtemp()
+    try:
+        legacy = os.path.join(root, "q_table.json")
+        with open(legacy, "w") as f:
+            json.dump({"GET /a": {"standard": -1.0}}, f)
+        prior = RLEngine(legacy, os.path.join(root, "q_table"))
+        repository = SqliteRepository(os.path.join(root, "app.db"))
+        policies = os.path.join(root, "policies")
+
+        store = PolicyStore(policies, prior=prior, mirror=repository.save_q_values, restore=repository.load_q_values)
+        with store.checkout("alice", "shop") as engine:
+            engine.update_policies(["GET /a", "GET /b"], ["overflow", "standard"], [4.0, 2.0])
+            learned = engine.q_table
+        store.close()
+        assert repository.load_q_values("alice", "shop") == learned
+
+        # The snapshot is gone (new disk, wiped volume): the mirror wins over the prior
+        shutil.rmtree(policies)
+        store = PolicyStore(policies, prior=prior, mirror=repository.save_q_values, restore=repository.load_q_values)
+        assert store.engine("alice", "shop").q_table == learned
+        assert store.engine("bob", "shop").q_table == prior.q_table  # Nothing mirrored: warm start as before
+        store.close()
+        prior.store.close()
+    finally:
+        shutil.rmtree(root)
+
+def test_updates_are_journaled_and_recovered_after_a_crash():
+    root = tempfile.mkdtemp()
+    try:
+        storage_dir = os.path.join(root, "q_table")
+        engine = RLEngine(os.path.join(root, "none.json"), storage_dir)
+        engine.store.snapshot_interval = 3600  # Flusher never fires during the test
+        engine.update_policies(["/a", "/b"], ["standard", "overflow"], [1.0, 2.0])
+        engine.save_q_table()
+        engine.update_policies(["/a", "/c"], ["standard", "standard"], [1.0, 5.0])
+        expected = engine.q_table
+
+        # No snapshot for the second batch: it lives only in the journal
+        assert sorted(os.listdir(storage_dir)) == ["journal.jsonl", "q_stats.npy", "q_values.npy", "states.json"]
+        with open(os.path.join(storage_dir, "journal.jsonl"), "a") as f:
+            f.write('{"states": ["/torn"')  # Crash mid-append
+        atexit.unregister(engine.store.close)  # A crashed process never runs its exit hooks
+
+        recovered = RLEngine(os.path.join(root, "none.json"), storage_dir)
+        assert recovered.q_table == expected
+        assert np.array_equal(recovered.store.stats, engine.store.stats)
+        assert "journal.jsonl" not in os.listdir(storage_dir)
+    finally:
+        shutil.rmtree(root)
+
+def test_bandit_policies_use_persisted_reward_statistics():
+    from app.agents.policies import POLICIES, simulate
+    root = tempfile.mkdtemp()
+    try:
+        storage_dir = os.path.join(root, "q_table")
+        engine = RLEngine(os.path.join(root, "none.json"), storage_dir, policy="ucb1")
+        engine.update_policies(["/a", "/a", "/a"], ["overflow", "overflow", "standard"], [10.0, -1.0, 1.0])
+        engine.store.close()
+
+        reloaded = RLEngine(os.path.join(root, "none.json"), storage_dir, policy="thompson_beta")
+        count, reward_sum, reward_sq_sum, successes = reloaded.store.stats[0, RLEngine.ACTIONS.index("overflow")]
+        assert (count, reward_sum, reward_sq_sum, successes) == (2, 9.0, 101.0, 1)
+        assert reloaded.epsilon is None
+
+        # UCB1 tries every untried action before repeating one
+        ucb = RLEngine(os.path.join(root, "none.json"), os.path.join(root, "ucb"), policy="ucb1")
+        tried = []
+        for _ in RLEngine.ACTIONS:
+            action = ucb.choose_action("/b")
+            ucb.update_policies(["/b"], [action], [0.0])
+            tried.append(action)
+        assert sorted(tried) == sorted(RLEngine.ACTIONS)
+        reloaded.store.close()
+        ucb.store.close()
+    finally:
+        shutil.rmtree(root)
+
+    for name in POLICIES:
+        run = simulate(name, endpoints=5, max_rounds=400, seed=3)
+        assert run["rounds_to_first_500s"] is not None, name
+
+def test_default_policy_wins_the_benchmark():
+    from app.agents.policies import DEFAULT_POLICY, benchmark
+    report = benchmark(["epsilon_greedy", DEFAULT_POLICY], trials=10, max_rounds=600)
+    default, baseline = report[DEFAULT_POLICY], report["epsilon_greedy"]
+    assert DEFAULT_POLICY == "ucb1"
+    assert default["unfinished"] == 0
+    assert default["median_rounds_to_first_500s"] < baseline["median_rounds_to_first_500s"]
+    assert default["median_rounds_to_find_all"] < baseline["median_rounds_to_find_all"]
+
+def test_rewards_are_attributed_per_endpoint_and_action():
+    from app.agents.reward_attribution import attribute_rewards
+    endpoints = [
+        {"method": "GET", "path": "/users/:id"},
+        {"method": "POST", "path": "/users"},
+        {"method": "GET", "path": "/health"},
+    ]
+    suite = '''import pytest
+
+def test_get_user(base_url, api_client):
+    assert api_client.get(f"{base_url}/users/7").status_code == 200
+
+def test_create_user_sql(base_url, api_client):
+    assert api_client.post(f"{base_url}/users", json={"name": "' OR 1=1"}).status_code == 400
+
+class TestUsers:
+    @pytest.mark.endpoint("POST", "/users")
+    @pytest.mark.action("overflow")
+    def test_long_name(self, base_url, api_client):
+        api_client.post(base_url + "/api/v1/people", json={"name": "A" * 10000})
+'''
+    results = {
+        "cases": {"test_get_user": "passed", "test_create_user_sql": "failed", "TestUsers::test_long_name": "passed"},
+        "failures": [{"case": "test_create_user_sql", "message": "AssertionError: assert 500 == 400"}],
+    }
+    rewards = {(r["endpoint"], r["action"]): r["reward"]
+               for r in attribute_rewards(suite, results, endpoints, RLEngine.ACTIONS)}
+    assert rewards == {
+        ("GET /users/:id", "standard"): 1.0,
+        ("POST /users", "sql_injection"): 5.0,  # Failed, but it crashed the server
+        ("POST /users", "overflow"): 1.0,
+    }
+
+    # A failed-mode rerun reports the merged suite, but only the rerun case earns a reward
+    rerun = dict(results, cases=dict(results["cases"], test_create_user_sql="passed"), failures=[],
+                 selected=["test_create_user_sql"], durations={"test_create_user_sql": 0.2})
+    assert [(r["endpoint"], r["action"], r["reward"])
+            for r in attribute_rewards(suite, rerun, endpoints, RLEngine.ACTIONS)] == [("POST /users", "sql_injection", 1.0)]
+    assert attribute_rewards(suite, dict(results, selected=[], durations={}), endpoints, RLEngine.ACTIONS) == []
+
+def test_policies_are_partitioned_per_tenant_and_warm_started_from_the_prior():
+    import threading
+    from app.agents.policy_store import PolicyStore
+    root = tempfile.mkdtemp()
+    try:
+        prior = RLEngine(None, os.path.join(root, "global"))
+        prior.update_policies(["POST /users"], ["overflow"], [10.0])
+        store = PolicyStore(os.path.join(root, "policies"), prior=prior, max_open=2)
+
+        alice, bob = store.engine("alice", "shop.zip"), store.engine("bob", "shop.zip")
+        assert alice is store.engine("alice", "shop.zip") and alice is not bob
+        assert alice.q_table["POST /users"] == prior.q_table["POST /users"]
+
+        def hammer(engine, reward):
+            for _ in range(50):
+                engine.update_policies(["GET /items"], ["standard"], [reward])
+        threads = [threading.Thread(target=hammer, args=(alice, 1.0)) for _ in range(4)]
+        threads += [threading.Thread(target=hammer, args=(bob, -1.0)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert alice.store.stats[alice.store.index["GET /items"], 0, 0] == 200
+        assert alice.q_table["GET /items"]["standard"] > 0 > bob.q_table["GET /items"]["standard"]
+        assert "GET /items" not in prior.q_table
+
+        # Evicted partitions are snapshotted and come back from disk
+        expected = alice.q_table
+        store.engine("carol", "api/v2 (copy)")
+        store.engine("dave", "shop.zip")
+        assert list(store.engines) == [("carol", "api/v2 (copy)"), ("dave", "shop.zip")]
+        store.release("carol")
+        assert store.engine("alice", "shop.zip").q_table == expected
+        assert os.path.isdir(os.path.join(root, "policies", "alice", "shop.zip"))
+
+        # Checked-out engines are neither evicted nor released under their users
+        with store.checkout("erin", "shop.zip") as erin:
+            store.engine("frank", "shop.zip")
+            store.engine("grace", "shop.zip")
+            assert ("erin", "shop.zip") in store.engines and len(store.engines) == 2
+            store.release("erin")
+            assert store.engine("erin", "shop.zip") is erin
+            erin.update_policies(["GET /items"], ["overflow"], [10.0])
+        assert ("erin", "shop.zip") not in store.engines
+        assert store.engine("erin", "shop.zip").q_table["GET /items"]["overflow"] > 0
+        store.close()
+        prior.store.close()
+    finally:
+        shutil.rmtree(root)
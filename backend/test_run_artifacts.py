@@ -0,0 +1,184 @@
+import os
+import signal
+import shutil
+import tempfile
+import pytest
+from app.agents import artifacts
+from app.agents.artifacts import RunArtifactStore
+
+def test_runs_get_isolated_dirs_and_ranged_logs(monkeypatch):
+    # Small chunks so the range below spans several compressed blocks
+    monkeypatch.setattr(artifacts, "LOG_CHUNK_SIZE", 16)
+    root = tempfile.mkdtemp()
+    try:
+        store = RunArtifactStore(root)
+        run_a = store.new_run("user_a")
+        run_b = store.new_run("user_a")
+        assert run_a != run_b
+        assert store.report_path("user_a", run_a) != store.report_path("user_a", run_b)
+
+        logs = "".join(f"line {i}\n" for i in range(100))
+        ref = store.write_logs("user_a", run_a, logs)
+        assert ref["size"] == len(logs)
+
+        window = store.read_logs("user_a", run_a, offset=30, length=45)
+        assert window["data"] == logs[30:75]
+        assert window["total"] == len(logs)
+
+        tail = store.read_logs("user_a", run_a, offset=len(logs) - 5)
+        assert tail["data"] == logs[-5:]
+
+        # Runs are scoped per namespace
+        with pytest.raises(FileNotFoundError):
+            store.read_logs("user_b", run_a)
+        with pytest.raises(ValueError):
+            store.read_logs("..", run_a)
+    finally:
+        shutil.rmtree(root)
+
+def test_prune_keeps_most_recent_runs():
+    root = tempfile.mkdtemp()
+    try:
+        store = RunArtifactStore(root, max_runs=2)
+        runs = [store.new_run("user_a") for _ in range(4)]
+        remaining = sorted(os.listdir(store.namespace_dir("user_a")))
+        assert remaining == sorted(runs)[-2:]
+    finally:
+        shutil.rmtree(root)
+
+SUITE = '''def test_item(api_client):
+    response = api_client.get(BASE_URL + "/items/1")
+    assert response.status_code == 200
+    assert response.json() == {"id": 1}
+'''
+
+def test_rerun_replays_recorded_http_without_the_target(monkeypatch):
+    import json
+    import threading
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from app.agents.executor import TestExecutor
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({"id": 1}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    root = tempfile.mkdtemp()
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(f"BASE_URL = 'http://127.0.0.1:{server.server_port}'\n\n" + SUITE)
+
+        executor = TestExecutor(global_timeout=30)
+        recorded = executor.run_test_suite(suite, "ns")
+        assert recorded["status"] == "success"
+        assert os.path.exists(recorded["cassette"]["path"])
+
+        # Target goes away; the replayed rerun still passes from the recording
+        server.shutdown()
+        server.server_close()
+        replayed = executor.run_test_suite(suite, "ns", baseline=recorded, replay=True)
+        assert replayed["status"] == "success"
+        assert replayed["cassette"]["hits"] == 1 and replayed["cassette"]["misses"] == 0
+    finally:
+        shutil.rmtree(root)
+
+SLOW_SUITE = '''import os
+import time
+
+def test_fast():
+    assert True
+
+def test_slow():
+    if os.path.exists(FLAG):
+        time.sleep(60)
+'''
+
+def test_timed_out_tests_are_harvested_then_retried_by_a_failed_rerun(monkeypatch):
+    from app.agents.executor import TestExecutor
+
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        flag = os.path.join(root, "slow.flag")
+        open(flag, "w").close()
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(f"FLAG = {flag!r}\n" + SLOW_SUITE)
+
+        executor = TestExecutor(test_timeout=0, global_timeout=6, record_http=False)
+        killed = executor.run_test_suite(suite, "ns")
+        assert killed["status"] == "timeout"
+        assert killed["cases"] == {"test_fast": "passed", "test_slow": "timeout"}
+        assert killed["summary"]["timeout"] == 1
+
+        os.remove(flag)
+        retried = executor.run_test_suite(suite, "ns", mode="failed", baseline=killed)
+        assert retried["selected"] == ["test_slow"]
+        assert retried["cases"] == {"test_fast": "passed", "test_slow": "passed"}
+        assert retried["status"] == "success" and retried["summary"]["timeout"] == 0
+    finally:
+        shutil.rmtree(root)
+
+@pytest.mark.skipif(not hasattr(signal, "SIGALRM"), reason="The per-test timeout relies on SIGALRM")
+def test_per_test_timeout_fails_only_the_hung_test(monkeypatch):
+    import time
+    from app.agents.executor import TestExecutor
+
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        flag = os.path.join(root, "slow.flag")
+        open(flag, "w").close()
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(f"FLAG = {flag!r}\n" + SLOW_SUITE)
+
+        started = time.monotonic()
+        results = TestExecutor(test_timeout=1, global_timeout=30, record_http=False).run_test_suite(suite, "ns")
+        assert time.monotonic() - started < 20  # SIGALRM interrupted the sleep, not the global budget
+        assert results["status"] == "failure"
+        assert results["cases"] == {"test_fast": "passed", "test_slow": "failed"}
+        assert "per-test timeout of 1.0s" in results["failures"][0]["message"]
+    finally:
+        shutil.rmtree(root)
+
+def test_conftest_is_installed_atomically_and_only_when_stale():
+    from app.agents.executor import TestExecutor, CONFTEST_MARKER, CONFTEST_TEMPLATE
+
+    root = tempfile.mkdtemp()
+    try:
+        suite = os.path.join(root, "test_suite.py")
+        conftest = os.path.join(root, "conftest.py")
+        executor = TestExecutor.__new__(TestExecutor)
+        with open(CONFTEST_TEMPLATE) as f:
+            template = f.read()
+
+        with open(conftest, "w") as f:
+            f.write(CONFTEST_MARKER + " (an older release)\n")
+        executor._ensure_conftest(suite)
+        with open(conftest) as f:
+            assert f.read() == template
+
+        os.utime(conftest, (0, 0))
+        executor._ensure_conftest(suite)
+        assert os.stat(conftest).st_mtime == 0  # Up to date: not rewritten
+        assert sorted(os.listdir(root)) == ["conftest.py"]
+
+        with open(conftest, "w") as f:
+            f.write("# Written by the user\n")
+        executor._ensure_conftest(suite)
+        with open(conftest) as f:
+            assert f.read() == "# Written by the user\n"
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import pytest
+from app.agents.repository import SqliteRepository
+from app.agents.run_stats import RunStatsStore, make_run_stats
+
+# Outcome and duration per run; every run is of the same test file version
+HISTORY = [
+    {"test_stable": ("passed", 0.1), "test_flaky": ("passed", 0.5), "test_late": ("passed", 0.2), "test_slow": ("passed", 1.0)},
+    {"test_stable": ("passed", 0.1), "test_flaky": ("failed", 0.5), "test_late": ("passed", 0.2), "test_slow": ("passed", 1.0)},
+    {"test_stable": ("passed", 0.1), "test_flaky": ("passed", 0.5), "test_late": ("passed", 0.2), "test_slow": ("passed", 3.0)},
+    {"test_stable": ("passed", 0.1), "test_flaky": ("failed", 0.5), "test_late": ("failed", 0.2), "test_slow": ("passed", 3.0)},
+]
+
+def results(run_id, cases, file_hash="h1"):
+    return {"run_id": run_id, "file_hash": file_hash,
+            "cases": {nodeid: outcome for nodeid, (outcome, _) in cases.items()},
+            "durations": {nodeid: duration for nodeid, (_, duration) in cases.items()}}
+
+@pytest.fixture
+def store():
+    root = tempfile.mkdtemp()
+    try:
+        repository = SqliteRepository(os.path.join(root, "app.db"))
+        store = RunStatsStore(connect=repository.connection)
+        for i, cases in enumerate(HISTORY):
+            store.record_run("u1/shop", results(f"r{i}", cases))
+        yield store
+    finally:
+        shutil.rmtree(root)
+
+def test_flakiness_counts_outcome_flips_between_runs_of_the_same_file(store):
+    assert store.flakiness("u1/shop") == {"test_stable": 0.0, "test_flaky": 1.0, "test_late": pytest.approx(1 / 3),
+                                          "test_slow": 0.0}
+
+    # An edited test file starts a new series: its first outcome is not a flip
+    store.record_run("u1/shop", results("r4", {"test_stable": ("failed", 0.1)}, file_hash="h2"))
+    assert store.flakiness("u1/shop")["test_stable"] == 0.0
+    assert store.flakiness("other/project") == {}
+
+def test_slowest_tests_rank_by_recent_average_duration(store):
+    assert [t["nodeid"] for t in store.slowest_tests("u1/shop")] == ["test_slow", "test_flaky", "test_late", "test_stable"]
+    assert store.slowest_tests("u1/shop", limit=2) == [{"nodeid": "test_slow", "avg_duration": 2.0},
+                                                       {"nodeid": "test_flaky", "avg_duration": 0.5}]
+    assert store.slowest_tests("u1/shop", limit=1, last_n_runs=2) == [{"nodeid": "test_slow", "avg_duration": 3.0}]
+    assert [p["duration"] for p in store.duration_trend("u1/shop", "test_slow")] == [1.0, 1.0, 3.0, 3.0]
+
+    report = store.report("u1/shop", limit=2)
+    assert [t["nodeid"] for t in report["slowest"]] == ["test_slow", "test_flaky"]
+    assert report["flaky"] == [{"nodeid": "test_flaky", "score": 1.0}, {"nodeid": "test_late", "score": 0.333}]
+
+def test_record_run_skips_cases_carried_over_from_the_baseline(store):
+    rerun = {"run_id": "r4", "file_hash": "h1", "cases": {"test_stable": "passed", "test_flaky": "passed"},
+             "durations": {"test_flaky": 0.5}}
+    store.record_run("u1/shop", rerun)
+    assert len(store.duration_trend("u1/shop", "test_stable")) == 4
+    assert len(store.duration_trend("u1/shop", "test_flaky")) == 5
+
+def test_stats_share_the_sqlite_repository_and_import_the_old_stats_file(monkeypatch):
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        os.makedirs("storage")
+        old = RunStatsStore(os.path.join("storage", "test_stats.db"))
+        old.record_run("u1/shop", results("r0", HISTORY[0]))
+
+        # A database from before the merge still holds the per-run copy of those rows
+        db_path = os.path.join("storage", "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE test_results (run INTEGER NOT NULL, nodeid TEXT NOT NULL, outcome TEXT NOT NULL, duration REAL)")
+        conn.execute("INSERT INTO test_results VALUES (1, 'test_stable', 'passed', 0.1)")
+        conn.commit()
+        conn.close()
+
+        repository = SqliteRepository(db_path)
+        store = make_run_stats(repository)
+        assert store.shared is not None
+        assert not os.path.exists(os.path.join("storage", "test_stats.db"))
+        store.record_run("u1/shop", results("r1", HISTORY[1]))
+
+        rows = repository.connection().execute("SELECT run_id, COUNT(*) FROM test_results GROUP BY run_id").fetchall()
+        assert rows == [("r0", 4), ("r1", 4)]
+        assert store.flakiness("u1/shop")["test_flaky"] == 1.0
+
+        # Restarting neither imports again nor drops the shared table
+        assert make_run_stats(SqliteRepository(db_path)).slowest_tests("u1/shop", limit=1)[0]["nodeid"] == "test_slow"
+        assert repository.connection().execute("SELECT COUNT(*) FROM test_results").fetchone() == (8,)
+    finally:
+        shutil.rmtree(root)
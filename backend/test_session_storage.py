@@ -1,8 +1,15 @@
+import io
 import os
+import time
 import shutil
+import tempfile
+import asyncio
+import zipfile
+import threading
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app, get_current_user_id, get_user_session_path
+from app.agents.execution import WorkPool, PoolBusy, JobCancelled
 
 client = TestClient(app)
 
@@ -58,6 +65,111 @@ def test_session_isolation():
     if os.path.exists("test_project_b.zip"): os.remove("test_project_b.zip")
     if os.path.exists(user_b_path): shutil.rmtree(user_b_path)
 
+def test_upload_scans_off_the_event_loop_in_bounded_pools():
+    app.dependency_overrides[get_current_user_id] = lambda: USER_A
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("server.js", "app.get('/items', (req, res) => res.json([]));\n")
+    try:
+        response = client.post("/upload", files={"file": ("pooled.zip", buffer.getvalue(), "application/zip")})
+        assert response.status_code == 200
+        assert [e["path"] for e in response.json()["endpoints_data"]] == ["/items"]
+
+        stats = client.get("/execution-stats").json()
+        assert stats["cpu"]["kind"] == "process" and stats["cpu"]["completed"] >= 1
+        assert stats["io"]["completed"] >= 2  # Cleanup and the upload copy
+    finally:
+        client.post("/logout")
+        app.dependency_overrides.clear()
+
+def test_storage_endpoints_run_in_the_threadpool():
+    # Synchronous SQLite/file calls inside an `async def` endpoint would stall the event loop
+    routes = {route.path: route.endpoint for route in app.routes if hasattr(route, "endpoint")}
+    for path in ("/dashboard-stats", "/history", "/test-stats", "/logout"):
+        assert not asyncio.iscoroutinefunction(routes[path]), path
+
+def test_invalid_run_targets_are_client_errors():
+    from app.main import load_state, save_state
+    app.dependency_overrides[get_current_user_id] = lambda: USER_A
+    root = tempfile.mkdtemp()
+    try:
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write("def test_ok():\n    assert True\n")
+        state = load_state(USER_A)
+        state.update({"test_file": suite, "endpoints": []})
+        save_state(state, USER_A)
+
+        response = client.post("/run-tests", json={"base_url": "mock"})
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("No scanned endpoints to mock")
+
+        # Results are keyed by target, so a repeated one is rejected rather than overwritten
+        response = client.post("/run-tests", json={"base_urls": ["http://localhost:1", "http://localhost:1"]})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Duplicate base_urls: http://localhost:1"
+    finally:
+        client.post("/logout")
+        app.dependency_overrides.clear()
+        shutil.rmtree(root)
+
+def test_test_stats_report_the_current_project(monkeypatch):
+    import app.main as main
+    from app.agents.run_stats import RunStatsStore
+    app.dependency_overrides[get_current_user_id] = lambda: USER_A
+    root = tempfile.mkdtemp()
+    try:
+        stats = RunStatsStore(os.path.join(root, "test_stats.db"))
+        monkeypatch.setattr(main, "test_stats", stats)
+        for i, outcome in enumerate(["passed", "failed", "passed"]):
+            stats.record_run(f"{USER_A}/shop", {"run_id": f"r{i}", "file_hash": "h1",
+                                                "cases": {"test_a": outcome, "test_b": "passed"},
+                                                "durations": {"test_a": 0.1, "test_b": 0.4}})
+        stats.record_run(f"{USER_B}/shop", {"run_id": "r0", "cases": {"test_c": "passed"}, "durations": {"test_c": 9.0}})
+        state = main.load_state(USER_A)
+        state["project_name"] = "shop.zip"
+        main.save_state(state, USER_A)
+
+        report = client.get("/test-stats", params={"limit": 5}).json()
+        assert report["project"] == f"{USER_A}/shop"
+        assert [t["nodeid"] for t in report["slowest"]] == ["test_b", "test_a"]
+        assert report["flaky"] == [{"nodeid": "test_a", "score": 1.0}]
+        assert len(report["trends"]["test_b"]) == 3
+    finally:
+        client.post("/logout")
+        app.dependency_overrides.clear()
+        shutil.rmtree(root)
+
+def test_pools_reject_when_full_and_cancel_queued_jobs_on_disconnect():
+    pool = WorkPool("test", "thread", max_workers=1, max_queue=1)
+    gate = threading.Event()
+    stopped = threading.Event()
+
+    async def disconnected():
+        return True
+
+    async def scenario():
+        running = asyncio.ensure_future(pool.run(gate.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(JobCancelled):  # Still queued behind the running job: never starts
+            await pool.run(time.sleep, 10, is_disconnected=disconnected)
+        queued = asyncio.ensure_future(pool.run(time.sleep, 0))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolBusy):
+            await pool.run(time.sleep, 0)
+        gate.set()
+        await asyncio.gather(running, queued)
+        with pytest.raises(JobCancelled):  # Already running: told to stop, result dropped
+            await pool.run(stopped.wait, 5, is_disconnected=disconnected, on_cancel=stopped.set)
+
+    try:
+        asyncio.run(scenario())
+        metrics = pool.metrics()
+        assert (metrics["cancelled"], metrics["abandoned"], metrics["rejected"]) == (1, 1, 1)
+        assert metrics["peak_queued"] == 1 and metrics["queued"] == 0
+    finally:
+        pool.close()
+
 if __name__ == "__main__":
     # Manually run if pytest not available
     try:
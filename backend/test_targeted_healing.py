@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import pytest
+from app.agents.executor import TestExecutor as Executor
+from app.agents.suite_source import extract_for_healing, splice_functions, impacted_tests, function_hashes
+
+SUITE = '''import pytest
+import requests
+
+BASE = "http://localhost:5000"
+UNUSED = 1
+
+def make_payload():
+    return {"name": "x"}
+
+@pytest.fixture
+def base_url():
+    return BASE
+
+def test_ok(base_url):
+    assert requests.get(base_url).status_code == 200
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_create(base_url, n):
+    assert requests.post(base_url, json=make_payload()).status_code == 200
+'''
+
+def test_extract_only_failing_tests_and_their_dependencies():
+    extracted = extract_for_healing(SUITE, ["test_create"])
+    assert list(extracted["targets"]) == ["test_create"]
+    assert "@pytest.mark.parametrize" in extracted["targets"]["test_create"]
+    context = extracted["context"]
+    assert "def make_payload" in context and "def base_url" in context and "BASE =" in context
+    assert "import requests" in context
+    assert "test_ok" not in context and "UNUSED" not in context
+
+def test_splice_replaces_only_allowed_functions():
+    healed = '''
+@pytest.mark.parametrize("n", [1, 2])
+def test_create(base_url, n):
+    assert requests.post(base_url, json=make_payload()).status_code == 201
+
+def test_ok(base_url):
+    assert False
+'''
+    result = splice_functions(SUITE, healed, ["test_create"])
+    assert result["replaced"] == ["test_create"]
+    assert "status_code == 201" in result["source"]
+    assert "assert False" not in result["source"]
+    assert result["source"].count("@pytest.mark.parametrize") == 1
+    compile(result["source"], "suite.py", "exec")
+
+    with pytest.raises(SyntaxError):
+        splice_functions(SUITE, "def test_create(:\n", ["test_create"])
+
+def test_impacted_follows_helper_changes():
+    baseline = function_hashes(SUITE)
+    assert impacted_tests(baseline, SUITE) == []
+    changed = SUITE.replace('{"name": "x"}', '{"name": "y"}')
+    assert impacted_tests(baseline, changed) == ["test_create"]
+
+RERUN_SUITE = '''import pytest
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+def test_param(n):
+    assert n != 2
+
+@pytest.mark.parametrize("n", [1, 2])
+def test_whole(n):
+    assert n == 1
+
+def test_untouched():
+    assert True
+'''
+
+def test_partial_reruns_merge_into_the_baseline(monkeypatch):
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write(RERUN_SUITE)
+        executor = Executor(global_timeout=30, record_http=False)
+
+        baseline = executor.run_test_suite(suite, "ns")
+        assert baseline["summary"]["failed"] == 2 and baseline["summary"]["total"] == 6
+
+        # Failed-only: just the failing parametrized cases run; their siblings are carried over
+        with open(suite, "w") as f:
+            f.write(RERUN_SUITE.replace("assert n != 2", "assert n != 5"))
+        failed = executor.run_test_suite(suite, "ns", mode="failed", baseline=baseline)
+        assert sorted(failed["selected"]) == ["test_param[2]", "test_whole[2]"]
+        assert failed["cases"] == {"test_param[1]": "passed", "test_param[2]": "passed", "test_param[3]": "passed",
+                                   "test_whole[1]": "passed", "test_whole[2]": "failed", "test_untouched": "passed"}
+        assert [f["case"] for f in failed["failures"]] == ["test_whole[2]"]
+        assert failed["baseline_run_id"] == baseline["run_id"]
+
+        # Impacted: an edited function reruns whole and replaces all its baseline cases,
+        # so a parameter that no longer exists drops out of the report
+        with open(suite, "w") as f:
+            f.write(RERUN_SUITE.replace("assert n != 2", "assert n != 5").replace("[1, 2])\ndef test_whole", "[1])\ndef test_whole"))
+        impacted = executor.run_test_suite(suite, "ns", mode="impacted", baseline=failed)
+        assert impacted["selected"] == ["test_whole"]
+        assert impacted["status"] == "success" and impacted["failures"] == []
+        assert sorted(impacted["cases"]) == ["test_param[1]", "test_param[2]", "test_param[3]", "test_untouched", "test_whole[1]"]
+        assert impacted["summary"]["total"] == 5 and impacted["rerun_summary"]["total"] == 1
+    finally:
+        shutil.rmtree(root)
+
+def test_failed_rerun_after_a_collection_error_runs_the_whole_suite(monkeypatch):
+    root = tempfile.mkdtemp()
+    try:
+        monkeypatch.chdir(root)
+        suite = os.path.join(root, "test_suite.py")
+        with open(suite, "w") as f:
+            f.write("import module_that_does_not_exist\n\n" + RERUN_SUITE)
+        executor = Executor(global_timeout=30, record_http=False)
+
+        broken = executor.run_test_suite(suite, "ns")
+        assert broken["summary"]["error"] == 1 and broken["cases"] == {"test_suite": "error"}
+
+        with open(suite, "w") as f:
+            f.write(RERUN_SUITE.replace("assert n != 2", "assert n != 5").replace("assert n == 1", "assert n"))
+        fixed = executor.run_test_suite(suite, "ns", mode="failed", baseline=broken)
+        assert fixed["mode"] == "full" and "selected" not in fixed
+        assert fixed["status"] == "success" and fixed["summary"]["total"] == 6
+    finally:
+        shutil.rmtree(root)